@@ -0,0 +1,308 @@
+import logging
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from functools import wraps
+
+from flask import Flask, g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from mysql.connector import Error
+
+import db
+import query_cache
+import repository
+import services
+
+# JSON API over services for kiosks and other clients. Requests carry a
+# signed bearer token instead of a session, and each request first rereads
+# the query cache's shared table versions, so a write committed by any
+# process (another API worker, worker.py, the app) is seen by the next
+# request wherever it lands. Run several workers behind a load balancer:
+#
+#   gunicorn -w 4 -b 0.0.0.0:8000 api:app
+#
+# Background jobs are not run here; start worker.py alongside. The
+# in-process routing table only serves those jobs and resyncs on its own.
+
+# Every API process must share the secret, or tokens only work on the
+# process that issued them
+SECRET = os.environ.get('SBMS_API_SECRET')
+if not SECRET:
+    raise RuntimeError('SBMS_API_SECRET must be set to run the API')
+TOKEN_TTL = int(os.environ.get('SBMS_API_TOKEN_TTL', str(12 * 3600)))
+MAX_PAGE_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('SBMS_API_MAX_UPLOAD_MB', '16')) * 1024 * 1024
+
+
+def _serializer():
+    return URLSafeTimedSerializer(SECRET, salt='sbms-api-token')
+
+
+# The token only names the user; role and department are read on each
+# request, so a changed role applies at once
+def issue_token(user):
+    return _serializer().dumps({'uid': user['id']})
+
+
+class Unauthorized(services.ServiceError):
+    status = 401
+
+
+USER_SQL = "SELECT id, username, role, department, points FROM users WHERE id = %s"
+
+
+def _token_user():
+    header = request.headers.get('Authorization', '')
+    scheme, _, token = header.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        raise Unauthorized('missing bearer token')
+    try:
+        claims = _serializer().loads(token, max_age=TOKEN_TTL)
+    except SignatureExpired:
+        raise Unauthorized('token expired') from None
+    except BadSignature:
+        raise Unauthorized('invalid token') from None
+    with repository.UnitOfWork('api_user', transaction=False) as uow:
+        user = uow.fetchone(USER_SQL, (claims['uid'],))
+    if user is None:
+        raise Unauthorized('unknown user')
+    return user
+
+
+def authenticated(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.user = _token_user()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Dates and decimals as JSON-friendly values
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, list):
+        return [_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _value(item) for key, item in value.items()}
+    return value
+
+
+# Keyset cursors travel as "<created_at iso>_<id>"
+def _encode_cursor(cursor):
+    if cursor is None:
+        return None
+    created_at, row_id = cursor
+    return f'{created_at.isoformat()}_{row_id}'
+
+
+def _decode_cursor(value):
+    if not value:
+        return None
+    created_at, _, row_id = value.rpartition('_')
+    try:
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise services.ServiceError('invalid cursor') from None
+
+
+def _page(rows, next_cursor):
+    return jsonify(items=_value(rows), next=_encode_cursor(next_cursor))
+
+
+def _page_size():
+    try:
+        return min(max(int(request.args.get('limit', repository.PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise services.ServiceError('limit must be a number') from None
+
+
+def _flag(name):
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+# Fields from a JSON body or, for uploads, a multipart form; returns the
+# fields and the (file, filename) of an optional "image" part
+def _body():
+    if request.files or request.form:
+        image = request.files.get('image')
+        return request.form.to_dict(), (image.stream, image.filename) if image else (None, None)
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise services.ServiceError('expected a JSON object')
+    return body, (None, None)
+
+
+def _optional_int(value, field):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise services.ServiceError(f'{field} must be a number') from None
+
+
+@app.before_request
+def sync_cache():
+    query_cache.sync()
+
+
+@app.errorhandler(services.ServiceError)
+def service_error(e):
+    return jsonify(error=str(e)), e.status
+
+
+@app.errorhandler(Error)
+def database_error(e):
+    if isinstance(e, db.PoolTimeout):
+        return jsonify(error='database busy, retry shortly'), 503
+    logger.exception('database error')
+    return jsonify(error='database error'), 500
+
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify(status='ok')
+
+
+@app.route('/api/login', methods=['POST'])
+def login():
+    body, _ = _body()
+    user = services.login(body.get('username'), body.get('password'))
+    if user is None:
+        raise Unauthorized('invalid username or password')
+    return jsonify(token=issue_token(user), expires_in=TOKEN_TTL, user=services.public_user(user))
+
+
+@app.route('/api/me', methods=['GET'])
+@authenticated
+def me():
+    return jsonify(user=_value(services.public_user(g.user)))
+
+
+@app.route('/api/complaints', methods=['GET'])
+@authenticated
+def list_complaints():
+    rows, next_cursor = services.list_complaints(
+        g.user, _decode_cursor(request.args.get('after')), request.args.getlist('status') or None,
+        _flag('archived'), _page_size(),
+    )
+    return _page(rows, next_cursor)
+
+
+@app.route('/api/complaints', methods=['POST'])
+@authenticated
+def submit_complaint():
+    body, (image, filename) = _body()
+    complaint_id = services.submit_complaint(
+        g.user, body.get('title'), body.get('description'), body.get('category'), body.get('priority'),
+        image, filename,
+    )
+    return jsonify(id=complaint_id), 201
+
+
+@app.route('/api/complaints/<int:complaint_id>', methods=['GET'])
+@authenticated
+def get_complaint(complaint_id):
+    return jsonify(_value(services.get_complaint(g.user, complaint_id)))
+
+
+@app.route('/api/complaints/<int:complaint_id>', methods=['PATCH'])
+@authenticated
+def update_complaint(complaint_id):
+    body, _ = _body()
+    awarded = services.update_complaint(
+        g.user, complaint_id, body.get('status'), body.get('notes'),
+        _optional_int(body.get('assigned_to'), 'assigned_to'),
+    )
+    return jsonify(id=complaint_id, status=body['status'], points_awarded=awarded)
+
+
+# {"updates": [{"id": 1, "status": "In Progress", "assigned_to": 4, "notes": "..."}, ...]}
+@app.route('/api/complaints/bulk', methods=['POST'])
+@authenticated
+def bulk_update_complaints():
+    body, _ = _body()
+    updates = body.get('updates')
+    if not isinstance(updates, list) or not all(isinstance(update, dict) for update in updates):
+        raise services.ServiceError('updates must be a list of objects')
+    updated, awarded = services.bulk_update_complaints(g.user, [
+        (_optional_int(update.get('id'), 'id'), update.get('status'),
+         _optional_int(update.get('assigned_to'), 'assigned_to'), update.get('notes'))
+        for update in updates
+    ])
+    return jsonify(updated=updated, points_awarded=awarded)
+
+
+@app.route('/api/lost-items', methods=['GET'])
+@authenticated
+def list_lost_items():
+    rows, next_cursor = services.list_lost_items(
+        g.user, _decode_cursor(request.args.get('after')), _flag('archived'), _page_size(),
+    )
+    return _page(rows, next_cursor)
+
+
+@app.route('/api/lost-items', methods=['POST'])
+@authenticated
+def submit_lost_item():
+    body, (image, filename) = _body()
+    item_id = services.submit_lost_item(
+        g.user, body.get('item_name'), body.get('description'), body.get('lost_time'), body.get('lost_place'),
+        image, filename,
+    )
+    return jsonify(id=item_id), 201
+
+
+@app.route('/api/lost-items/<int:item_id>', methods=['PATCH'])
+@authenticated
+def update_lost_item(item_id):
+    body, _ = _body()
+    services.update_lost_item(g.user, item_id, body.get('status'), body.get('notes'))
+    return jsonify(id=item_id, status=body['status'])
+
+
+@app.route('/api/found-items', methods=['GET'])
+@authenticated
+def list_found_items():
+    rows, next_cursor = services.list_found_items(g.user, _decode_cursor(request.args.get('after')), _page_size())
+    return _page(rows, next_cursor)
+
+
+@app.route('/api/found-items', methods=['POST'])
+@authenticated
+def submit_found_item():
+    body, (image, filename) = _body()
+    found_id = services.submit_found_item(
+        g.user, body.get('item_name'), body.get('description'), body.get('found_time'), body.get('found_place'),
+        image, filename,
+    )
+    return jsonify(id=found_id), 201
+
+
+@app.route('/api/found-items/<int:found_id>/match', methods=['POST'])
+@authenticated
+def confirm_match(found_id):
+    body, _ = _body()
+    lost_id = _optional_int(body.get('lost_id'), 'lost_id')
+    if lost_id is None:
+        raise services.ServiceError('lost_id is required')
+    if not services.confirm_match(g.user, lost_id, found_id):
+        return jsonify(error='one of the items has already been matched'), 409
+    return jsonify(lost_id=lost_id, found_id=found_id)
+
+
+@app.route('/api/leaderboard', methods=['GET'])
+@authenticated
+def get_leaderboard():
+    return jsonify(items=_value(services.get_leaderboard(request.args.get('period', 'all'))))
+
+
+if __name__ == '__main__':
+    app.run(port=int(os.environ.get('SBMS_API_PORT', '8000')))
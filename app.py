@@ -3,33 +3,36 @@ import mysql.connector
 from mysql.connector import Error
 from datetime import datetime
 import os
-from PIL import Image
 import io
+import tempfile
+
+import changes
+import db
+import export
+import importer
+import jobs
+import leaderboard
+import metrics
+import migrations
+import query_cache
+import renditions
+import repository
+import routing
+import services
+import sla
+import storage
 
 # Create uploads directory if it doesn't exist
-if not os.path.exists('uploads'):
-    os.makedirs('uploads')
-
-# Initialize connection
-def init_connection():
-    return mysql.connector.connect(
-        host='localhost',
-        user='root',
-        password='root',
-        database='sbms',
-        pool_name='mypool',
-        pool_size=5,
-        connect_timeout=30,
-        autocommit=True
-    )
+if not os.path.exists(storage.UPLOAD_DIR):
+    os.makedirs(storage.UPLOAD_DIR)
 
-# Get connection from pool
+# Get connection from the shared process-wide pool
 def get_connection():
     try:
-        return mysql.connector.connect(
-            pool_name='mypool',
-            pool_size=5
-        )
+        return db.get_pool().get_connection()
+    except db.PoolTimeout as err:
+        st.error(f"Database is busy, please try again ({err.msg})")
+        return None
     except mysql.connector.Error as err:
         if err.errno == mysql.connector.errorcode.ER_ACCESS_DENIED_ERROR:
             st.error("Something is wrong with your user name or password")
@@ -39,69 +42,19 @@ def get_connection():
             st.error(err)
         return None
 
+# Bring the schema up to date without touching existing data
 def init_db():
-    conn = init_connection()
+    conn = get_connection()
+    if not conn:
+        return
     try:
         cursor = conn.cursor()
         
-        # Drop existing tables if they exist
-        cursor.execute("DROP TABLE IF EXISTS lost_items")
-        cursor.execute("DROP TABLE IF EXISTS complaints")
-        cursor.execute("DROP TABLE IF EXISTS users")
-        st.success("✅ Old tables dropped successfully!")
-        
-        # Create users table with points
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(80) UNIQUE NOT NULL,
-                password VARCHAR(120) NOT NULL,
-                role VARCHAR(20) NOT NULL,
-                department VARCHAR(50),
-                points INT DEFAULT 0
-            )
-        """)
-        st.success("✅ Users table created successfully!")
-        
-        # Create complaints table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS complaints (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                title VARCHAR(100) NOT NULL,
-                description TEXT NOT NULL,
-                category VARCHAR(50) NOT NULL,
-                priority VARCHAR(20) NOT NULL,
-                status VARCHAR(20) DEFAULT 'Pending Admin Review',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                user_id INT NOT NULL,
-                assigned_to INT,
-                admin_notes TEXT,
-                officer_notes TEXT,
-                image_path VARCHAR(255),
-                points_awarded BOOLEAN DEFAULT FALSE,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                FOREIGN KEY (assigned_to) REFERENCES users(id)
-            )
-        """)
-        st.success("✅ Complaints table created successfully!")
-        
-        # Create lost items table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS lost_items (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                item_name VARCHAR(100) NOT NULL,
-                description TEXT NOT NULL,
-                lost_time DATETIME NOT NULL,
-                lost_place VARCHAR(100) NOT NULL,
-                status VARCHAR(20) DEFAULT 'Lost',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                user_id INT NOT NULL,
-                admin_notes TEXT,
-                image_path VARCHAR(255),
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        """)
-        st.success("✅ Lost items table created successfully!")
+        applied = migrations.migrate(conn)
+        if applied:
+            st.success(f"✅ Applied migrations: {', '.join(map(str, applied))}")
+        else:
+            st.success("✅ Schema is up to date!")
         
         # Insert default users if they don't exist
         default_users = [
@@ -121,6 +74,9 @@ def init_db():
             """, (username, password, role, department, points))
         
         conn.commit()
+        leaderboard.get_board().invalidate()
+        routing.get_table().invalidate()
+        query_cache.bump('users', 'complaints', 'lost_items', 'found_items', 'item_matches')
         st.success("✅ Default users created successfully!")
         st.success("🎉 Database initialized successfully!")
     except Error as e:
@@ -129,302 +85,768 @@ def init_db():
         cursor.close()
         conn.close()
 
-def award_points(user_id, points):
-    conn = get_connection()
-    if not conn:
-        return
+# Served from the in-process leaderboard kept current by the points ledger
+def get_leaderboard():
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE users 
-            SET points = points + %s
-            WHERE id = %s
-        """, (points, user_id))
+        return leaderboard.get_board().top()
     except Error as e:
-        st.error(f'Error awarding points: {e}')
-        conn.rollback()
-    finally:
-        cursor.close()
-        conn.close()
+        st.error(f'Error getting leaderboard: {e}')
+        return []
 
-def get_leaderboard():
-    conn = get_connection()
-    if not conn:
+# 'month' and 'semester' boards come from the points ledger rollups
+def get_period_leaderboard(period):
+    try:
+        return repository.get_period_leaderboard(period)
+    except Error as e:
+        st.error(f'Error: {e}')
         return []
+
+# SLA reports are read from the rollup tables maintained by the sla module
+def get_sla_summary(days, group, **filters):
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT username, points, role
-            FROM users
-            WHERE role = 'student'
-            ORDER BY points DESC
-            LIMIT 10
-        """)
-        leaderboard = cursor.fetchall()
-        return leaderboard if leaderboard else []
+        return repository.get_sla_summary(days, group, **filters)
     except Error as e:
-        st.error(f'Error getting leaderboard: {e}')
+        st.error(f'Error: {e}')
+        return {}
+
+def get_sla_trend(**kwargs):
+    try:
+        return repository.get_sla_trend(**kwargs)
+    except Error as e:
+        st.error(f'Error: {e}')
         return []
-    finally:
-        cursor.close()
-        conn.close()
 
+# Writes and logins go through services, shared with the JSON API; these
+# wrappers only report the outcome
 def login(username, password):
-    conn = init_connection()
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users WHERE username = %s AND password = %s", (username, password))
-        user = cursor.fetchone()
-        if user:
-            st.success("✅ Login successful!")
-        return user
+        user = services.login(username, password)
     except Error as e:
         st.error(f'Error: {e}')
         return None
-    finally:
-        cursor.close()
-        conn.close()
+    if user:
+        st.success("✅ Login successful!")
+    return user
 
-def get_user_complaints(user_id, role):
-    conn = init_connection()
+# Listing reads are served through the query cache in repository
+def get_user_complaints(user_id, role, page_size=repository.PAGE_SIZE, after=None, statuses=None,
+                        include_archived=False):
     try:
-        cursor = conn.cursor(dictionary=True)
-        if role == 'admin':
-            cursor.execute("""
-                SELECT c.*, u1.username as reporter, u2.username as assigned_to_name
-                FROM complaints c
-                LEFT JOIN users u1 ON c.user_id = u1.id
-                LEFT JOIN users u2 ON c.assigned_to = u2.id
-                ORDER BY c.created_at DESC
-            """)
-        elif role == 'officer':
-            cursor.execute("""
-                SELECT c.*, u1.username as reporter, u2.username as assigned_to_name
-                FROM complaints c
-                LEFT JOIN users u1 ON c.user_id = u1.id
-                LEFT JOIN users u2 ON c.assigned_to = u2.id
-                WHERE c.assigned_to = %s
-                ORDER BY c.created_at DESC
-            """, (user_id,))
-        else:  # student
-            cursor.execute("""
-                SELECT c.*, u1.username as reporter, u2.username as assigned_to_name
-                FROM complaints c
-                LEFT JOIN users u1 ON c.user_id = u1.id
-                LEFT JOIN users u2 ON c.assigned_to = u2.id
-                WHERE c.user_id = %s
-                ORDER BY c.created_at DESC
-            """, (user_id,))
-        return cursor.fetchall()
+        return repository.get_user_complaints(user_id, role, page_size, after, statuses, include_archived)
+    except Error as e:
+        st.error(f'Error: {e}')
+        return [], None
+
+def count_complaints_by_status(user_id, role):
+    try:
+        return repository.count_complaints_by_status(user_id, role)
+    except Error as e:
+        st.error(f'Error: {e}')
+        return {}
+
+def search_complaints(user_id, role, text, **filters):
+    try:
+        return repository.search_complaints(user_id, role, text, **filters)
     except Error as e:
         st.error(f'Error: {e}')
         return []
-    finally:
-        cursor.close()
-        conn.close()
 
-def get_officers():
-    conn = init_connection()
+def search_lost_items(user_id, role, text, **filters):
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id, username, department FROM users WHERE role = 'officer'")
-        return cursor.fetchall()
+        return repository.search_lost_items(user_id, role, text, **filters)
     except Error as e:
         st.error(f'Error: {e}')
         return []
-    finally:
-        cursor.close()
-        conn.close()
 
-def get_officer_by_department(department):
-    conn = init_connection()
+def get_complaint_details(complaint_id, archived=False):
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT id FROM users WHERE role = 'officer' AND department = %s", (department,))
-        officer = cursor.fetchone()
-        return officer['id'] if officer else None
+        return repository.get_complaint_details(complaint_id, archived)
     except Error as e:
         st.error(f'Error: {e}')
         return None
-    finally:
-        cursor.close()
-        conn.close()
 
-def save_uploaded_file(uploaded_file):
+def get_officers():
     try:
-        # Create a unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_extension = os.path.splitext(uploaded_file.name)[1]
-        filename = f"{timestamp}{file_extension}"
-        file_path = os.path.join('uploads', filename)
-        
-        # Save the file
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        return file_path
-    except Exception as e:
-        st.error(f"Error saving file: {e}")
-        return None
+        return repository.get_officers()
+    except Error as e:
+        st.error(f'Error: {e}')
+        return []
 
-def submit_new_complaint(title, description, category, priority, user_id, image_file=None):
-    conn = get_connection()
-    if not conn:
+# Only the raw bytes of an upload are written on submit; a background job
+# normalizes, deduplicates and builds the renditions
+def upload_args(image_file):
+    return (image_file, image_file.name) if image_file is not None else (None, None)
+
+def submit_new_complaint(user, title, description, category, priority, image_file=None):
+    try:
+        services.submit_complaint(user, title, description, category, priority, *upload_args(image_file))
+    except (services.ServiceError, Error, OSError) as e:
+        st.error(f'Error: {e}')
         return
+    
+    if image_file is not None:
+        st.success("✅ Image uploaded successfully!")
+    st.success("✅ Complaint submitted successfully!")
+    st.success("🎉 You earn 1 point for every issue you are first to report!")
+    st.success("📝 Your complaint will be reviewed by the admin and automatically assigned to the appropriate department. "
+               "If the issue has already been reported, it is linked to the existing ticket and earns no point.")
+
+def update_complaint_status(user, complaint_id, status, notes=None, assigned_to=None):
     try:
-        cursor = conn.cursor()
-        
-        # Map category to department
-        category_to_department = {
-            'Electrical Issues': 'Electrical',
-            'Water & Sanitation': 'Plumbing',
-            'Faulty Infrastructure': 'Maintenance',
-            'Internet & Network': 'IT',
-            'Security Concerns': 'Security'
-        }
-        
-        department = category_to_department.get(category)
-        assigned_to = get_officer_by_department(department) if department else None
-        
-        # Save image if provided
-        image_path = None
-        if image_file is not None:
-            image_path = save_uploaded_file(image_file)
-            st.success("✅ Image uploaded successfully!")
-        
-        cursor.execute("""
-            INSERT INTO complaints (title, description, category, priority, user_id, status, assigned_to, image_path)
-            VALUES (%s, %s, %s, %s, %s, 'Pending Admin Review', %s, %s)
-        """, (title, description, category, priority, user_id, assigned_to, image_path))
-        
-        # Award 1 point for submitting a complaint
-        award_points(user_id, 1)
-        
-        if assigned_to:
-            st.success("✅ Complaint submitted successfully!")
-            st.success("🎉 You earned 1 point for submitting the complaint!")
-            st.success("📝 Your complaint will be reviewed by the admin and automatically assigned to the appropriate department.")
-        else:
-            st.success("✅ Complaint submitted successfully!")
-            st.success("🎉 You earned 1 point for submitting the complaint!")
-            st.success("📝 Your complaint will be reviewed by the admin.")
+        awarded = services.update_complaint(user, complaint_id, status, notes, assigned_to)
+    except (services.ServiceError, Error) as e:
+        st.error(f'Error: {e}')
+        return
+    
+    if awarded:
+        st.success("✅ Complaint marked as resolved!")
+        st.success("🎉 Student awarded 3 points for resolution!")
+    else:
+        st.success(f"✅ Status updated to {status}!")
+
+def bulk_update_complaints(user, updates):
+    try:
+        updated, awarded = services.bulk_update_complaints(user, updates)
+    except (services.ServiceError, Error) as e:
+        st.error(f'Error: {e}')
+        return False
+    
+    st.success(f"✅ Updated {updated} complaints!")
+    if awarded:
+        st.success(f"🎉 Students awarded points for {awarded} resolved complaints!")
+    return True
+
+def submit_lost_item(user, item_name, description, lost_time, lost_place, image_file=None):
+    try:
+        services.submit_lost_item(user, item_name, description, lost_time, lost_place, *upload_args(image_file))
+    except (services.ServiceError, Error, OSError) as e:
+        st.error(f'Error: {e}')
+        return
+    
+    if image_file is not None:
+        st.success("✅ Image uploaded successfully!")
+    st.success("✅ Lost item reported successfully!")
+    st.success("📝 The admin will review your report.")
+
+def get_lost_items(user_id, role, page_size=repository.PAGE_SIZE, after=None, include_archived=False):
+    try:
+        return repository.get_lost_items(user_id, role, page_size, after, include_archived)
     except Error as e:
         st.error(f'Error: {e}')
-        conn.rollback()
-    finally:
-        cursor.close()
-        conn.close()
+        return [], None
 
-def update_complaint_status(complaint_id, status, notes=None, assigned_to=None, is_admin=False):
-    conn = init_connection()
+def get_lost_item_details(item_id, archived=False):
     try:
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get the current complaint status and user_id
-        cursor.execute("SELECT status, user_id, points_awarded FROM complaints WHERE id = %s", (complaint_id,))
-        complaint = cursor.fetchone()
-        
-        if complaint:
-            # If status is changing to Resolved and points haven't been awarded yet
-            if status == 'Resolved' and not complaint['points_awarded']:
-                # Award 3 points for resolution
-                award_points(complaint['user_id'], 3)
-                cursor.execute("""
-                    UPDATE complaints 
-                    SET status = %s, assigned_to = %s, admin_notes = %s, points_awarded = TRUE
-                    WHERE id = %s
-                """, (status, assigned_to, notes, complaint_id))
-                st.success("✅ Complaint marked as resolved!")
-                st.success("🎉 Student awarded 3 points for resolution!")
-            else:
-                cursor.execute("""
-                    UPDATE complaints 
-                    SET status = %s, assigned_to = %s, admin_notes = %s
-                    WHERE id = %s
-                """, (status, assigned_to, notes, complaint_id))
-                st.success(f"✅ Status updated to {status}!")
-        
-        conn.commit()
+        return repository.get_lost_item_details(item_id, archived)
     except Error as e:
         st.error(f'Error: {e}')
-    finally:
-        cursor.close()
-        conn.close()
+        return None
 
-def submit_lost_item(item_name, description, lost_time, lost_place, user_id, image_file=None):
-    conn = init_connection()
+def update_lost_item_status(user, item_id, status, notes=None):
     try:
-        cursor = conn.cursor()
-        
-        # Save image if provided
-        image_path = None
-        if image_file is not None:
-            image_path = save_uploaded_file(image_file)
-            st.success("✅ Image uploaded successfully!")
-        
-        cursor.execute("""
-            INSERT INTO lost_items (item_name, description, lost_time, lost_place, user_id, image_path)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (item_name, description, lost_time, lost_place, user_id, image_path))
-        
-        conn.commit()
-        st.success("✅ Lost item reported successfully!")
-        st.success("📝 The admin will review your report.")
+        services.update_lost_item(user, item_id, status, notes)
+    except (services.ServiceError, Error) as e:
+        st.error(f'Error: {e}')
+        return
+    
+    st.success(f"✅ Item status updated to {status}!")
+    if notes:
+        st.success("📝 Notes added successfully!")
+
+def submit_found_item(user, item_name, description, found_time, found_place, image_file=None):
+    try:
+        services.submit_found_item(user, item_name, description, found_time, found_place, *upload_args(image_file))
+    except (services.ServiceError, Error, OSError) as e:
+        st.error(f'Error: {e}')
+        return
+    
+    st.success("✅ Found item logged!")
+    st.success("🔎 Possible owners will appear under Found Items in a moment.")
+
+def get_found_items(after=None):
+    try:
+        return repository.get_found_items(after=after)
     except Error as e:
         st.error(f'Error: {e}')
-    finally:
-        cursor.close()
-        conn.close()
+        return [], None
 
-def get_lost_items(user_id, role):
-    conn = init_connection()
+def get_item_matches(found_ids):
     try:
-        cursor = conn.cursor(dictionary=True)
-        if role == 'admin':
-            cursor.execute("""
-                SELECT l.*, u.username as reporter
-                FROM lost_items l
-                LEFT JOIN users u ON l.user_id = u.id
-                ORDER BY l.created_at DESC
-            """)
-        else:  # student
-            cursor.execute("""
-                SELECT l.*, u.username as reporter
-                FROM lost_items l
-                LEFT JOIN users u ON l.user_id = u.id
-                WHERE l.user_id = %s
-                ORDER BY l.created_at DESC
-            """, (user_id,))
-        return cursor.fetchall()
+        return repository.get_item_matches(tuple(found_ids))
     except Error as e:
         st.error(f'Error: {e}')
-        return []
-    finally:
-        cursor.close()
-        conn.close()
+        return {}
 
-def update_lost_item_status(item_id, status, notes=None):
-    conn = init_connection()
+def confirm_match(user, lost_id, found_id):
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE lost_items 
-            SET status = %s, admin_notes = %s
-            WHERE id = %s
-        """, (status, notes, item_id))
-        conn.commit()
-        st.success(f"✅ Item status updated to {status}!")
-        if notes:
-            st.success("📝 Notes added successfully!")
+        confirmed = services.confirm_match(user, lost_id, found_id)
+    except (services.ServiceError, Error) as e:
+        st.error(f'Error: {e}')
+        return False
+    
+    if confirmed:
+        st.success("✅ Match confirmed, lost item marked as Found!")
+    else:
+        st.error('One of the items has already been matched')
+    return confirmed
+
+# Keyset paging state: a stack of cursors per list so "Newer" can step back
+def current_page(key):
+    return st.session_state.setdefault(f'{key}_pages', [None])[-1]
+
+def render_pager(key, next_cursor, scope='app'):
+    pages = st.session_state.setdefault(f'{key}_pages', [None])
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(pages) > 1 and st.button('← Newer', key=f'{key}_newer'):
+            pages.pop()
+            st.rerun(scope=scope)
+    with col2:
+        if next_cursor and st.button('Older →', key=f'{key}_older'):
+            pages.append(next_cursor)
+            st.rerun(scope=scope)
+
+# Cards show the cached thumbnail; the larger rendition loads only on demand
+def show_image(image_path, caption, key):
+    if not image_path or not os.path.exists(image_path):
+        return
+    try:
+        with metrics.render_timer():
+            st.image(renditions.get_rendition(image_path, 'thumb'), caption=caption)
+        if st.toggle('View full size', key=key):
+            with metrics.render_timer():
+                st.image(renditions.get_rendition(image_path, 'detail'), use_container_width=True)
+    except Exception as e:
+        st.error(f"Error displaying image: {e}")
+
+def show_complaint_details(complaint, key_prefix, notes=True):
+    if st.toggle('Show details', key=f'{key_prefix}_details_{complaint["id"]}'):
+        details = get_complaint_details(complaint['id'], bool(complaint.get('archived')))
+        if details:
+            st.write(details['description'])
+            if notes and details['admin_notes']:
+                st.write(f"**Admin Notes:** {details['admin_notes']}")
+            if notes and details['officer_notes']:
+                st.write(f"**Officer Notes:** {details['officer_notes']}")
+
+STATUSES = services.STATUSES
+LOST_ITEM_STATUSES = services.LOST_ITEM_STATUSES
+CATEGORIES = services.CATEGORIES
+PRIORITIES = services.PRIORITIES
+ANY = 'Any'
+
+def date_range(dates):
+    dates = list(dates) + [None, None]
+    return dates[0], dates[1]
+
+# Ranked full-text search; the form keeps typing from rerunning anything
+@st.fragment
+def complaint_search(user):
+    with st.form('complaint_search_form'):
+        text = st.text_input('Search complaints', placeholder='e.g. projector, Block C washroom')
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            category = st.selectbox('Category', [ANY] + CATEGORIES, key='search_category')
+        with col2:
+            status = st.selectbox('Status', [ANY] + STATUSES, key='search_status')
+        with col3:
+            priority = st.selectbox('Priority', [ANY] + PRIORITIES, key='search_priority')
+        dates = st.date_input('Created between', value=(), key='search_dates')
+        st.form_submit_button('Search')
+    if not text.strip():
+        return
+    date_from, date_to = date_range(dates)
+    results = search_complaints(
+        user['id'], user['role'], text.strip(),
+        category=None if category == ANY else category,
+        status=None if status == ANY else status,
+        priority=None if priority == ANY else priority,
+        date_from=date_from, date_to=date_to,
+    )
+    if not results:
+        st.info('No matching complaints')
+        return
+    for complaint in results:
+        st.markdown(
+            f"**{complaint['title']}** · {complaint['category']} · {complaint['priority']} · "
+            f"{complaint['status']} · {complaint['created_at']}"
+        )
+        show_complaint_details(complaint, 'search')
+
+@st.fragment
+def lost_item_search(user):
+    with st.form('lost_item_search_form'):
+        text = st.text_input('Search lost items', placeholder='e.g. black wallet, library')
+        col1, col2 = st.columns(2)
+        with col1:
+            status = st.selectbox('Status', [ANY] + LOST_ITEM_STATUSES, key='lost_search_status')
+        with col2:
+            dates = st.date_input('Lost between', value=(), key='lost_search_dates')
+        st.form_submit_button('Search')
+    if not text.strip():
+        return
+    date_from, date_to = date_range(dates)
+    results = search_lost_items(
+        user['id'], user['role'], text.strip(),
+        status=None if status == ANY else status, date_from=date_from, date_to=date_to,
+    )
+    if not results:
+        st.info('No matching items')
+        return
+    for item in results:
+        st.markdown(f"**{item['item_name']}** · {item['status']} · {item['lost_place']} · {item['lost_time']}")
+        if st.toggle('Show details', key=f'lost_search_details_{item["id"]}'):
+            details = get_lost_item_details(item['id'])
+            if details:
+                st.write(details['description'])
+
+# Student complaint views and the statuses each one shows
+STUDENT_VIEWS = {
+    'All Complaints': None,
+    'Pending': ('Pending Admin Review',),
+    'In Progress': ('In Progress',),
+    'Resolved/Closed': ('Resolved', 'Closed'),
+}
+
+# Headers come from one GROUP BY count; only the selected view loads its rows
+def student_complaints(user):
+    counts = count_complaints_by_status(user['id'], user['role'])
+    labels = {
+        f"{view} ({sum(counts.get(s, 0) for s in statuses) if statuses else sum(counts.values())})": view
+        for view, statuses in STUDENT_VIEWS.items()
+    }
+    view = labels[st.radio('Show', list(labels), horizontal=True, label_visibility='collapsed', key='complaint_view')]
+    # Counts cover live complaints only; old finished ones are archived
+    include_archived = st.toggle('Include archived', key='complaints_include_archived')
+    page_key = f"complaints_{view}{'_archived' if include_archived else ''}"
+    complaints, next_cursor = get_user_complaints(
+        user['id'], user['role'], after=current_page(page_key), statuses=STUDENT_VIEWS[view],
+        include_archived=include_archived,
+    )
+    if not complaints:
+        st.info('No complaints found')
+        return
+    for complaint in complaints:
+        with st.container():
+            st.markdown(f"### {complaint['title']}")
+            col1, col2 = st.columns([2,1])
+            with col1:
+                show_image(complaint['image_path'], 'Complaint Image', f'student_image_{complaint["id"]}')
+                show_complaint_details(complaint, 'student')
+            with col2:
+                st.write(f"**Category:** {complaint['category']}")
+                st.write(f"**Priority:** {complaint['priority']}")
+                st.write(f"**Status:** {complaint['status']}")
+                if complaint['parent_id']:
+                    st.write(f"**Linked to:** ticket #{complaint['parent_id']}")
+                if complaint['assigned_to_name']:
+                    st.write(f"**Assigned to:** {complaint['assigned_to_name']}")
+                st.write(f"**Created:** {complaint['created_at']}")
+                if complaint.get('archived'):
+                    st.caption('Archived')
+            st.divider()
+    render_pager(page_key, next_cursor)
+
+
+LIVE_POLL_SECONDS = float(os.environ.get('SBMS_LIVE_POLL_SECONDS', '10'))
+# Reload the live page outright this often, whatever the change feed says
+LIVE_RELOAD_SECONDS = 600
+
+# The first page of the admin/officer list stays open for hours, so it is
+# kept in session state and patched from the change feed; a poll that
+# finds nothing new costs one index read.
+def live_complaints(user):
+    owner = (user['id'], user['role'])
+    live = st.session_state.get('live_complaints')
+    stale = (live is None or live['owner'] != owner
+             or (datetime.now() - live['loaded_at']).total_seconds() > LIVE_RELOAD_SECONDS)
+    try:
+        if not stale:
+            changed, removed, cursor = repository.get_complaint_changes(user['id'], user['role'], live['cursor'])
+            # None: too far behind to patch
+            stale = changed is None
+        if stale:
+            cursor = repository.get_change_cursor()
+            rows, next_cursor = repository.get_user_complaints.uncached(user['id'], user['role'])
+            live = {'owner': owner, 'loaded_at': datetime.now(), 'rows': rows, 'next_cursor': next_cursor}
+        elif changed or removed:
+            live['rows'], live['next_cursor'] = changes.patch(
+                live['rows'], live['next_cursor'], changed, removed, repository.PAGE_SIZE
+            )
+        live['cursor'] = cursor
+        st.session_state.live_complaints = live
     except Error as e:
         st.error(f'Error: {e}')
-    finally:
-        cursor.close()
-        conn.close()
+        if live is None or live['owner'] != owner:
+            return [], None
+    return live['rows'], live['next_cursor']
+
+# One page of the admin/officer complaint list. Paging reruns only this
+# fragment, and only the cards on the current page exist at all. The
+# fragment also reruns on a timer to pick up changes made elsewhere.
+@st.fragment(run_every=LIVE_POLL_SECONDS)
+def complaint_page(user):
+    # Archived complaints are read-only and not in the change feed, so the
+    # merged list is read page by page like later pages
+    include_archived = st.toggle('Include archived', key='manage_include_archived')
+    page_key = 'complaints_archived' if include_archived else 'complaints'
+    after = current_page(page_key)
+    if after is None and not include_archived:
+        complaints, next_cursor = live_complaints(user)
+    else:
+        complaints, next_cursor = get_user_complaints(user['id'], user['role'], after=after,
+                                                      include_archived=include_archived)
+    if not complaints:
+        st.info('No complaints found')
+        return
+    for complaint in complaints:
+        # Fresh rows replace what cards kept from their own updates
+        st.session_state.pop(f'complaint_row_{complaint["id"]}', None)
+        complaint_card(complaint, user)
+    render_pager(page_key, next_cursor, scope='fragment')
+
+# A single card; its widgets rerun this card alone
+@st.fragment
+def complaint_card(complaint, user):
+    complaint = st.session_state.get(f'complaint_row_{complaint["id"]}', complaint)
+    with st.container():
+        col1, col2, col3 = st.columns([2,1,1])
+        with col1:
+            st.subheader(complaint['title'])
+            st.write(f"Reported by: {complaint['reporter']}")
+            
+            show_image(complaint['image_path'], 'Complaint Image', f'manage_image_{complaint["id"]}')
+            
+            show_complaint_details(complaint, 'manage')
+        with col2:
+            st.write(f"Category: {complaint['category']}")
+            st.write(f"Priority: {complaint['priority']}")
+            if complaint['assigned_to_name']:
+                st.write(f"Assigned to: {complaint['assigned_to_name']}")
+            if complaint.get('duplicate_count'):
+                st.write(f"🔗 {complaint['duplicate_count']} duplicate reports linked")
+        with col3:
+            if complaint.get('archived'):
+                # Archived complaints are read-only
+                st.write(f"Status: {complaint['status']}")
+                st.caption('Archived')
+            else:
+                status = st.selectbox(
+                    'Status',
+                    STATUSES,
+                    index=STATUSES.index(complaint['status']),
+                    key=f'status_{complaint["id"]}'
+                )
+                notes = st.text_area('Notes', key=f'notes_{complaint["id"]}')
+
+                if status != complaint['status'] or notes:
+                    if st.button('Update', key=f'update_{complaint["id"]}'):
+                        update_complaint_status(user, complaint['id'], status, notes)
+                        # Keep showing the row as written when the card reruns alone
+                        st.session_state[f'complaint_row_{complaint["id"]}'] = dict(complaint, status=status)
+                        st.rerun(scope='fragment')
+            st.write(f"Created: {complaint['created_at']}")
+        st.divider()
+
+TRIAGE_PAGE_SIZE = 100
+KEEP = '(keep current)'
+
+# Select many complaints and apply one status/assignee/notes change. The
+# table sits inside a form, so ticking rows costs no reruns at all.
+@st.fragment
+def bulk_triage(user):
+    complaints, next_cursor = get_user_complaints(user['id'], user['role'], TRIAGE_PAGE_SIZE, current_page('triage'))
+    if not complaints:
+        st.info('No complaints found')
+        return
+    officers = {f"{o['username']} ({o['department']})": o['id'] for o in get_officers()}
+    with st.form('triage_form'):
+        rows = st.data_editor(
+            [
+                {
+                    'Select': False,
+                    'ID': c['id'],
+                    'Title': c['title'],
+                    'Category': c['category'],
+                    'Priority': c['priority'],
+                    'Status': c['status'],
+                    'Assigned to': c['assigned_to_name'] or '',
+                }
+                for c in complaints
+            ],
+            column_config={'Select': st.column_config.CheckboxColumn(required=True)},
+            disabled=['ID', 'Title', 'Category', 'Priority', 'Status', 'Assigned to'],
+            hide_index=True,
+            use_container_width=True,
+            key=f"triage_table_{len(st.session_state.get('triage_pages', []))}",
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            status = st.selectbox('Set status', [KEEP] + STATUSES, key='triage_status')
+        with col2:
+            assignee = st.selectbox('Assign to', [KEEP] + list(officers), key='triage_assignee')
+        notes = st.text_area('Admin notes', key='triage_notes')
+        submitted = st.form_submit_button('Apply to selected')
+    
+    if submitted:
+        statuses = {c['id']: c['status'] for c in complaints}
+        selected = [row['ID'] for row in rows if row['Select']]
+        if not selected:
+            st.warning('Select at least one complaint')
+        elif bulk_update_complaints(user, [
+            (complaint_id, statuses[complaint_id] if status == KEEP else status,
+             None if assignee == KEEP else officers[assignee], notes)
+            for complaint_id in selected
+        ]):
+            st.rerun()
+    render_pager('triage', next_cursor, scope='fragment')
+
+@st.fragment
+def lost_item_page():
+    include_archived = st.toggle('Include archived', key='lost_items_include_archived')
+    page_key = 'lost_items_archived' if include_archived else 'lost_items'
+    lost_items, next_cursor = get_lost_items(None, 'admin', after=current_page(page_key),
+                                             include_archived=include_archived)
+    if not lost_items:
+        st.info('No lost items reported')
+        return
+    for item in lost_items:
+        st.session_state.pop(f'lost_item_row_{item["id"]}', None)
+        lost_item_card(item)
+    render_pager(page_key, next_cursor, scope='fragment')
+
+@st.fragment
+def lost_item_card(item):
+    item = st.session_state.get(f'lost_item_row_{item["id"]}', item)
+    with st.container():
+        st.markdown(f"### {item['item_name']}")
+        col1, col2 = st.columns([2,1])
+        with col1:
+            show_image(item['image_path'], 'Item Image', f'lost_manage_image_{item["id"]}')
+        with col2:
+            st.write(f"**Status:** {item['status']}")
+            if item.get('archived'):
+                st.caption('Archived')
+                if st.toggle('Show details', key=f'lost_archived_{item["id"]}'):
+                    details = get_lost_item_details(item['id'], True)
+                    if details:
+                        with col1:
+                            st.write(details['description'])
+            # Description and notes are only loaded once the item is opened
+            elif st.toggle('Manage', key=f'lost_manage_{item["id"]}'):
+                details = get_lost_item_details(item['id']) or {'description': '', 'admin_notes': None}
+                with col1:
+                    st.write(details['description'])
+                # Create a form for each item to handle status updates
+                with st.form(key=f'form_{item["id"]}'):
+                    status = st.selectbox(
+                        'Status',
+                        LOST_ITEM_STATUSES,
+                        index=LOST_ITEM_STATUSES.index(item['status']),
+                        key=f'lost_status_{item["id"]}'
+                    )
+                    notes = st.text_area('Notes', value=details['admin_notes'] if details['admin_notes'] else '', key=f'lost_notes_{item["id"]}')
+                    
+                    submit_button = st.form_submit_button('Update Status')
+                    if submit_button:
+                        update_lost_item_status(st.session_state.user, item['id'], status, notes)
+                        st.session_state[f'lost_item_row_{item["id"]}'] = dict(item, status=status)
+                        st.rerun(scope='fragment')
+            
+            st.write(f"**Reported by:** {item['reporter']}")
+            st.write(f"**Lost Time:** {item['lost_time']}")
+            st.write(f"**Lost Place:** {item['lost_place']}")
+            st.write(f"**Reported:** {item['created_at']}")
+        st.divider()
+
+# Unclaimed found items with their ranked candidate owners; candidates for
+# the whole page come from one query
+@st.fragment
+def found_item_page():
+    found_items, next_cursor = get_found_items(after=current_page('found_items'))
+    if not found_items:
+        st.info('No unclaimed found items')
+        return
+    matches = get_item_matches([item['id'] for item in found_items])
+    for item in found_items:
+        with st.container():
+            st.markdown(f"### {item['item_name']}")
+            col1, col2 = st.columns([2,1])
+            with col1:
+                show_image(item['image_path'], 'Found Item', f'found_image_{item["id"]}')
+                st.write(item['description'])
+            with col2:
+                st.write(f"**Found Time:** {item['found_time']}")
+                st.write(f"**Found Place:** {item['found_place']}")
+                st.write(f"**Logged by:** {item['logged_by']}")
+            candidates = matches.get(item['id'], [])
+            if candidates:
+                st.write('**Possible owners**')
+            for candidate in candidates:
+                col1, col2 = st.columns([3,1])
+                with col1:
+                    st.write(f"{candidate['item_name']} — {candidate['reporter']}, "
+                             f"lost {candidate['lost_time']} at {candidate['lost_place']} "
+                             f"(score {candidate['score']:.2f})")
+                with col2:
+                    if st.button('Confirm', key=f'confirm_match_{item["id"]}_{candidate["id"]}'):
+                        if confirm_match(st.session_state.user, candidate['id'], item['id']):
+                            st.rerun()
+            st.divider()
+    render_pager('found_items', next_cursor, scope='fragment')
+
+def format_duration(seconds):
+    if seconds is None:
+        return '—'
+    if seconds < 3600:
+        return f'{seconds / 60:.0f} min'
+    if seconds < 2 * 86400:
+        return f'{seconds / 3600:.1f} h'
+    return f'{seconds / 86400:.1f} d'
+
+def analytics_page():
+    st.header("📈 SLA Analytics")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        days = st.selectbox('Window', [7, 30, 90, 365], index=1, format_func=lambda d: f'Last {d} days', key='sla_days')
+    with col2:
+        group = st.selectbox('Group by', sla.DIMENSIONS, format_func=str.title, key='sla_group')
+    with col3:
+        department = st.selectbox('Department', [ANY] + sorted(set(routing.CATEGORY_TO_DEPARTMENT.values())),
+                                  key='sla_department')
+    filters = {'department': None if department == ANY else department}
+    summary = get_sla_summary(days, group, **filters)
+    if not summary:
+        st.info('No complaint activity in this window yet')
+        return
+    st.dataframe([
+        {
+            group.title(): name, 'Opened': figures['opened'], 'Resolved': figures['resolved'],
+            'Reopened': figures['reopened'], 'Open now': figures['backlog'],
+            'Avg to assign': format_duration(figures['avg_assign_seconds']),
+            'p90 to assign': format_duration(figures['p90_assign_seconds']),
+            'p50 to resolve': format_duration(figures['p50_resolve_seconds']),
+            'p90 to resolve': format_duration(figures['p90_resolve_seconds']),
+            'p99 to resolve': format_duration(figures['p99_resolve_seconds']),
+        }
+        for name, figures in sorted(summary.items())
+    ], use_container_width=True, hide_index=True)
+    st.caption('Durations run from submission; percentiles are accurate to about 12%. '
+               'Figures lag live changes by a minute or two.')
+    daily = get_sla_trend(days=days, **filters)
+    if daily:
+        st.subheader('Per day')
+        st.line_chart(daily, x='period', y=['opened', 'resolved', 'backlog'])
+    hourly = get_sla_trend(hours=48, **filters)
+    if hourly:
+        st.subheader('Last 48 hours')
+        st.bar_chart(hourly, x='period', y=['opened', 'resolved'])
+
+def background_jobs():
+    try:
+        st.json(jobs.stats())
+        for job in jobs.failed():
+            st.write(f"**#{job['id']} {job['kind']}** after {job['attempts']} attempts: {job['last_error']}")
+            if st.button('Retry', key=f"retry_job_{job['id']}"):
+                jobs.retry(job['id'])
+                st.rerun()
+    except Error as e:
+        st.error(f'Error: {e}')
+
+# Streams the export to a temporary file, which the download button then
+# serves; only the finished file is ever held in memory
+def export_data():
+    with st.form('export_form'):
+        dataset = st.selectbox('Data', list(export.DATASETS), format_func=lambda name: name.replace('_', ' ').title())
+        col1, col2 = st.columns(2)
+        with col1:
+            date_from = st.date_input('From', value=None)
+        with col2:
+            date_to = st.date_input('To', value=None)
+        statuses = st.multiselect('Status', STATUSES + LOST_ITEM_STATUSES)
+        categories = st.multiselect('Category (complaints only)', CATEGORIES)
+        fmt = st.radio('Format', export.FORMATS, horizontal=True, format_func=str.upper)
+        compress = st.checkbox('Gzip', value=True)
+        if st.form_submit_button('Prepare export'):
+            old = st.session_state.pop('export_file', None)
+            if old and os.path.exists(old[0]):
+                os.remove(old[0])
+            try:
+                with tempfile.NamedTemporaryFile(prefix='sbms-export-', delete=False) as out:
+                    total = export.write(out, dataset, fmt, compress, date_from=date_from, date_to=date_to,
+                                         statuses=statuses, categories=categories)
+                name = export.file_name(dataset, fmt, compress, date_from, date_to)
+                st.session_state.export_file = (out.name, name, total)
+            except (Error, ValueError) as e:
+                st.error(f'Error: {e}')
+    if 'export_file' in st.session_state:
+        path, name, total = st.session_state.export_file
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                st.download_button(f'Download {name} ({total} rows)', f, file_name=name,
+                                   mime='application/gzip' if name.endswith('.gz') else 'text/plain')
+
+# Bulk load from an uploaded file; rejected rows are listed by line and the
+# rest are kept
+def import_data():
+    with st.form('import_form', clear_on_submit=True):
+        dataset = st.selectbox('Data', list(importer.DATASETS), format_func=lambda name: name.replace('_', ' ').title())
+        upload = st.file_uploader('CSV or JSONL file', type=['csv', 'jsonl', 'json', 'gz'])
+        if st.form_submit_button('Import') and upload is not None:
+            try:
+                report = importer.load(upload, dataset, importer.format_for(upload.name), upload.name.endswith('.gz'))
+                st.session_state.import_report = (upload.name, report)
+            except (Error, OSError, ValueError) as e:
+                st.error(f'Error: {e}')
+    if 'import_report' in st.session_state:
+        name, report = st.session_state.import_report
+        st.success(f'{name}: {report.inserted} rows imported')
+        if report.failed:
+            st.warning(f'{report.failed} rows rejected')
+            st.dataframe([{'line': line, 'error': message} for line, message in report.errors],
+                         use_container_width=True, hide_index=True)
+
+def performance_page():
+    st.header("⏱️ Performance")
+    rerun = metrics.current_rerun()
+    if rerun:
+        st.subheader('This rerun so far')
+        col1, col2, col3, col4, col5 = st.columns(5)
+        col1.metric('Queries', rerun.queries)
+        col2.metric('DB time', f'{1000 * rerun.query_seconds:.1f} ms')
+        col3.metric('Rows', rerun.rows)
+        col4.metric('Pool wait', f'{1000 * rerun.pool_wait_seconds:.1f} ms')
+        col5.metric('Images', f'{rerun.renders} in {1000 * rerun.render_seconds:.0f} ms')
+        if metrics.SAMPLE_RATE:
+            st.caption(f'≈{rerun.bytes:,} bytes of results, {rerun.connections_opened} new connections')
+    st.subheader('Recent reruns')
+    st.dataframe(metrics.recent_reruns(), use_container_width=True, hide_index=True)
+    st.subheader('Slow and sampled queries')
+    st.caption(f'Statements over {1000 * metrics.SLOW_QUERY_SECONDS:.0f} ms are always kept; '
+               f'others are sampled at a rate of {metrics.SAMPLE_RATE:g} (SBMS_QUERY_SAMPLE_RATE)')
+    samples = metrics.samples()
+    if samples:
+        st.dataframe(samples, use_container_width=True, hide_index=True)
+    else:
+        st.info('No queries captured yet')
+    with st.expander('Prometheus metrics'):
+        text = metrics.prometheus_text()
+        if metrics.METRICS_PORT:
+            st.caption(f'Also served at http://127.0.0.1:{metrics.METRICS_PORT}/metrics')
+        st.download_button('Download', text, file_name='sbms-metrics.txt', mime='text/plain')
+        st.code(text, language=None)
+
+# Side effects of submissions run on this process's worker threads
+jobs.start_workers()
+metrics.start_server()
 
 # Initialize session state
 if 'user' not in st.session_state:
     st.session_state.user = None
 
+# Per-rerun totals for the Performance tab
+metrics.begin_rerun(st.session_state.user['role'] if st.session_state.user else 'anonymous')
+
 # Sidebar for login/logout
 with st.sidebar:
     if st.session_state.user is None:
@@ -443,6 +865,21 @@ with st.sidebar:
         st.write(f'Role: {st.session_state.user["role"]}')
         if st.session_state.user['role'] == 'officer':
             st.write(f'Department: {st.session_state.user["department"]}')
+        if st.session_state.user['role'] == 'admin':
+            with st.expander('Connection pool'):
+                st.json(db.get_pool().stats())
+            with st.expander('Round-trips per action'):
+                st.json(repository.action_stats())
+            with st.expander('Query cache'):
+                st.json(query_cache.get_cache().stats())
+            with st.expander('Open complaints per officer'):
+                st.json(routing.get_table().workload())
+            with st.expander('Background jobs'):
+                background_jobs()
+            with st.expander('Export data'):
+                export_data()
+            with st.expander('Import data'):
+                import_data()
         if st.button('Logout'):
             st.session_state.user = None
             st.rerun()
@@ -458,23 +895,28 @@ if st.session_state.user is None:
 else:
     st.title('Smart Building Management System')
     
+    # Fetched once per rerun, shared by the sidebar and the Leaderboard tab
+    top_students = get_leaderboard()
+    
     # Show points and leaderboard for students
     if st.session_state.user['role'] == 'student':
         st.sidebar.markdown("### 🏆 Your Points")
         st.sidebar.markdown(f"### {st.session_state.user['points']} points")
         
         st.sidebar.markdown("### 🏅 Leaderboard")
-        leaderboard = get_leaderboard()
-        for i, student in enumerate(leaderboard, 1):
+        for i, student in enumerate(top_students, 1):
             medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
             st.sidebar.markdown(f"{medal} {student['username']}: {student['points']} points")
         
-        if leaderboard and leaderboard[0]['username'] == st.session_state.user['username']:
+        if top_students and top_students[0]['username'] == st.session_state.user['username']:
             st.sidebar.success("🎉 Congratulations! You're the top scorer!")
     
     # Create tabs for different features
     if st.session_state.user['role'] == 'student':
         tab1, tab2, tab3 = st.tabs(["Complaints", "Lost & Found", "Leaderboard"])
+    elif st.session_state.user['role'] == 'admin':
+        tab1, tab2, tab3, tab4, tab5 = st.tabs(
+            ["Complaints", "Lost & Found", "Leaderboard", "Analytics", "Performance"])
     else:
         tab1, tab2, tab3 = st.tabs(["Complaints", "Lost & Found", "Leaderboard"])
     
@@ -501,7 +943,7 @@ else:
             
             if st.button('Submit Complaint', key='submit_complaint'):
                 if title and description:
-                    submit_new_complaint(title, description, category, priority, st.session_state.user['id'], image_file)
+                    submit_new_complaint(st.session_state.user, title, description, category, priority, image_file)
                     complaint_submitted = True
                     st.rerun()
                 else:
@@ -509,169 +951,17 @@ else:
         
         # Existing complaint display code
         st.header('Complaints')
-        complaints = get_user_complaints(st.session_state.user['id'], st.session_state.user['role'])
-        
-        if complaints:
-            # For students, show a summary of their complaints
-            if st.session_state.user['role'] == 'student':
-                # Create tabs for different statuses
-                tab1, tab2, tab3, tab4 = st.tabs(["All Complaints", "Pending", "In Progress", "Resolved/Closed"])
-                
-                with tab1:
-                    st.subheader("All Your Complaints")
-                    for complaint in complaints:
-                        with st.container():
-                            st.markdown(f"### {complaint['title']}")
-                            col1, col2 = st.columns([2,1])
-                            with col1:
-                                st.write(complaint['description'])
-                                if complaint['image_path'] and os.path.exists(complaint['image_path']):
-                                    try:
-                                        image = Image.open(complaint['image_path'])
-                                        st.image(image, caption='Complaint Image', use_container_width=True)
-                                    except Exception as e:
-                                        st.error(f"Error displaying image: {e}")
-                            with col2:
-                                st.write(f"**Category:** {complaint['category']}")
-                                st.write(f"**Priority:** {complaint['priority']}")
-                                st.write(f"**Status:** {complaint['status']}")
-                                if complaint['assigned_to_name']:
-                                    st.write(f"**Assigned to:** {complaint['assigned_to_name']}")
-                                if complaint['admin_notes']:
-                                    st.write(f"**Admin Notes:** {complaint['admin_notes']}")
-                                if complaint['officer_notes']:
-                                    st.write(f"**Officer Notes:** {complaint['officer_notes']}")
-                                st.write(f"**Created:** {complaint['created_at']}")
-                            st.divider()
-                
-                with tab2:
-                    pending = [c for c in complaints if c['status'] == 'Pending Admin Review']
-                    if pending:
-                        for complaint in pending:
-                            with st.container():
-                                st.markdown(f"### {complaint['title']}")
-                                col1, col2 = st.columns([2,1])
-                                with col1:
-                                    st.write(complaint['description'])
-                                    if complaint['image_path'] and os.path.exists(complaint['image_path']):
-                                        try:
-                                            image = Image.open(complaint['image_path'])
-                                            st.image(image, caption='Complaint Image', use_container_width=True)
-                                        except Exception as e:
-                                            st.error(f"Error displaying image: {e}")
-                                with col2:
-                                    st.write(f"**Category:** {complaint['category']}")
-                                    st.write(f"**Priority:** {complaint['priority']}")
-                                    st.write(f"**Created:** {complaint['created_at']}")
-                                st.divider()
-                    else:
-                        st.info("No pending complaints")
-                
-                with tab3:
-                    in_progress = [c for c in complaints if c['status'] == 'In Progress']
-                    if in_progress:
-                        for complaint in in_progress:
-                            with st.container():
-                                st.markdown(f"### {complaint['title']}")
-                                col1, col2 = st.columns([2,1])
-                                with col1:
-                                    st.write(complaint['description'])
-                                    if complaint['image_path'] and os.path.exists(complaint['image_path']):
-                                        try:
-                                            image = Image.open(complaint['image_path'])
-                                            st.image(image, caption='Complaint Image', use_container_width=True)
-                                        except Exception as e:
-                                            st.error(f"Error displaying image: {e}")
-                                with col2:
-                                    st.write(f"**Category:** {complaint['category']}")
-                                    st.write(f"**Priority:** {complaint['priority']}")
-                                    st.write(f"**Assigned to:** {complaint['assigned_to_name']}")
-                                    if complaint['officer_notes']:
-                                        st.write(f"**Officer Notes:** {complaint['officer_notes']}")
-                                    st.write(f"**Created:** {complaint['created_at']}")
-                                st.divider()
-                    else:
-                        st.info("No complaints in progress")
-                
-                with tab4:
-                    resolved = [c for c in complaints if c['status'] in ['Resolved', 'Closed']]
-                    if resolved:
-                        for complaint in resolved:
-                            with st.container():
-                                st.markdown(f"### {complaint['title']}")
-                                col1, col2 = st.columns([2,1])
-                                with col1:
-                                    st.write(complaint['description'])
-                                    if complaint['image_path'] and os.path.exists(complaint['image_path']):
-                                        try:
-                                            image = Image.open(complaint['image_path'])
-                                            st.image(image, caption='Complaint Image', use_container_width=True)
-                                        except Exception as e:
-                                            st.error(f"Error displaying image: {e}")
-                                with col2:
-                                    st.write(f"**Category:** {complaint['category']}")
-                                    st.write(f"**Priority:** {complaint['priority']}")
-                                    st.write(f"**Status:** {complaint['status']}")
-                                    st.write(f"**Assigned to:** {complaint['assigned_to_name']}")
-                                    if complaint['admin_notes']:
-                                        st.write(f"**Admin Notes:** {complaint['admin_notes']}")
-                                    if complaint['officer_notes']:
-                                        st.write(f"**Officer Notes:** {complaint['officer_notes']}")
-                                    st.write(f"**Created:** {complaint['created_at']}")
-                                st.divider()
-                    else:
-                        st.info("No resolved or closed complaints")
-            else:
-                # Existing display for admin and officers
-                for complaint in complaints:
-                    with st.container():
-                        col1, col2, col3 = st.columns([2,1,1])
-                        with col1:
-                            st.subheader(complaint['title'])
-                            st.write(complaint['description'])
-                            st.write(f"Reported by: {complaint['reporter']}")
-                            
-                            if complaint['image_path'] and os.path.exists(complaint['image_path']):
-                                try:
-                                    image = Image.open(complaint['image_path'])
-                                    st.image(image, caption='Complaint Image', use_container_width=True)
-                                except Exception as e:
-                                    st.error(f"Error displaying image: {e}")
-                            
-                            if complaint['admin_notes']:
-                                st.write(f"Admin Notes: {complaint['admin_notes']}")
-                            if complaint['officer_notes']:
-                                st.write(f"Officer Notes: {complaint['officer_notes']}")
-                        with col2:
-                            st.write(f"Category: {complaint['category']}")
-                            st.write(f"Priority: {complaint['priority']}")
-                            if complaint['assigned_to_name']:
-                                st.write(f"Assigned to: {complaint['assigned_to_name']}")
-                        with col3:
-                            if st.session_state.user['role'] in ['admin', 'officer']:
-                                status = st.selectbox(
-                                    'Status',
-                                    ['Pending Admin Review', 'In Progress', 'Resolved', 'Closed'],
-                                    index=['Pending Admin Review', 'In Progress', 'Resolved', 'Closed'].index(complaint['status']),
-                                    key=f'status_{complaint["id"]}'
-                                )
-                                notes = st.text_area('Notes', key=f'notes_{complaint["id"]}')
-                                
-                                if status != complaint['status'] or notes:
-                                    if st.session_state.user['role'] == 'admin':
-                                        if st.button('Update', key=f'update_{complaint["id"]}'):
-                                            update_complaint_status(complaint['id'], status, notes, is_admin=True)
-                                            st.rerun()
-                                    else:  # officer
-                                        if st.button('Update', key=f'update_{complaint["id"]}'):
-                                            update_complaint_status(complaint['id'], status, notes)
-                                            st.rerun()
-                            else:
-                                st.write(f"Status: {complaint['status']}")
-                            st.write(f"Created: {complaint['created_at']}")
-                        st.divider()
+        # For students, show a summary of their complaints
+        if st.session_state.user['role'] == 'student':
+            student_complaints(st.session_state.user)
         else:
-            st.info('No complaints found')
+            with st.expander('Search'):
+                complaint_search(st.session_state.user)
+            if st.session_state.user['role'] == 'admin':
+                with st.expander('Bulk triage'):
+                    bulk_triage(st.session_state.user)
+            # Admins and officers: the page and each card rerun on their own
+            complaint_page(st.session_state.user)
     
     with tab2:
         if st.session_state.user['role'] == 'student':
@@ -693,87 +983,97 @@ else:
                 
                 if st.button('Submit Lost Item', key='submit_lost_item'):
                     if item_name and description and lost_place:
-                        submit_lost_item(item_name, description, lost_time, lost_place, st.session_state.user['id'], image_file)
+                        submit_lost_item(st.session_state.user, item_name, description, lost_time, lost_place, image_file)
                     else:
                         st.error('Please fill in all required fields')
             
             # Display student's lost items
             st.header('Your Lost Items')
-            lost_items = get_lost_items(st.session_state.user['id'], st.session_state.user['role'])
+            include_archived = st.toggle('Include archived', key='lost_items_include_archived')
+            page_key = 'lost_items_archived' if include_archived else 'lost_items'
+            lost_items, next_cursor = get_lost_items(
+                st.session_state.user['id'], st.session_state.user['role'], after=current_page(page_key),
+                include_archived=include_archived,
+            )
             if lost_items:
                 for item in lost_items:
                     with st.container():
                         st.markdown(f"### {item['item_name']}")
                         col1, col2 = st.columns([2,1])
                         with col1:
-                            st.write(item['description'])
-                            if item['image_path'] and os.path.exists(item['image_path']):
-                                try:
-                                    image = Image.open(item['image_path'])
-                                    st.image(image, caption='Item Image', use_container_width=True)
-                                except Exception as e:
-                                    st.error(f"Error displaying image: {e}")
+                            show_image(item['image_path'], 'Item Image', f'lost_image_{item["id"]}')
+                            if st.toggle('Show details', key=f'lost_details_{item["id"]}'):
+                                details = get_lost_item_details(item['id'], bool(item.get('archived')))
+                                if details:
+                                    st.write(details['description'])
+                                    if details['admin_notes']:
+                                        st.write(f"**Admin Notes:** {details['admin_notes']}")
                         with col2:
                             st.write(f"**Status:** {item['status']}")
                             st.write(f"**Lost Time:** {item['lost_time']}")
                             st.write(f"**Lost Place:** {item['lost_place']}")
-                            if item['admin_notes']:
-                                st.write(f"**Admin Notes:** {item['admin_notes']}")
                             st.write(f"**Reported:** {item['created_at']}")
+                            if item.get('archived'):
+                                st.caption('Archived')
                         st.divider()
+                render_pager(page_key, next_cursor)
             else:
                 st.info('No lost items reported')
         else:
             # Admin view for lost items
             st.header('Lost & Found Management')
-            lost_items = get_lost_items(None, 'admin')
-            if lost_items:
-                for item in lost_items:
-                    with st.container():
-                        st.markdown(f"### {item['item_name']}")
-                        col1, col2 = st.columns([2,1])
-                        with col1:
-                            st.write(item['description'])
-                            if item['image_path'] and os.path.exists(item['image_path']):
-                                try:
-                                    image = Image.open(item['image_path'])
-                                    st.image(image, caption='Item Image', use_container_width=True)
-                                except Exception as e:
-                                    st.error(f"Error displaying image: {e}")
-                        with col2:
-                            # Create a form for each item to handle status updates
-                            with st.form(key=f'form_{item["id"]}'):
-                                status = st.selectbox(
-                                    'Status',
-                                    ['Lost', 'Found', 'Collected'],
-                                    index=['Lost', 'Found', 'Collected'].index(item['status']),
-                                    key=f'status_{item["id"]}'
-                                )
-                                notes = st.text_area('Notes', value=item['admin_notes'] if item['admin_notes'] else '', key=f'notes_{item["id"]}')
-                                
-                                submit_button = st.form_submit_button('Update Status')
-                                if submit_button:
-                                    update_lost_item_status(item['id'], status, notes)
-                                    st.rerun()
-                            
-                            st.write(f"**Reported by:** {item['reporter']}")
-                            st.write(f"**Lost Time:** {item['lost_time']}")
-                            st.write(f"**Lost Place:** {item['lost_place']}")
-                            st.write(f"**Reported:** {item['created_at']}")
-                        st.divider()
-            else:
-                st.info('No lost items reported')
+            with st.expander('Log Found Item'):
+                with st.form('found_item_form', clear_on_submit=True):
+                    item_name = st.text_input('Item Name')
+                    description = st.text_area('Description')
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        date = st.date_input('Date Found')
+                    with col2:
+                        time = st.time_input('Time Found')
+                    found_place = st.text_input('Where was it found?')
+                    image_file = st.file_uploader("Upload Image of the Item (optional)", type=['jpg', 'jpeg', 'png'])
+                    if st.form_submit_button('Log Found Item'):
+                        if item_name and description and found_place:
+                            submit_found_item(st.session_state.user, item_name, description, datetime.combine(date, time),
+                                              found_place, image_file)
+                        else:
+                            st.error('Please fill in all required fields')
+            with st.expander('Search'):
+                lost_item_search(st.session_state.user)
+            st.subheader('Found Items')
+            found_item_page()
+            st.subheader('Lost Reports')
+            lost_item_page()
     
     with tab3:
         st.header("🏆 Leaderboard")
-        leaderboard = get_leaderboard()
-        if leaderboard:
-            for i, student in enumerate(leaderboard, 1):
+        period = st.radio('Period', ['This month', 'This semester', 'All time'], horizontal=True,
+                          label_visibility='collapsed', key='leaderboard_period')
+        if period == 'This month':
+            board = get_period_leaderboard('month')
+        elif period == 'This semester':
+            board = get_period_leaderboard('semester')
+        else:
+            board = top_students
+        if board:
+            for i, student in enumerate(board, 1):
                 medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
                 st.markdown(f"### {medal} {student['username']}")
                 st.markdown(f"**Points:** {student['points']}")
-                if i == 1:
-                    st.success("🌟 Top scorer! Eligible for monthly prize!")
+                if i == 1 and period == 'This month':
+                    st.success("🌟 Top scorer this month! Eligible for monthly prize!")
                 st.divider()
         else:
-            st.info("No students have earned points yet.") 
\ No newline at end of file
+            st.info("No students have earned points yet.") 
+
+    if st.session_state.user['role'] == 'admin':
+        with tab4:
+            analytics_page()
+
+    # Filled last so the totals cover everything this rerun did
+    if st.session_state.user['role'] == 'admin':
+        with tab5:
+            performance_page()
+
+metrics.end_rerun()
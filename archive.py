@@ -0,0 +1,342 @@
+import argparse
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+from PIL import Image, ImageOps
+
+import changes
+import db
+import dedupe
+import jobs
+import matching
+import query_cache
+import storage
+
+# Hot/cold archival. Finished rows older than ARCHIVE_AFTER_DAYS move out
+# of complaints, lost_items and found_items into <table>_archive, which is
+# partitioned by month of created_at, and their images move to COLD_DIR.
+# The hot tables and their indexes then hold little beyond live work;
+# archived rows are read only through the include_archived paths in
+# repository. A complaint moves with its linked duplicates, and a lost
+# report with the found items matched to it.
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('SBMS_ARCHIVE_AFTER_DAYS', '180'))
+# Rows touched this recently stay hot whatever their age
+IDLE_DAYS = 7
+ARCHIVE_INTERVAL = 6 * 3600
+# Root rows moved per transaction; a full batch runs the next one at once
+BATCH_SIZE = 500
+COLD_DIR = os.environ.get('SBMS_COLD_DIR', os.path.join('archive', 'uploads'))
+COLD_JPEG_QUALITY = 70
+# A hot file reused by an upload this recently is left in place
+FILE_GRACE_SECONDS = 3600
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_TABLES = {
+    'complaints': 'complaints_archive',
+    'lost_items': 'lost_items_archive',
+    'found_items': 'found_items_archive',
+}
+
+# Columns copied to the archive; working columns such as the dedupe
+# signature and the processed flag stay behind
+COLUMNS = {
+    'complaints': ('id', 'title', 'description', 'category', 'priority', 'status', 'created_at', 'user_id',
+                   'assigned_to', 'admin_notes', 'officer_notes', 'image_path', 'points_awarded', 'parent_id',
+                   'duplicate_count', 'version', 'updated_at'),
+    'lost_items': ('id', 'item_name', 'description', 'lost_time', 'lost_place', 'status', 'created_at', 'user_id',
+                   'admin_notes', 'image_path', 'image_hash', 'version', 'updated_at'),
+    'found_items': ('id', 'item_name', 'description', 'found_time', 'found_place', 'status', 'created_at', 'user_id',
+                    'image_path', 'image_hash', 'lost_item_id'),
+}
+
+PARTITION_RE = re.compile(r'p(\d{4})(\d{2})$')
+
+
+def _next_month(month):
+    return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+# The last month whose rows can be old enough to archive
+def cutoff_month():
+    return (date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)).replace(day=1)
+
+
+# Split p_future so that every month up to `through` has a partition of
+# its own. The first split starts at the oldest hot row. DDL commits
+# implicitly, so this runs on a connection of its own before the
+# transaction that moves rows.
+def add_partitions(cursor, table, through):
+    archive_table = ARCHIVE_TABLES[table]
+    cursor.execute("""
+        SELECT partition_name FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = %s
+    """, (archive_table,))
+    months = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_RE.match(name or '')
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    if months:
+        month = _next_month(max(months))
+    else:
+        cursor.execute(f"SELECT MIN(created_at) FROM {table}")
+        oldest = cursor.fetchone()[0]
+        if oldest is None:
+            return []
+        month = oldest.date().replace(day=1)
+    added = []
+    while month <= through:
+        added.append(month)
+        month = _next_month(month)
+    if added:
+        partitions = ', '.join(
+            f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_next_month(month)}'))" for month in added
+        )
+        cursor.execute(f"""
+            ALTER TABLE {archive_table} REORGANIZE PARTITION p_future INTO (
+                {partitions}, PARTITION p_future VALUES LESS THAN MAXVALUE
+            )
+        """)
+    return added
+
+
+def prepare():
+    conn = db.get_pool().get_connection()
+    try:
+        cursor = conn.cursor()
+        for table in ARCHIVE_TABLES:
+            add_partitions(cursor, table, cutoff_month())
+        cursor.close()
+    finally:
+        conn.close()
+
+
+def _recompress(path, out_path):
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L', 'CMYK'):
+            image = image.convert('RGB')
+        image.save(out_path, 'JPEG', quality=COLD_JPEG_QUALITY, optimize=True, progressive=True)
+
+
+# Copy a stored file into COLD_DIR under the same relative path, JPEGs
+# re-encoded at COLD_JPEG_QUALITY when that makes them smaller. An existing
+# copy is reused, so a retried job does no work twice. Returns the cold
+# path, or None for files that are missing or not under UPLOAD_DIR.
+def cold_copy(path):
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(storage.UPLOAD_DIR))
+    if relative.startswith(os.pardir) or storage.is_incoming(path) or not os.path.isfile(path):
+        return None
+    cold_path = os.path.join(COLD_DIR, relative)
+    if os.path.exists(cold_path):
+        return cold_path
+    os.makedirs(os.path.dirname(cold_path), exist_ok=True)
+    tmp_path = f'{cold_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        copied = False
+        if os.path.splitext(path)[1].lower() in ('.jpg', '.jpeg'):
+            try:
+                _recompress(path, tmp_path)
+                copied = os.path.getsize(tmp_path) < os.path.getsize(path)
+            except (OSError, Image.DecompressionBombError):
+                pass
+        if not copied:
+            shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, cold_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return cold_path
+
+
+def _in(ids):
+    return ', '.join(['%s'] * len(ids))
+
+
+# DELETE by full primary key values, chunked to keep statements small
+def _delete_keys(uow, table, columns, keys):
+    for start in range(0, len(keys), 1000):
+        chunk = keys[start:start + 1000]
+        uow.execute(f"""
+            DELETE FROM {table}
+            WHERE ({', '.join(columns)}) IN ({', '.join(['(' + _in(columns) + ')'] * len(chunk))})
+        """, [value for key in chunk for value in key])
+
+
+# Drop the matching-index rows of items about to move; the keys are
+# rebuilt from the item text the same way they were indexed
+def _unindex_items(uow, kind, ids):
+    table, time_column, place_column, _ = matching.SIDES[kind]
+    rows = uow.fetchall(f"""
+        SELECT id, item_name, description, {place_column} AS place, {time_column} AS time
+        FROM {table}
+        WHERE id IN ({_in(ids)})
+    """, ids)
+    _delete_keys(uow, 'item_tokens', ('kind', 'token', 'day_bucket', 'item_id'), [
+        (kind, token[:40], matching.time_bucket(row['time']), row['id'])
+        for row in rows for token in matching.item_tokens(row['item_name'], row['description'], row['place'])
+    ])
+
+
+def _unindex_complaints(uow, ids):
+    rows = uow.fetchall(f"""
+        SELECT id, category, created_at, minhash FROM complaints
+        WHERE id IN ({_in(ids)}) AND minhash IS NOT NULL
+    """, ids)
+    _delete_keys(uow, 'complaint_lsh', ('category', 'band', 'bucket', 'created_day', 'complaint_id'), [
+        (row['category'], band, bucket, matching.time_bucket(row['created_at']), row['id'])
+        for row in rows for band, bucket in dedupe.band_keys(dedupe.unpack(row['minhash']))
+    ])
+
+
+# Copy rows to the archive with their images' cold paths, then delete
+# them. Returns the hot image paths that now have a cold copy.
+def _move(uow, table, ids):
+    paths = [row['image_path'] for row in uow.fetchall(f"""
+        SELECT DISTINCT image_path FROM {table}
+        WHERE id IN ({_in(ids)}) AND image_path IS NOT NULL
+    """, ids)]
+    moved = {}
+    for path in paths:
+        cold_path = cold_copy(path)
+        if cold_path:
+            moved[path] = cold_path
+    image, params = 'image_path', []
+    if moved:
+        image = f"CASE image_path {' '.join(['WHEN %s THEN %s'] * len(moved))} ELSE image_path END"
+        params = [value for pair in moved.items() for value in pair]
+    columns = COLUMNS[table]
+    uow.execute(f"""
+        INSERT INTO {ARCHIVE_TABLES[table]} ({', '.join(columns)}, archived_at)
+        SELECT {', '.join(image if column == 'image_path' else column for column in columns)}, NOW()
+        FROM {table}
+        WHERE id IN ({_in(ids)})
+    """, params + ids)
+    uow.execute(f"DELETE FROM {table} WHERE id IN ({_in(ids)})", ids)
+    if table in changes.TABLES:
+        changes.record(uow, table, ids, 'delete')
+    return list(moved)
+
+
+# Hot paths no hot row refers to any more (uses the image_path indexes)
+def _unreferenced(uow, paths):
+    referenced = set()
+    for table in ARCHIVE_TABLES:
+        referenced.update(row['image_path'] for row in uow.fetchall(f"""
+            SELECT DISTINCT image_path FROM {table}
+            WHERE image_path IN ({_in(paths)})
+        """, paths))
+    return [path for path in paths if path not in referenced]
+
+
+def _remove_hot_files(paths):
+    for path in paths:
+        try:
+            # Content-addressed files are shared: an upload of the same
+            # content since the reference check touched the file
+            if time.time() - os.path.getmtime(path) > FILE_GRACE_SECONDS:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _ids(rows):
+    return [row['id'] for row in rows]
+
+
+# Move one batch of each kind of finished row; returns the number of rows
+# moved per table. Rows are locked as they are picked, so a concurrent
+# status change either lands before the move or finds the row gone.
+def archive_once(uow, limit=BATCH_SIZE):
+    roots = _ids(uow.fetchall("""
+        SELECT id FROM complaints
+        WHERE status IN ('Resolved', 'Closed') AND parent_id IS NULL
+          AND created_at < NOW() - INTERVAL %s DAY AND updated_at < NOW() - INTERVAL %s DAY
+        LIMIT %s
+        FOR UPDATE
+    """, (ARCHIVE_AFTER_DAYS, IDLE_DAYS, limit)))
+    complaints = list(roots)
+    if roots:
+        complaints += _ids(uow.fetchall(f"""
+            SELECT id FROM complaints WHERE parent_id IN ({_in(roots)}) FOR UPDATE
+        """, roots))
+    lost = _ids(uow.fetchall("""
+        SELECT id FROM lost_items
+        WHERE status = 'Collected'
+          AND created_at < NOW() - INTERVAL %s DAY AND updated_at < NOW() - INTERVAL %s DAY
+        LIMIT %s
+        FOR UPDATE
+    """, (ARCHIVE_AFTER_DAYS, IDLE_DAYS, limit)))
+    # Found items go with the lost report they point at, which cannot be
+    # deleted before them
+    found = []
+    if lost:
+        found = _ids(uow.fetchall(f"""
+            SELECT id FROM found_items WHERE lost_item_id IN ({_in(lost)}) FOR UPDATE
+        """, lost))
+    found += [found_id for found_id in _ids(uow.fetchall("""
+        SELECT id FROM found_items
+        WHERE status = 'Returned' AND created_at < NOW() - INTERVAL %s DAY
+        LIMIT %s
+        FOR UPDATE
+    """, (ARCHIVE_AFTER_DAYS, limit))) if found_id not in found]
+
+    paths = []
+    if complaints:
+        _unindex_complaints(uow, complaints)
+        paths += _move(uow, 'complaints', complaints)
+    if found:
+        _unindex_items(uow, 'found', found)
+        paths += _move(uow, 'found_items', found)
+    if lost:
+        _unindex_items(uow, 'lost', lost)
+        paths += _move(uow, 'lost_items', lost)
+    paths = _unreferenced(uow, list(set(paths))) if paths else []
+    uow.after_commit(lambda: _remove_hot_files(paths))
+    uow.after_commit(lambda: query_cache.bump('complaints', 'lost_items', 'found_items', 'item_matches'))
+    counts = {'complaints': len(complaints), 'lost_items': len(lost), 'found_items': len(found)}
+    log.info('archived %s', counts)
+    return counts
+
+
+# Periodic job: archive a batch, then come back at once if there was a
+# full one, or after ARCHIVE_INTERVAL
+@jobs.handler('archive')
+def archive(uow, payload=None):
+    prepare()
+    counts = archive_once(uow)
+    jobs.enqueue(uow, 'archive', {}, delay=0 if max(counts.values()) >= BATCH_SIZE else ARCHIVE_INTERVAL)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move finished rows and their images to the archive')
+    parser.add_argument('--batches', type=int, default=0, help='stop after this many batches (default: all)')
+    args = parser.parse_args(argv)
+    # repository imports this module for the read paths
+    from repository import UnitOfWork
+
+    prepare()
+    totals, batches = dict.fromkeys(ARCHIVE_TABLES, 0), 0
+    while True:
+        with UnitOfWork('archive') as uow:
+            counts = archive_once(uow)
+        for table, n in counts.items():
+            totals[table] += n
+        batches += 1
+        if max(counts.values()) < BATCH_SIZE or batches == args.batches:
+            break
+    print(', '.join(f'{n} {table}' for table, n in totals.items()) + ' archived')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,508 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import changes
+import db
+import jobs
+import leaderboard
+import ledger
+import migrations
+import query_cache
+import repository
+import routing
+import sla
+
+# Seeds a benchmark database with synthetic data and replays concurrent
+# student, officer and admin sessions against the data-access layer.
+# Point SBMS_DB_NAME at a scratch database: seeding adds rows in bulk.
+
+SEED_BATCH = 5000
+CATEGORY_WORDS = {
+    'Electrical Issues': ['light', 'fan', 'socket', 'switch', 'projector', 'power', 'bulb', 'wiring'],
+    'Water & Sanitation': ['tap', 'leak', 'washroom', 'drain', 'flush', 'cooler', 'pipe', 'shower'],
+    'Faulty Infrastructure': ['door', 'window', 'bench', 'ceiling', 'stairs', 'lock', 'desk', 'wall'],
+    'Internet & Network': ['wifi', 'lan', 'router', 'internet', 'portal', 'slow', 'login', 'access'],
+    'Security Concerns': ['gate', 'cctv', 'guard', 'theft', 'stranger', 'alarm', 'lighting', 'fence'],
+}
+PLACES = ['block a', 'block b', 'block c', 'library', 'hostel 1', 'hostel 2', 'canteen', 'lab 3', 'auditorium']
+ITEMS = ['wallet', 'phone', 'keys', 'id card', 'bottle', 'umbrella', 'charger', 'earphones', 'calculator', 'bag']
+STATUS_WEIGHTS = [('Pending Admin Review', 15), ('In Progress', 25), ('Resolved', 50), ('Closed', 10)]
+
+# Actions per role with their relative weights; each action is what one
+# rerun of the matching page does
+MIX = {'student': 70, 'officer': 20, 'admin': 10}
+
+
+def _weighted(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights)[0]
+
+
+def _text(rng, category, place):
+    words = rng.sample(CATEGORY_WORDS[category], 3)
+    title = f'{words[0]} {rng.choice(["not working", "broken", "damaged", "issue"])} in {place}'
+    description = f"The {words[0]} near the {words[1]} in {place} has a problem with the {words[2]}."
+    return title[:100], description
+
+
+# Seconds before now for n rows drawn uniformly over span seconds, oldest
+# first. Each value is the largest of the uniforms still to come, drawn
+# directly, so the order needs no sort and nothing is held in memory.
+def _ages(rng, n, span):
+    top = 1.0
+    for remaining in range(n, 0, -1):
+        top *= rng.random() ** (1 / remaining)
+        yield int(top * span)
+
+
+# rows may be any iterable; only one SEED_BATCH is built at a time
+def _insert_batches(conn, sql, rows):
+    rows = iter(rows)
+    cursor = conn.cursor()
+    try:
+        while batch := list(itertools.islice(rows, SEED_BATCH)):
+            conn.start_transaction()
+            cursor.executemany(sql, batch)
+            conn.commit()
+    finally:
+        cursor.close()
+
+
+def seed(complaints, students=None, lost_items=None, days=365, rng_seed=1):
+    rng = random.Random(rng_seed)
+    students = students or max(complaints // 20, 10)
+    lost_items = lost_items if lost_items is not None else complaints // 10
+    run_id = int(time.time())
+    now = datetime.now()
+    with db.get_pool().connection() as conn:
+        migrations.migrate(conn)
+        users = [(f'bench{run_id}_s{i}', 'bench', 'student', 'Student', 0) for i in range(students)]
+        users += [(f'bench{run_id}_o{i}_{department}', 'bench', 'officer', department, 0)
+                  for department in routing.CATEGORY_TO_DEPARTMENT.values() for i in range(3)]
+        _insert_batches(conn, """
+            INSERT INTO users (username, password, role, department, points)
+            VALUES (%s, %s, %s, %s, %s)
+        """, users)
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, role, department FROM users WHERE username LIKE %s", (f'bench{run_id}_%',))
+        student_ids, officers = [], {}
+        for user_id, role, department in cursor.fetchall():
+            if role == 'student':
+                student_ids.append(user_id)
+            else:
+                officers.setdefault(department, []).append(user_id)
+        cursor.close()
+
+        # Inserted oldest first so ids grow with created_at, as in production
+        def complaint_rows():
+            for age in _ages(rng, complaints, days * 86400):
+                category = rng.choice(list(CATEGORY_WORDS))
+                title, description = _text(rng, category, rng.choice(PLACES))
+                status = _weighted(rng, STATUS_WEIGHTS)
+                assigned = rng.choice(officers[routing.CATEGORY_TO_DEPARTMENT[category]])
+                yield (title, description, category, rng.choice(['Urgent', 'High', 'Medium', 'Low']), status,
+                       now - timedelta(seconds=age), rng.choice(student_ids), assigned, status == 'Resolved')
+
+        _insert_batches(conn, """
+            INSERT INTO complaints (title, description, category, priority, status, created_at,
+                                    user_id, assigned_to, points_awarded)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, complaint_rows())
+
+        def lost_item_rows():
+            for age in _ages(rng, lost_items, days * 86400):
+                item, place = rng.choice(ITEMS), rng.choice(PLACES)
+                lost_time = now - timedelta(seconds=age)
+                yield (item, f'{rng.choice(["black", "blue", "red", "grey"])} {item} lost near {place}',
+                       lost_time, place, _weighted(rng, [('Lost', 60), ('Found', 25), ('Collected', 15)]),
+                       lost_time, rng.choice(student_ids))
+
+        _insert_batches(conn, """
+            INSERT INTO lost_items (item_name, description, lost_time, lost_place, status, created_at, user_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, lost_item_rows())
+
+        # Point history for the seeded complaints, in time order, then the
+        # matching running totals and rollups
+        cursor = conn.cursor()
+        conn.start_transaction()
+        cursor.execute("""
+            INSERT INTO points_ledger (user_id, amount, reason, complaint_id, idempotency_key, created_at)
+            SELECT * FROM (
+                SELECT c.user_id, %s AS amount, 'submit' AS reason, c.id, CONCAT('submit:', c.id),
+                       c.created_at
+                FROM complaints c JOIN users u ON u.id = c.user_id AND u.username LIKE %s
+                UNION ALL
+                SELECT c.user_id, %s, 'resolve', c.id, CONCAT('resolve:', c.id),
+                       LEAST(c.created_at + INTERVAL 1 DAY, NOW() - INTERVAL 1 HOUR)
+                FROM complaints c JOIN users u ON u.id = c.user_id AND u.username LIKE %s
+                WHERE c.status = 'Resolved'
+            ) e
+            ORDER BY 6
+        """, (repository.SUBMIT_POINTS, f'bench{run_id}_%', repository.RESOLVE_POINTS, f'bench{run_id}_%'))
+        cursor.execute("""
+            UPDATE users u
+            JOIN (SELECT user_id, SUM(amount) AS points FROM points_ledger GROUP BY user_id) l ON l.user_id = u.id
+            SET u.points = l.points
+            WHERE u.username LIKE %s
+        """, (f'bench{run_id}_%',))
+        conn.commit()
+
+        # Lifecycle events for the seeded tickets, timed so the SLA rollups
+        # get durations. The times derive from the id to stay repeatable.
+        mapping = list(routing.CATEGORY_TO_DEPARTMENT.items())
+        department = f"CASE category {' '.join(['WHEN %s THEN %s'] * len(mapping))} ELSE 'Other' END"
+        seeded = "FROM complaints c JOIN users u ON u.id = c.user_id AND u.username LIKE %s"
+        conn.start_transaction()
+        cursor.execute(f"""
+            INSERT INTO sla_events (complaint_id, kind, to_status, department, category, priority, seconds,
+                                    changed_at, recorded_at)
+            SELECT complaint_id, kind, to_status, {department}, category, priority,
+                   IF(kind = 'opened', NULL, TIMESTAMPDIFF(SECOND, created_at, changed_at)), changed_at, changed_at
+            FROM (
+                SELECT c.id AS complaint_id, 'opened' AS kind, 'Pending Admin Review' AS to_status,
+                       c.category, c.priority, c.created_at, c.created_at AS changed_at
+                {seeded}
+                UNION ALL
+                SELECT c.id, 'assigned', NULL, c.category, c.priority, c.created_at,
+                       GREATEST(c.created_at, LEAST(c.created_at + INTERVAL (60 + MOD(c.id * 7919, 7200)) SECOND,
+                                                    NOW() - INTERVAL 1 HOUR))
+                {seeded}
+                UNION ALL
+                SELECT c.id, 'resolved', c.status, c.category, c.priority, c.created_at,
+                       GREATEST(c.created_at, LEAST(c.created_at + INTERVAL (3600 + MOD(c.id * 104729, 604800)) SECOND,
+                                                    NOW() - INTERVAL 1 HOUR))
+                {seeded}
+                WHERE c.status IN ('Resolved', 'Closed')
+            ) e
+            ORDER BY changed_at
+        """, [value for pair in mapping for value in pair] + [f'bench{run_id}_%'] * 3)
+
+        # The change feed only keeps changes.KEEP_DAYS of events: inserts of
+        # the recent rows and one update for each recent ticket that moved on
+        cursor.execute(f"""
+            INSERT INTO change_events (entity, entity_id, op, version, changed_at)
+            SELECT entity, entity_id, op, version, changed_at
+            FROM (
+                SELECT 'complaints' AS entity, c.id AS entity_id, 'insert' AS op, c.version, c.created_at AS changed_at
+                {seeded}
+                WHERE c.created_at > NOW() - INTERVAL %s DAY
+                UNION ALL
+                SELECT 'complaints', c.id, 'update', c.version,
+                       GREATEST(c.created_at, LEAST(c.created_at + INTERVAL 1 HOUR, NOW() - INTERVAL 1 MINUTE))
+                {seeded}
+                WHERE c.created_at > NOW() - INTERVAL %s DAY AND c.status <> 'Pending Admin Review'
+                UNION ALL
+                SELECT 'lost_items', l.id, 'insert', l.version, l.created_at
+                FROM lost_items l JOIN users u ON u.id = l.user_id AND u.username LIKE %s
+                WHERE l.created_at > NOW() - INTERVAL %s DAY
+            ) e
+            ORDER BY changed_at
+        """, [f'bench{run_id}_%', changes.KEEP_DAYS] * 3)
+        conn.commit()
+        cursor.close()
+    with repository.UnitOfWork('bench_rollup') as uow:
+        ledger_rows = ledger.rollup_once(uow)
+        sla_events = sla.rollup_once(uow)
+    return {'students': students, 'complaints': complaints, 'lost_items': lost_items,
+            'ledger_rows_rolled_up': ledger_rows, 'sla_events_rolled_up': sla_events}
+
+
+def table_sizes():
+    with repository.UnitOfWork('bench_sizes', transaction=False) as uow:
+        return {
+            table: uow.fetchone(f"SELECT COUNT(*) AS n FROM {table}")['n']
+            for table in ('users', 'complaints', 'lost_items', 'sla_events', 'change_events')
+        }
+
+
+class Session:
+    # One simulated user; step() performs one weighted action and returns
+    # its name
+    def __init__(self, role, user, rng, fixtures):
+        self.role = role
+        self.user = user
+        self.rng = rng
+        self.fixtures = fixtures
+        self.change_cursor = None
+
+    def step(self):
+        actions = getattr(self, f'{self.role}_actions')()
+        name = _weighted(self.rng, [(name, weight) for name, weight, _ in actions])
+        dict((n, fn) for n, _, fn in actions)[name]()
+        return name
+
+    def student_actions(self):
+        user_id = self.user['id']
+        return [
+            ('student_view', 60, lambda: (
+                repository.count_complaints_by_status(user_id, 'student'),
+                repository.get_user_complaints(user_id, 'student', statuses=('Pending Admin Review', 'In Progress')),
+                leaderboard.get_board().top(),
+            )),
+            ('student_lost_items', 15, lambda: repository.get_lost_items(user_id, 'student')),
+            ('leaderboard_month', 10, lambda: repository.get_period_leaderboard('month')),
+            ('submit_complaint', 15, self.submit),
+        ]
+
+    def submit(self):
+        category = self.rng.choice(list(CATEGORY_WORDS))
+        title, description = _text(self.rng, category, self.rng.choice(PLACES))
+        repository.submit_complaint(title, description, category, 'Medium', self.user['id'])
+
+    def officer_actions(self):
+        user_id = self.user['id']
+        return [
+            ('officer_view', 60, lambda: repository.get_user_complaints(user_id, 'officer')),
+            ('live_poll', 10, self.live_poll),
+            ('officer_older_page', 10, self.officer_older_page),
+            ('update_status', 20, self.update_status),
+        ]
+
+    # What an open live list does every poll interval; too far behind, it
+    # starts over from a fresh cursor as a reload would
+    def live_poll(self):
+        cursor = self.change_cursor
+        if cursor is None:
+            cursor = repository.get_change_cursor()
+        rows, _, cursor = repository.get_complaint_changes(self.user['id'], 'officer', cursor)
+        self.change_cursor = cursor if rows is not None else None
+
+    def officer_older_page(self):
+        _, cursor = repository.get_user_complaints(self.user['id'], 'officer')
+        if cursor:
+            repository.get_user_complaints(self.user['id'], 'officer', after=cursor)
+
+    def update_status(self):
+        complaint_ids = self.fixtures['open_by_officer'].get(self.user['id'])
+        if complaint_ids:
+            status = self.rng.choice(['In Progress', 'Resolved'])
+            repository.update_complaint_status(self.rng.choice(complaint_ids), status, 'bench')
+
+    def admin_actions(self):
+        return [
+            ('admin_view', 40, lambda: (
+                repository.get_user_complaints(None, 'admin'),
+                repository.count_complaints_by_status(None, 'admin'),
+            )),
+            ('admin_lost_items', 15, lambda: repository.get_lost_items(None, 'admin')),
+            ('search', 20, lambda: repository.search_complaints(
+                None, 'admin', self.rng.choice([w for words in CATEGORY_WORDS.values() for w in words]))),
+            ('leaderboard_semester', 15, lambda: repository.get_period_leaderboard('semester')),
+            ('analytics', 10, lambda: (
+                repository.get_sla_summary(30, self.rng.choice(sla.DIMENSIONS)),
+                repository.get_sla_trend(days=30),
+            )),
+        ]
+
+
+def load_fixtures():
+    with repository.UnitOfWork('bench_fixtures', transaction=False) as uow:
+        students = uow.fetchall("SELECT id FROM users WHERE role = 'student' ORDER BY RAND() LIMIT 1000")
+        officers = uow.fetchall("SELECT id FROM users WHERE role = 'officer'")
+        admins = uow.fetchall("SELECT id FROM users WHERE role = 'admin'") or [{'id': None}]
+        open_by_officer = {}
+        for officer in officers:
+            rows = uow.fetchall("""
+                SELECT id FROM complaints
+                WHERE assigned_to = %s AND status IN ('Pending Admin Review', 'In Progress')
+                LIMIT 50
+            """, (officer['id'],))
+            open_by_officer[officer['id']] = [row['id'] for row in rows]
+    return {'student': students, 'officer': officers, 'admin': admins, 'open_by_officer': open_by_officer}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def run(sessions=8, duration=30.0, mix=MIX, rng_seed=1, cache=True, workers=2):
+    if not cache:
+        query_cache.get_cache().ttl = 0
+    pool = db.get_pool()
+    fixtures = load_fixtures()
+    job_pool = jobs.WorkerPool(size=workers) if workers else None
+    if job_pool:
+        job_pool.start()
+    before = pool.stats()
+    samples = {}
+    errors = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def session_loop(index):
+        session_rng = random.Random(rng_seed * 1000 + index)
+        while time.monotonic() < deadline:
+            role = _weighted(session_rng, list(mix.items()))
+            user = session_rng.choice(fixtures[role])
+            session = Session(role, user, session_rng, fixtures)
+            # A session is a handful of reruns by the same user
+            for _ in range(session_rng.randint(3, 10)):
+                if time.monotonic() >= deadline:
+                    break
+                trips = repository.thread_round_trips()
+                started = time.perf_counter()
+                try:
+                    name = session.step()
+                except Exception as e:
+                    with lock:
+                        errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    samples.setdefault(name, []).append((elapsed, repository.thread_round_trips() - trips))
+
+    threads = [threading.Thread(target=session_loop, args=(i,)) for i in range(sessions)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - started
+    if job_pool:
+        job_pool.stop(timeout=10)
+    after = pool.stats()
+
+    actions = {}
+    for name, values in sorted(samples.items()):
+        latencies = sorted(1000 * elapsed for elapsed, _ in values)
+        actions[name] = {
+            'count': len(values),
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': latencies[-1],
+            'avg_queries': sum(trips for _, trips in values) / len(values),
+        }
+    total = sum(action['count'] for action in actions.values())
+    return {
+        'actions': actions,
+        'total_actions': total,
+        'throughput_per_s': total / wall if wall else 0.0,
+        'errors': errors,
+        'pool': {
+            'connections_opened': after['connections_opened'] - before['connections_opened'],
+            'waits': after['waits'] - before['waits'],
+            'wait_time_s': after['wait_time'] - before['wait_time'],
+            'timeouts': after['timeouts'] - before['timeouts'],
+        },
+        'query_cache': query_cache.get_cache().stats(),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_report(result):
+    print(f"{'action':<22} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8}")
+    for name, action in result['actions'].items():
+        print(f"{name:<22} {action['count']:>7} {action['p50_ms']:>9.2f} {action['p95_ms']:>9.2f} "
+              f"{action['p99_ms']:>9.2f} {action['avg_queries']:>8.2f}")
+    print(f"{result['total_actions']} actions, {result['throughput_per_s']:.1f}/s, "
+          f"{result['pool']['connections_opened']} connections opened, "
+          f"{result['pool']['waits']} pool waits, errors: {result['errors'] or 'none'}")
+
+
+# Compare p95 per action; returns the actions that got slower than threshold
+def compare(baseline, current, threshold=0.2):
+    regressions = []
+    print(f"{'action':<22} {'base p95':>10} {'new p95':>10} {'change':>8} {'base q':>7} {'new q':>7}")
+    for name, action in current['actions'].items():
+        base = baseline['actions'].get(name)
+        if not base:
+            continue
+        change = action['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        print(f"{name:<22} {base['p95_ms']:>10.2f} {action['p95_ms']:>10.2f} {change:>+8.0%} "
+              f"{base['avg_queries']:>7.2f} {action['avg_queries']:>7.2f}")
+        if change > threshold or action['avg_queries'] > base['avg_queries'] + 0.01:
+            regressions.append(name)
+    return regressions
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        role, _, weight = part.partition('=')
+        if role not in MIX:
+            raise argparse.ArgumentTypeError(f'unknown role {role!r}')
+        mix[role] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed a benchmark database and replay concurrent sessions')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='add synthetic users, complaints and lost items')
+    seed_parser.add_argument('--complaints', type=int, default=10000)
+    seed_parser.add_argument('--students', type=int, help='default: complaints / 20')
+    seed_parser.add_argument('--lost-items', type=int, help='default: complaints / 10')
+    seed_parser.add_argument('--days', type=int, default=365, help='spread created_at over this many days')
+    seed_parser.add_argument('--seed', type=int, default=1)
+
+    run_parser = commands.add_parser('run', help='replay sessions and report latency')
+    run_parser.add_argument('--sessions', type=int, default=8, help='concurrent sessions')
+    run_parser.add_argument('--duration', type=float, default=30, help='seconds')
+    run_parser.add_argument('--mix', type=parse_mix, default=MIX, help='e.g. student=70,officer=20,admin=10')
+    run_parser.add_argument('--workers', type=int, default=2, help='background job threads during the run')
+    run_parser.add_argument('--no-cache', action='store_true', help='disable the query cache')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--out', help='write results as JSON (default: bench-results/<timestamp>.json)')
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2, help='allowed p95 slowdown (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'seed':
+        counts = seed(args.complaints, args.students, args.lost_items, args.days, args.seed)
+        print(f"Seeded {counts}; table sizes now {table_sizes()}")
+        return 0
+
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+        return 1 if regressions else 0
+
+    result = run(args.sessions, args.duration, args.mix, args.seed, not args.no_cache, args.workers)
+    result.update({
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'config': {'sessions': args.sessions, 'duration': args.duration, 'mix': args.mix,
+                   'workers': args.workers, 'cache': not args.no_cache, 'seed': args.seed,
+                   'pool_size': db.POOL_SIZE},
+        'table_sizes': table_sizes(),
+    })
+    print_report(result)
+    out = args.out or os.path.join('bench-results', f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(result, f, indent=2, default=str)
+    print(f'Results written to {out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+import jobs
+
+# Append-only feed of row changes to complaints and lost_items. Writers
+# call record() inside their unit of work; just before commit each changed
+# row gets its version bumped (which also moves updated_at) and one event
+# per row is written with the new version. Readers keep an event id as a
+# cursor and ask for what changed after it.
+
+TABLES = ('complaints', 'lost_items')
+# Most events one since() call returns; a reader that is further behind
+# should reload instead
+MAX_EVENTS = 500
+KEEP_DAYS = 7
+PRUNE_INTERVAL = 3600
+PRUNE_BATCH = 10000
+
+
+# Note that rows of table changed. op is 'insert', 'update' or 'delete';
+# parent_ids adds the linked duplicates of those complaints as updated.
+def record(uow, table, ids=(), op='update', parent_ids=()):
+    if table not in TABLES:
+        raise ValueError(f'no change feed for {table!r}')
+    if not hasattr(uow, 'changes'):
+        uow.changes = {}
+        uow.before_commit(lambda: _flush(uow))
+    ops, parents = uow.changes.setdefault(table, ({}, set()))
+    for row_id in ids:
+        # An insert stays an insert, and a delete wins over anything
+        if op == 'delete' or row_id not in ops:
+            ops[row_id] = op
+    parents.update(parent_ids)
+
+
+def _flush(uow):
+    for table, (ops, parents) in uow.changes.items():
+        deleted = [row_id for row_id, op in ops.items() if op == 'delete']
+        if deleted:
+            uow.executemany("""
+                INSERT INTO change_events (entity, entity_id, op, version)
+                VALUES (%s, %s, 'delete', NULL)
+            """, [(table, row_id) for row_id in deleted])
+        for op in ('insert', 'update'):
+            ids = [row_id for row_id, row_op in ops.items() if row_op == op]
+            conditions, params = [], []
+            if ids:
+                conditions.append(f"id IN ({', '.join(['%s'] * len(ids))})")
+                params += ids
+            if op == 'update' and parents:
+                clause = f"parent_id IN ({', '.join(['%s'] * len(parents))})"
+                params += list(parents)
+                if ops:
+                    # Rows recorded directly already have their event
+                    clause += f" AND id NOT IN ({', '.join(['%s'] * len(ops))})"
+                    params += list(ops)
+                conditions.append(f'({clause})')
+            if not conditions:
+                continue
+            where = ' OR '.join(conditions)
+            if op == 'update':
+                uow.execute(f"UPDATE {table} SET version = version + 1 WHERE {where}", params)
+            uow.execute(f"""
+                INSERT INTO change_events (entity, entity_id, op, version)
+                SELECT %s, id, %s, version FROM {table} WHERE {where}
+            """, [table, op] + params)
+
+
+# Event ids are taken when a row is inserted, not when its transaction
+# commits, so an event with a lower id can become visible after a reader
+# has seen higher ones. Readers only move their cursor past events older
+# than this; newer ones are handed out but also handed out again until they
+# settle. A transaction must commit within CURSOR_LAG of writing its events
+# (ledger.ROLLUP_LAG makes the same assumption).
+CURSOR_LAG = 30
+
+SINCE_SQL = """
+    SELECT id, entity_id, op, changed_at < NOW() - INTERVAL %s SECOND AS settled
+    FROM change_events
+    WHERE entity = %s AND id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+LATEST_SQL = """
+    SELECT id FROM change_events
+    WHERE changed_at < NOW() - INTERVAL %s SECOND
+    ORDER BY changed_at DESC, id DESC
+    LIMIT 1
+"""
+
+
+# Events after cursor as (entity_id, op) in order, and the new cursor.
+# Events newer than CURSOR_LAG may come back on the next call too; callers
+# reread the rows, so seeing one twice is harmless. Returns (None, cursor)
+# when more than MAX_EVENTS are waiting.
+def since(uow, table, cursor):
+    rows = uow.fetchall(SINCE_SQL, (CURSOR_LAG, table, cursor, MAX_EVENTS + 1))
+    if len(rows) > MAX_EVENTS:
+        return None, cursor
+    return [(row['entity_id'], row['op']) for row in rows], settled_cursor(rows, cursor)
+
+
+# The cursor moves over the settled events up to the first unsettled one.
+# An id missing below a settled event was taken even earlier, so its
+# transaction has had CURSOR_LAG to commit and is taken as rolled back.
+def settled_cursor(rows, cursor):
+    for row in rows:
+        if not row['settled']:
+            break
+        cursor = row['id']
+    return cursor
+
+
+# The cursor to start from before loading a list; read it first, so a
+# change made while the list loads is seen again rather than missed. It
+# stops short of the last CURSOR_LAG, which the first since() replays.
+def latest(uow):
+    row = uow.fetchone(LATEST_SQL, (CURSOR_LAG,))
+    return row['id'] if row else 0
+
+
+# Periodic job: drop old events, then schedule the next run. Live readers
+# reload well within KEEP_DAYS, so none can still need them.
+@jobs.handler('prune_changes')
+def prune(uow, payload=None):
+    uow.execute("""
+        DELETE FROM change_events
+        WHERE changed_at < NOW() - INTERVAL %s DAY
+        ORDER BY changed_at
+        LIMIT %s
+    """, (KEEP_DAYS, PRUNE_BATCH))
+    jobs.enqueue(uow, 'prune_changes', {}, delay=PRUNE_INTERVAL)
+
+
+# Patch a cached newest-first page with changed rows (already filtered to
+# the reader's scope) and drop removed ids. Changed rows older than the
+# page's last row belong to a later page unless this is the only page.
+# Returns (rows, next_cursor) like the listing functions.
+def patch(rows, next_cursor, changed, removed, page_size):
+    by_id = {row['id']: row for row in rows}
+    for row_id in removed:
+        by_id.pop(row_id, None)
+    last = (rows[-1]['created_at'], rows[-1]['id']) if rows else None
+    for row in changed:
+        if row['id'] in by_id or next_cursor is None or last is None or (row['created_at'], row['id']) > last:
+            by_id[row['id']] = row
+    rows = sorted(by_id.values(), key=lambda row: (row['created_at'], row['id']), reverse=True)
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = (rows[-1]['created_at'], rows[-1]['id'])
+    return rows, next_cursor
@@ -0,0 +1,228 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+
+import metrics
+
+# Connection settings, overridable from the environment
+DB_CONFIG = {
+    'host': os.environ.get('SBMS_DB_HOST', 'localhost'),
+    'port': int(os.environ.get('SBMS_DB_PORT', '3306')),
+    'user': os.environ.get('SBMS_DB_USER', 'root'),
+    'password': os.environ.get('SBMS_DB_PASSWORD', 'root'),
+    'database': os.environ.get('SBMS_DB_NAME', 'sbms'),
+    'connect_timeout': 30,
+    'autocommit': True,
+}
+
+# Pool settings
+POOL_SIZE = int(os.environ.get('SBMS_POOL_SIZE', '5'))
+POOL_TIMEOUT = float(os.environ.get('SBMS_POOL_TIMEOUT', '10'))
+# Connections idle for longer than this are pinged before being handed out
+POOL_CHECK_IDLE_AFTER = float(os.environ.get('SBMS_POOL_CHECK_IDLE_AFTER', '5'))
+
+
+class PoolTimeout(Error):
+    pass
+
+
+class PooledConnection:
+    # Thin proxy around a MySQL connection; close() hands it back to the pool
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._dirty_session = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            # Session settings changed by the borrower are reset on release
+            self._dirty_session = True
+            setattr(self._conn, name, value)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool._release(self._conn, self._dirty_session)
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# A connection outside the pool, for long reads such as exports
+def connect(**overrides):
+    conn = mysql.connector.connect(**dict(DB_CONFIG, **overrides))
+    metrics.record_connection_opened()
+    return conn
+
+
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, timeout=POOL_TIMEOUT, check_idle_after=POOL_CHECK_IDLE_AFTER, **config):
+        self.size = size
+        self.timeout = timeout
+        self.check_idle_after = check_idle_after
+        self.config = config or dict(DB_CONFIG)
+        # LIFO keeps the warmest connections in use and lets the rest age out
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._opened = 0
+        self._discarded = 0
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.config)
+        with self._lock:
+            self._opened += 1
+        metrics.record_connection_opened()
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+            self._discarded += 1
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def _healthy(self, conn, idle_since):
+        if time.monotonic() - idle_since < self.check_idle_after:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def get_connection(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+        while True:
+            try:
+                conn, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        conn = self._connect()
+                    except Error:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                    break
+                # Pool exhausted: block until a connection is returned
+                if not waited:
+                    waited = True
+                    with self._lock:
+                        self._waits += 1
+                try:
+                    conn, idle_since = self._idle.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                        self._wait_time += time.monotonic() - started
+                    raise PoolTimeout(msg=f'No database connection available after {timeout:.1f}s')
+            if self._healthy(conn, idle_since):
+                break
+            self._discard(conn)
+        with self._lock:
+            self._in_use += 1
+            if waited:
+                self._wait_time += time.monotonic() - started
+        metrics.record_pool_wait(time.monotonic() - started)
+        return PooledConnection(self, conn)
+
+    def _release(self, conn, dirty_session=False):
+        with self._lock:
+            self._in_use -= 1
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if dirty_session:
+                conn.autocommit = self.config.get('autocommit', False)
+        except Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.get_connection(timeout)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': self._created - self._in_use,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'timeouts': self._timeouts,
+                'connections_opened': self._opened,
+                'discarded': self._discarded,
+            }
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pool_metrics():
+    if _pool is None:
+        return []
+    stats = _pool.stats()
+    return [
+        ('sbms_pool_size', 'gauge', 'Configured pool size.', [({}, stats['size'])]),
+        ('sbms_pool_connections', 'gauge', 'Pooled connections by state.',
+         [({'state': 'in_use'}, stats['in_use']), ({'state': 'idle'}, stats['idle'])]),
+        ('sbms_pool_exhausted_waits_total', 'counter', 'Checkouts that found the pool exhausted.',
+         [({}, stats['waits'])]),
+        ('sbms_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting.', [({}, stats['timeouts'])]),
+    ]
+
+
+metrics.register_collector('pool', _pool_metrics)
+
+
+# One pool per process, shared by every Streamlit session and rerun
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
@@ -0,0 +1,93 @@
+import random
+import struct
+import zlib
+
+import matching
+import routing
+
+# MinHash signature of NUM_PERM 32-bit values, split into BANDS bands for
+# LSH. With 32 bands of 3 rows, a pair at 0.5 Jaccard shares a band ~99%
+# of the time, a pair at 0.1 only ~3%, so few unrelated rows are fetched.
+NUM_PERM = 96
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+# Only open complaints filed this recently are duplicate candidates
+WINDOW_DAYS = 7
+# Estimated similarity at which a new complaint is linked to the old one
+LINK_THRESHOLD = 0.45
+MAX_CANDIDATES = 20
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_SIGNATURE = struct.Struct(f'<{NUM_PERM}I')
+
+
+# Word bigrams plus the words themselves, so short titles still shingle
+def shingles(title, description):
+    tokens = matching.tokenize(f'{title} {description}')
+    return set(tokens) | {f'{a} {b}' for a, b in zip(tokens, tokens[1:])}
+
+
+def signature(title, description):
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingles(title, description)]
+    if not hashes:
+        return None
+    return [min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF for a, b in _PERMUTATIONS]
+
+
+def pack(sig):
+    return _SIGNATURE.pack(*sig)
+
+
+def unpack(blob):
+    return _SIGNATURE.unpack(bytes(blob))
+
+
+def similarity(a, b):
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def band_keys(sig):
+    return [(band, zlib.crc32(_SIGNATURE.pack(*sig)[band * ROWS * 4:(band + 1) * ROWS * 4]))
+            for band in range(BANDS)]
+
+
+# LSH rows for a root complaint; created_day keeps lookups to the window
+def index_complaint(uow, complaint_id, category, sig, created):
+    day = matching.time_bucket(created)
+    uow.executemany("""
+        INSERT IGNORE INTO complaint_lsh (category, band, bucket, created_day, complaint_id)
+        VALUES (%s, %s, %s, %s, %s)
+    """, [(category, band, bucket, day, complaint_id) for band, bucket in band_keys(sig)])
+
+
+# The open root complaint this one most likely duplicates, or None. One
+# query: the band lookup finds candidates, the join filters them to open
+# roots and brings their signatures for the similarity check.
+def find_parent(uow, category, sig, now):
+    keys = band_keys(sig)
+    statuses = routing.OPEN_STATUSES
+    rows = uow.fetchall(f"""
+        SELECT c.id, c.status, c.assigned_to, c.minhash
+        FROM (
+            SELECT complaint_id, COUNT(*) AS bands
+            FROM complaint_lsh
+            WHERE category = %s AND (band, bucket) IN ({', '.join(['(%s, %s)'] * len(keys))})
+              AND created_day >= %s
+            GROUP BY complaint_id
+            ORDER BY bands DESC
+            LIMIT %s
+        ) h
+        JOIN complaints c ON c.id = h.complaint_id
+        WHERE c.parent_id IS NULL AND c.status IN ({', '.join(['%s'] * len(statuses))})
+    """, [category] + [value for key in keys for value in key]
+         + [matching.time_bucket(now) - WINDOW_DAYS, MAX_CANDIDATES] + list(statuses))
+    best, best_score = None, LINK_THRESHOLD
+    for row in rows:
+        if row['minhash'] is None:
+            continue
+        score = similarity(sig, unpack(row['minhash']))
+        if score >= best_score:
+            best, best_score = row, score
+    return best
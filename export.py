@@ -0,0 +1,167 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from datetime import date, timedelta
+
+import archive
+import db
+import metrics
+
+# Rows are streamed from an unbuffered cursor CHUNK_SIZE at a time and
+# written straight out, so an export uses the same memory for any size.
+# Each export reads on its own connection rather than holding a pool slot
+# for as long as the file takes to write.
+
+CHUNK_SIZE = 5000
+FORMATS = ('csv', 'jsonl')
+
+# Dataset name -> (FROM clause, columns, has a category column)
+DATASETS = {
+    'complaints': ("""complaints c
+        JOIN users u ON u.id = c.user_id
+        LEFT JOIN users o ON o.id = c.assigned_to
+    """, [
+        ('id', 'c.id'), ('created_at', 'c.created_at'), ('title', 'c.title'),
+        ('description', 'c.description'), ('category', 'c.category'), ('priority', 'c.priority'),
+        ('status', 'c.status'), ('submitted_by', 'u.username'), ('assigned_to', 'o.username'),
+        ('department', 'o.department'), ('parent_id', 'c.parent_id'),
+        ('duplicate_count', 'c.duplicate_count'), ('admin_notes', 'c.admin_notes'),
+        ('officer_notes', 'c.officer_notes'), ('points_awarded', 'c.points_awarded'),
+    ], True),
+    'lost_items': ("""lost_items c
+        JOIN users u ON u.id = c.user_id
+    """, [
+        ('id', 'c.id'), ('created_at', 'c.created_at'), ('item_name', 'c.item_name'),
+        ('description', 'c.description'), ('lost_time', 'c.lost_time'), ('lost_place', 'c.lost_place'),
+        ('status', 'c.status'), ('reported_by', 'u.username'), ('admin_notes', 'c.admin_notes'),
+    ], False),
+}
+# The same exports over the archive tables
+for _name in ('complaints', 'lost_items'):
+    _source, _columns, _has_category = DATASETS[_name]
+    DATASETS[f'archived_{_name}'] = (
+        _source.replace(f'{_name} c', f'{archive.ARCHIVE_TABLES[_name]} c', 1), _columns, _has_category
+    )
+
+
+def columns(dataset):
+    return [name for name, _ in DATASETS[dataset][1]]
+
+
+# SELECT for one dataset; dates are inclusive and filter on created_at.
+# Rows come in (created_at, id) order, which the created_at indexes
+# deliver without a sort.
+def build_query(dataset, date_from=None, date_to=None, statuses=None, categories=None):
+    source, cols, has_category = DATASETS[dataset]
+    if categories and not has_category:
+        raise ValueError(f'{dataset} cannot be filtered by category')
+    conditions, params = [], []
+    if date_from:
+        conditions.append('c.created_at >= %s')
+        params.append(date_from)
+    if date_to:
+        conditions.append('c.created_at < %s')
+        params.append(date_to + timedelta(days=1))
+    if statuses:
+        conditions.append(f"c.status IN ({', '.join(['%s'] * len(statuses))})")
+        params += list(statuses)
+    if categories:
+        conditions.append(f"c.category IN ({', '.join(['%s'] * len(categories))})")
+        params += list(categories)
+    sql = f"""
+        SELECT {', '.join(f'{expr} AS {name}' for name, expr in cols)}
+        FROM {source}
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY c.created_at, c.id
+    """
+    return sql, params
+
+
+# Yield chunks of row tuples in columns() order
+def stream(dataset, **filters):
+    sql, params = build_query(dataset, **filters)
+    conn = db.connect()
+    try:
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        total = 0
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            total += len(rows)
+            yield rows
+        metrics.record_query(sql, time.perf_counter() - started, total)
+    finally:
+        # Closing the connection also drops any unread rows of an
+        # abandoned export
+        conn.close()
+
+
+def _json_value(value):
+    return value.isoformat(sep=' ') if hasattr(value, 'isoformat') else str(value)
+
+
+# Write the export to a binary file object; returns the number of rows
+def write(out, dataset, fmt='csv', compress=False, **filters):
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown format {fmt!r}')
+    names = columns(dataset)
+    raw = gzip.GzipFile(filename='', fileobj=out, mode='wb') if compress else out
+    text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    total = 0
+    try:
+        if fmt == 'csv':
+            writer = csv.writer(text)
+            writer.writerow(names)
+            for rows in stream(dataset, **filters):
+                writer.writerows(rows)
+                total += len(rows)
+        else:
+            for rows in stream(dataset, **filters):
+                text.writelines(json.dumps(dict(zip(names, row)), default=_json_value) + '\n' for row in rows)
+                total += len(rows)
+        text.flush()
+    finally:
+        # Leave the caller's file open
+        text.detach()
+        if compress:
+            raw.close()
+    return total
+
+
+def file_name(dataset, fmt, compress, date_from=None, date_to=None):
+    parts = [dataset] + [day.isoformat() for day in (date_from, date_to) if day]
+    return '_'.join(parts) + f'.{fmt}' + ('.gz' if compress else '')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export complaints or lost items as CSV or JSONL')
+    parser.add_argument('dataset', choices=list(DATASETS))
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--gzip', action='store_true', help='gzip the output')
+    parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='first day (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='last day, inclusive')
+    parser.add_argument('--status', action='append', help='repeat for several statuses')
+    parser.add_argument('--category', action='append', help='complaints only; repeat for several')
+    parser.add_argument('-o', '--output', help='file to write (default: stdout)')
+    args = parser.parse_args(argv)
+
+    filters = dict(date_from=args.date_from, date_to=args.date_to, statuses=args.status, categories=args.category)
+    if args.output:
+        with open(args.output, 'wb') as out:
+            total = write(out, args.dataset, args.format, args.gzip, **filters)
+    else:
+        total = write(sys.stdout.buffer, args.dataset, args.format, args.gzip, **filters)
+        sys.stdout.buffer.flush()
+    print(f'Exported {total} rows', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,410 @@
+import argparse
+import csv
+import gzip
+import io
+import json
+import sys
+import uuid
+from datetime import datetime
+
+from mysql.connector import Error
+
+import changes
+import leaderboard
+import matching
+import query_cache
+import routing
+import sla
+from repository import UnitOfWork
+
+# Bulk loading of users, complaints and lost items from CSV or JSONL.
+# Rows are validated in Python, then each batch is written in one
+# transaction: one lookup resolves every username the batch mentions,
+# routing assigns its open complaints in one pass over the in-process
+# officer table, and each table gets one multi-row INSERT. A row that
+# fails validation is reported and skipped; if the database still rejects
+# a batch, its rows are retried one by one so only the bad ones are lost.
+
+BATCH_SIZE = 1000
+# Errors kept for the report; later ones are only counted
+MAX_ERRORS = 1000
+
+ROLES = ('student', 'officer', 'admin')
+PRIORITIES = ('Urgent', 'High', 'Medium', 'Low')
+COMPLAINT_STATUSES = ('Pending Admin Review', 'In Progress', 'Resolved', 'Closed')
+LOST_ITEM_STATUSES = ('Lost', 'Found', 'Collected')
+FORMATS = ('csv', 'jsonl')
+
+_CATEGORIES = {category.lower(): category for category in routing.CATEGORY_TO_DEPARTMENT}
+_DEPARTMENTS = set(routing.CATEGORY_TO_DEPARTMENT.values())
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(row, field, max_length=None, required=True, default=None):
+    value = row.get(field)
+    value = value.strip() if isinstance(value, str) else value
+    if value in (None, ''):
+        if required:
+            raise RowError(f'{field} is required')
+        return default
+    value = str(value)
+    if max_length and len(value) > max_length:
+        raise RowError(f'{field} is longer than {max_length} characters')
+    return value
+
+
+def _choice(row, field, choices, default=None):
+    value = _text(row, field, required=default is None, default=default)
+    for choice in choices:
+        if value.lower() == choice.lower():
+            return choice
+    raise RowError(f"{field} must be one of {', '.join(choices)}")
+
+
+def _datetime(row, field, required=False):
+    value = _text(row, field, required=required)
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise RowError(f'{field} is not an ISO date/time: {value!r}') from None
+
+
+def _int(row, field, default=0):
+    value = _text(row, field, required=False)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise RowError(f'{field} is not a whole number') from None
+    if value < 0:
+        raise RowError(f'{field} cannot be negative')
+    return value
+
+
+# Each parser turns a raw row into a dict of validated values; usernames
+# are resolved later, per batch
+
+def _parse_user(row):
+    role = _choice(row, 'role', ROLES, default='student')
+    department = _text(row, 'department', 50, required=False)
+    if role == 'officer' and department not in _DEPARTMENTS:
+        raise RowError(f"officers need a department, one of {', '.join(sorted(_DEPARTMENTS))}")
+    return {
+        'username': _text(row, 'username', 80),
+        'password': _text(row, 'password', 120),
+        'role': role,
+        'department': department or ('Student' if role == 'student' else 'Administration'),
+        'points': _int(row, 'points'),
+    }
+
+
+def _parse_complaint(row):
+    category = _text(row, 'category', 50)
+    if category.lower() not in _CATEGORIES:
+        raise RowError(f"unknown category {category!r}")
+    created_at = _datetime(row, 'created_at')
+    resolved_at = _datetime(row, 'resolved_at')
+    if created_at and resolved_at and resolved_at < created_at:
+        raise RowError('resolved_at is before created_at')
+    return {
+        'title': _text(row, 'title', 100),
+        'description': _text(row, 'description'),
+        'category': _CATEGORIES[category.lower()],
+        'priority': _choice(row, 'priority', PRIORITIES, default='Medium'),
+        'status': _choice(row, 'status', COMPLAINT_STATUSES, default='Pending Admin Review'),
+        'created_at': created_at,
+        'resolved_at': resolved_at,
+        'reporter': _text(row, 'reporter', 80),
+        'assigned_to': _text(row, 'assigned_to', 80, required=False),
+        'admin_notes': _text(row, 'admin_notes', required=False),
+        'officer_notes': _text(row, 'officer_notes', required=False),
+    }
+
+
+def _parse_lost_item(row):
+    return {
+        'item_name': _text(row, 'item_name', 100),
+        'description': _text(row, 'description'),
+        'lost_time': _datetime(row, 'lost_time', required=True),
+        'lost_place': _text(row, 'lost_place', 100),
+        'status': _choice(row, 'status', LOST_ITEM_STATUSES, default='Lost'),
+        'created_at': _datetime(row, 'created_at'),
+        'reporter': _text(row, 'reporter', 80),
+        'admin_notes': _text(row, 'admin_notes', required=False),
+    }
+
+
+def _lookup_users(uow, usernames):
+    usernames = list(set(usernames))
+    if not usernames:
+        return {}
+    return {
+        row['username']: row for row in uow.fetchall(f"""
+            SELECT id, username, role FROM users
+            WHERE username IN ({', '.join(['%s'] * len(usernames))})
+        """, usernames)
+    }
+
+
+# The ids of one multi-row INSERT need not be consecutive
+# (innodb_autoinc_lock_mode=2, auto_increment_increment > 1), so each row
+# carries an import key, '<batch>:<line>', and the ids are read back by it.
+# values get the key appended as their last parameter; returns the ids in
+# the order of lines.
+def _insert_keyed(uow, table, sql, lines, values):
+    batch = uuid.uuid4().hex
+    keys = [f'{batch}:{line}' for line in lines]
+    uow.executemany(sql, [tuple(row) + (key,) for row, key in zip(values, keys)])
+    ids = {
+        row['import_key']: row['id'] for row in uow.fetchall(f"""
+            SELECT id, import_key FROM {table}
+            WHERE import_key IN ({', '.join(['%s'] * len(keys))})
+        """, keys)
+    }
+    return [ids[key] for key in keys]
+
+
+# Each loader writes one batch of (line, values) in the given unit of work
+# and returns the errors of rows it had to skip
+
+def _load_users(uow, batch):
+    existing = _lookup_users(uow, [values['username'] for _, values in batch])
+    errors, rows, seen = [], [], set()
+    for line, values in batch:
+        if values['username'] in existing or values['username'] in seen:
+            errors.append((line, f"username {values['username']!r} already exists"))
+            continue
+        seen.add(values['username'])
+        rows.append(values)
+    if not rows:
+        return errors
+    uow.executemany("""
+        INSERT INTO users (username, password, role, department, points)
+        VALUES (%s, %s, %s, %s, %s)
+    """, [(v['username'], v['password'], v['role'], v['department'], v['points']) for v in rows])
+    # Usernames are unique, so they give the new ids back
+    created = _lookup_users(uow, [v['username'] for v in rows])
+    ids = [created[v['username']]['id'] for v in rows]
+    # Imported balances enter the ledger as opening balances, as migration 8
+    # did for existing users, so they count towards all time only
+    balances = [(user_id, v['points']) for user_id, v in zip(ids, rows) if v['points']]
+    if balances:
+        uow.executemany("""
+            INSERT IGNORE INTO points_ledger (user_id, amount, reason, idempotency_key, created_at)
+            VALUES (%s, %s, 'opening_balance', CONCAT('opening_balance:', %s), '2000-01-01')
+        """, [(user_id, points, user_id) for user_id, points in balances])
+
+    def after_commit():
+        routing.get_table().invalidate()
+        leaderboard.get_board().invalidate()
+        query_cache.bump('users', 'points_ledger')
+    uow.after_commit(after_commit)
+    return errors
+
+
+def _load_complaints(uow, batch):
+    users = _lookup_users(uow, [v['reporter'] for _, v in batch] + [v['assigned_to'] for _, v in batch if v['assigned_to']])
+    errors, rows = [], []
+    for line, values in batch:
+        reporter = users.get(values['reporter'])
+        officer = users.get(values['assigned_to']) if values['assigned_to'] else None
+        if reporter is None:
+            errors.append((line, f"unknown reporter {values['reporter']!r}"))
+        elif values['assigned_to'] and (officer is None or officer['role'] != 'officer'):
+            errors.append((line, f"assigned_to {values['assigned_to']!r} is not an officer"))
+        else:
+            rows.append(dict(values, line=line, user_id=reporter['id'], assigned_id=officer['id'] if officer else None))
+    if not rows:
+        return errors
+
+    # Open complaints without an assignee are routed like new submissions
+    table = routing.get_table()
+    unrouted = [v for v in rows if v['assigned_id'] is None and routing.is_open(v['status'])]
+    for values, officer_id in zip(unrouted, table.assign_many(uow, [v['category'] for v in unrouted])):
+        values['assigned_id'] = officer_id
+        if officer_id:
+            values['routed'] = True
+    uow.after_rollback(lambda: [table.release(v['assigned_id']) for v in unrouted if v['assigned_id']])
+
+    # Imported tickets skip process_complaint: legacy rows are not
+    # deduplicated against each other and earn no submission points
+    ids = _insert_keyed(uow, 'complaints', """
+        INSERT INTO complaints (title, description, category, priority, status, created_at, user_id,
+                                assigned_to, admin_notes, officer_notes, points_awarded, processed, import_key)
+        VALUES (%s, %s, %s, %s, %s, COALESCE(%s, NOW()), %s, %s, %s, %s, %s, TRUE, %s)
+    """, [v['line'] for v in rows], [(v['title'], v['description'], v['category'], v['priority'], v['status'], v['created_at'],
+           v['user_id'], v['assigned_id'], v['admin_notes'], v['officer_notes'], v['status'] == 'Resolved')
+          for v in rows])
+    changes.record(uow, 'complaints', ids, 'insert')
+    for complaint_id, v in zip(ids, rows):
+        complaint = dict(v, id=complaint_id)
+        sla.record(uow, complaint, 'opened', to_status='Pending Admin Review', changed_at=v['created_at'])
+        if v['assigned_id']:
+            sla.record(uow, complaint, 'assigned', changed_at=v['created_at'], timed=False)
+        if not routing.is_open(v['status']):
+            sla.record(uow, complaint, 'resolved', 'Pending Admin Review', v['status'],
+                       changed_at=v['resolved_at'] or v['created_at'],
+                       timed=v['resolved_at'] is not None and v['created_at'] is not None)
+        elif v['status'] != 'Pending Admin Review':
+            sla.record(uow, complaint, 'status', 'Pending Admin Review', v['status'], changed_at=v['created_at'])
+
+    def after_commit():
+        # Routed rows were counted by assign_many already
+        for v in rows:
+            if v['assigned_id'] and routing.is_open(v['status']) and not v.get('routed'):
+                table.moved(None, False, v['assigned_id'], True)
+        query_cache.bump('complaints')
+    uow.after_commit(after_commit)
+    return errors
+
+
+def _load_lost_items(uow, batch):
+    users = _lookup_users(uow, [v['reporter'] for _, v in batch])
+    errors, rows = [], []
+    for line, values in batch:
+        reporter = users.get(values['reporter'])
+        if reporter is None:
+            errors.append((line, f"unknown reporter {values['reporter']!r}"))
+        else:
+            rows.append(dict(values, line=line, user_id=reporter['id']))
+    if not rows:
+        return errors
+    ids = _insert_keyed(uow, 'lost_items', """
+        INSERT INTO lost_items (item_name, description, lost_time, lost_place, status, created_at, user_id,
+                                admin_notes, import_key)
+        VALUES (%s, %s, %s, %s, %s, COALESCE(%s, NOW()), %s, %s, %s)
+    """, [v['line'] for v in rows], [(v['item_name'], v['description'], v['lost_time'], v['lost_place'], v['status'], v['created_at'],
+           v['user_id'], v['admin_notes']) for v in rows])
+    changes.record(uow, 'lost_items', ids, 'insert')
+    # Open reports join the matching index so found items can find them
+    tokens = [
+        ('lost', token[:40], matching.time_bucket(v['lost_time']), item_id)
+        for item_id, v in zip(ids, rows) if v['status'] == 'Lost'
+        for token in matching.item_tokens(v['item_name'], v['description'], v['lost_place'])
+    ]
+    uow.executemany("""
+        INSERT IGNORE INTO item_tokens (kind, token, day_bucket, item_id)
+        VALUES (%s, %s, %s, %s)
+    """, tokens)
+    uow.after_commit(lambda: query_cache.bump('lost_items'))
+    return errors
+
+
+DATASETS = {
+    'users': (_parse_user, _load_users),
+    'complaints': (_parse_complaint, _load_complaints),
+    'lost_items': (_parse_lost_item, _load_lost_items),
+}
+
+
+# (line, row dict) from CSV with a header row, or from JSON lines
+def read_rows(text, fmt):
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line, raw in enumerate(text, 1):
+            if not raw.strip():
+                continue
+            try:
+                row = json.loads(raw)
+            except ValueError as e:
+                yield line, RowError(f'invalid JSON: {e}')
+                continue
+            yield line, row if isinstance(row, dict) else RowError('expected a JSON object')
+    else:
+        raise ValueError(f'unknown format {fmt!r}')
+
+
+def format_for(name):
+    name = name[:-3] if name.endswith('.gz') else name
+    return 'jsonl' if name.endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+
+
+class Report:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+
+def _write_batch(load, batch, report):
+    try:
+        with UnitOfWork(f'import_{load.__name__[6:]}') as uow:
+            errors = load(uow, batch)
+    except Error as e:
+        if len(batch) == 1:
+            report.error(batch[0][0], f'database error: {e.msg}')
+            return
+        for item in batch:
+            _write_batch(load, [item], report)
+        return
+    for line, message in errors:
+        report.error(line, message)
+    report.inserted += len(batch) - len(errors)
+
+
+# Load a binary or text file object; returns a Report. Batches that were
+# written stay written if a later one fails.
+def load(fileobj, dataset, fmt='csv', compressed=False, batch_size=BATCH_SIZE):
+    parse, loader = DATASETS[dataset]
+    if compressed:
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    text = fileobj if isinstance(fileobj, io.TextIOBase) else io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    report, batch = Report(), []
+    for line, row in read_rows(text, fmt):
+        try:
+            if isinstance(row, RowError):
+                raise row
+            batch.append((line, parse(row)))
+        except RowError as e:
+            report.error(line, str(e))
+        if len(batch) >= batch_size:
+            _write_batch(loader, batch, report)
+            batch = []
+    if batch:
+        _write_batch(loader, batch, report)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk load users, complaints or lost items from CSV or JSONL')
+    parser.add_argument('dataset', choices=list(DATASETS))
+    parser.add_argument('path', help='.csv or .jsonl file, optionally .gz')
+    parser.add_argument('--format', choices=FORMATS, help='default: from the file name')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--errors', help='also write the rejected rows to this CSV file')
+    args = parser.parse_args(argv)
+
+    started = datetime.now()
+    with open(args.path, 'rb') as f:
+        report = load(f, args.dataset, args.format or format_for(args.path), args.path.endswith('.gz'),
+                      args.batch_size)
+    seconds = (datetime.now() - started).total_seconds()
+    print(f'Loaded {report.inserted} {args.dataset} in {seconds:.1f}s; {report.failed} rows rejected')
+    for line, message in report.errors[:20]:
+        print(f'  line {line}: {message}', file=sys.stderr)
+    if report.failed > 20:
+        print(f'  ... {report.failed - 20} more', file=sys.stderr)
+    if args.errors:
+        with open(args.errors, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['line', 'error'])
+            writer.writerows(report.errors)
+    return 1 if report.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
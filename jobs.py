@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+# Persistent job queue in the jobs table. Writers enqueue inside their own
+# transaction, so a job exists exactly when the change that needs it was
+# committed. Workers claim batches with SKIP LOCKED, and a handler's work
+# commits in the same transaction that marks its job done, so database
+# effects happen once even if a worker dies half way.
+
+WORKERS = int(os.environ.get('SBMS_JOB_WORKERS', '2'))
+BATCH_SIZE = int(os.environ.get('SBMS_JOB_BATCH_SIZE', '10'))
+POLL_INTERVAL = float(os.environ.get('SBMS_JOB_POLL_INTERVAL', '1'))
+MAX_ATTEMPTS = 5
+# First retry after RETRY_DELAY seconds, doubling with each attempt
+RETRY_DELAY = 5
+# A running job whose worker has been silent this long is handed out again
+STALE_AFTER = 300
+# Finished jobs are kept this long for the admin view
+KEEP_DONE_DAYS = 7
+MAINTENANCE_INTERVAL = 60
+# Pause after a worker loop error, e.g. while the database is down
+ERROR_BACKOFF = 10
+
+log = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+# Register fn(uow, payload) as the handler for a job kind
+def handler(kind):
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue(uow, kind, payload, delay=0):
+    cursor = uow.execute("""
+        INSERT INTO jobs (kind, payload, max_attempts, run_after)
+        VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND)
+    """, (kind, json.dumps(payload, default=str), MAX_ATTEMPTS, delay))
+    return cursor.lastrowid
+
+
+# The handlers live in repository, which imports this module
+def _unit_of_work(action, transaction=True):
+    from repository import UnitOfWork
+    return UnitOfWork(action, transaction=transaction)
+
+
+def claim(worker_id, limit=BATCH_SIZE):
+    with _unit_of_work('claim_jobs') as uow:
+        rows = uow.fetchall("""
+            SELECT id, kind, payload, attempts
+            FROM jobs
+            WHERE status = 'queued' AND run_after <= NOW()
+            ORDER BY run_after, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (limit,))
+        if rows:
+            ids = [row['id'] for row in rows]
+            uow.execute(f"""
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, locked_by = %s, locked_at = NOW()
+                WHERE id IN ({', '.join(['%s'] * len(ids))})
+            """, [worker_id] + ids)
+    return rows
+
+
+def run(job):
+    fn = _handlers.get(job['kind'])
+    try:
+        if fn is None:
+            raise LookupError(f"no handler for job kind {job['kind']!r}")
+        with _unit_of_work(f"job:{job['kind']}") as uow:
+            fn(uow, json.loads(job['payload']))
+            uow.execute("""
+                UPDATE jobs SET status = 'done', finished_at = NOW(), last_error = NULL
+                WHERE id = %s
+            """, (job['id'],))
+        return True
+    except Exception as e:
+        log.exception('job %s (%s) failed', job['id'], job['kind'])
+        attempts = job['attempts'] + 1
+        with _unit_of_work('fail_job') as uow:
+            uow.execute("""
+                UPDATE jobs
+                SET status = IF(attempts >= max_attempts, 'failed', 'queued'),
+                    run_after = NOW() + INTERVAL %s SECOND,
+                    last_error = %s, locked_by = NULL, finished_at = NULL
+                WHERE id = %s
+            """, (RETRY_DELAY * 2 ** (attempts - 1), f'{type(e).__name__}: {e}'[:2000], job['id']))
+        return False
+
+
+# Requeue jobs orphaned by a dead worker and drop old finished ones
+def maintain():
+    with _unit_of_work('maintain_jobs', transaction=False) as uow:
+        uow.execute("""
+            UPDATE jobs SET status = 'queued', locked_by = NULL
+            WHERE status = 'running' AND locked_at < NOW() - INTERVAL %s SECOND
+        """, (STALE_AFTER,))
+        uow.execute("""
+            DELETE FROM jobs
+            WHERE status = 'done' AND finished_at < NOW() - INTERVAL %s DAY
+            LIMIT 1000
+        """, (KEEP_DONE_DAYS,))
+
+
+# Claim and run one batch; returns the number of jobs claimed
+def work_once(worker_id):
+    jobs = claim(worker_id)
+    for job in jobs:
+        run(job)
+    return len(jobs)
+
+
+class WorkerPool:
+    # Threads polling the queue. Handlers spend their time in MySQL and
+    # PIL, which both release the GIL.
+    def __init__(self, size=WORKERS, poll_interval=POLL_INTERVAL):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_maintenance = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.size):
+            thread = threading.Thread(target=self._loop, args=(f'{self.name}:{i}',),
+                                      name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _maybe_maintain(self):
+        with self._lock:
+            if time.monotonic() - self._last_maintenance < MAINTENANCE_INTERVAL:
+                return
+            self._last_maintenance = time.monotonic()
+        maintain()
+
+    def _loop(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                self._maybe_maintain()
+                if work_once(worker_id):
+                    continue
+            except Exception:
+                log.exception('job worker %s', worker_id)
+                self._stop.wait(ERROR_BACKOFF)
+                continue
+            self._stop.wait(self.poll_interval)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+# Start this process's worker threads once; SBMS_JOB_WORKERS=0 leaves the
+# work to a separate `python worker.py`
+def start_workers():
+    global _pool
+    if _pool is None and WORKERS > 0:
+        with _pool_lock:
+            if _pool is None:
+                _pool = WorkerPool()
+                _pool.start()
+    return _pool
+
+
+def stats():
+    with _unit_of_work('job_stats', transaction=False) as uow:
+        rows = uow.fetchall("SELECT status, kind, COUNT(*) AS n FROM jobs GROUP BY status, kind")
+    counts = {}
+    for row in rows:
+        counts.setdefault(row['status'], {})[row['kind']] = row['n']
+    return counts
+
+
+def failed(limit=20):
+    with _unit_of_work('failed_jobs', transaction=False) as uow:
+        return uow.fetchall("""
+            SELECT id, kind, payload, attempts, last_error, created_at
+            FROM jobs
+            WHERE status = 'failed'
+            ORDER BY id DESC
+            LIMIT %s
+        """, (limit,))
+
+
+def retry(job_id):
+    with _unit_of_work('retry_job') as uow:
+        cursor = uow.execute("""
+            UPDATE jobs SET status = 'queued', attempts = 0, run_after = NOW(), last_error = NULL
+            WHERE id = %s AND status = 'failed'
+        """, (job_id,))
+        return cursor.rowcount == 1
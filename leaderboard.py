@@ -0,0 +1,98 @@
+import bisect
+import os
+import threading
+import time
+
+import db
+import metrics
+
+LEADERBOARD_SIZE = 10
+# Keep more entries than we show so awards near the cut-off never need a reload
+CAPACITY = int(os.environ.get('SBMS_LEADERBOARD_CAPACITY', '50'))
+# Reload periodically to pick up awards made by other processes
+MAX_AGE = float(os.environ.get('SBMS_LEADERBOARD_MAX_AGE', '60'))
+
+LOAD_SQL = """
+    SELECT id, username, points
+    FROM users
+    WHERE role = 'student'
+    ORDER BY points DESC, id
+    LIMIT %s
+"""
+
+
+class Leaderboard:
+    # Top students kept sorted by (-points, id), the same order as the
+    # loading query, so the cached entries are always an exact prefix of
+    # the full ranking. Points only grow, so a student outside the prefix
+    # can only enter it through record().
+    def __init__(self, capacity=CAPACITY, max_age=MAX_AGE):
+        self.capacity = capacity
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._keys = None
+        self._entries = {}
+        self._loaded_at = 0.0
+
+    def _load(self):
+        with db.get_pool().connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                with metrics.query_timer(LOAD_SQL) as timer:
+                    cursor.execute(LOAD_SQL, (self.capacity,))
+                    rows = timer.result = cursor.fetchall()
+            finally:
+                cursor.close()
+        self._keys = [(-row['points'], row['id']) for row in rows]
+        self._entries = {row['id']: row for row in rows}
+        self._loaded_at = time.monotonic()
+
+    def top(self, n=LEADERBOARD_SIZE):
+        with self._lock:
+            if self._keys is None or time.monotonic() - self._loaded_at > self.max_age:
+                self._load()
+            return [
+                {'username': self._entries[user_id]['username'], 'points': -points, 'role': 'student'}
+                for points, user_id in self._keys[:n]
+            ]
+
+    # Write-through from award_points with the user's new total. The username
+    # is only known for entries already on the board; anyone else who would
+    # enter it (or isn't a student at all) triggers a reload instead.
+    def record(self, user_id, points):
+        with self._lock:
+            if self._keys is None:
+                return
+            # Bound the prefix by its last key before this user's own entry
+            # leaves it; everyone unknown ranks after that key
+            full = len(self._keys) >= self.capacity
+            last = self._keys[-1] if self._keys else None
+            entry = self._entries.pop(user_id, None)
+            if entry is not None:
+                self._keys.remove((-entry['points'], user_id))
+            key = (-points, user_id)
+            if full and last is not None and key > last:
+                if entry is not None:
+                    # Dropped out of the prefix; we no longer know who is next
+                    self._keys = None
+                return
+            if entry is None:
+                self._keys = None
+                return
+            bisect.insort(self._keys, key)
+            self._entries[user_id] = {'id': user_id, 'username': entry['username'], 'points': points}
+            if len(self._keys) > self.capacity:
+                _, evicted = self._keys.pop()
+                del self._entries[evicted]
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = None
+
+
+_board = Leaderboard()
+
+
+def get_board():
+    return _board
+
@@ -0,0 +1,188 @@
+from datetime import date
+
+import jobs
+import leaderboard
+import query_cache
+
+# Every point change is a row in points_ledger; users.points is the running
+# total kept beside it for the all-time board. points_daily and
+# points_monthly are rolled up from the ledger by the rollup_points job,
+# and the windowed boards add the few ledger rows not rolled up yet.
+
+ROLLUP_INTERVAL = 60
+# Only ledger rows older than this are rolled up, so a transaction that
+# took an earlier id but commits later is never skipped
+ROLLUP_LAG = 60
+
+
+# Append a ledger entry to this unit of work. Entries are written with one
+# batched INSERT just before commit; an entry whose key is already in the
+# ledger is dropped, so replaying an award is harmless.
+def record(uow, user_id, amount, reason, complaint_id=None, key=None):
+    if not hasattr(uow, 'ledger_entries'):
+        uow.ledger_entries = []
+        uow.before_commit(lambda: _flush(uow))
+    uow.ledger_entries.append((user_id, amount, reason, complaint_id, key))
+
+
+def _flush(uow):
+    entries, seen = [], set()
+    keys = [entry[4] for entry in uow.ledger_entries if entry[4]]
+    if keys:
+        rows = uow.fetchall(f"""
+            SELECT idempotency_key FROM points_ledger
+            WHERE idempotency_key IN ({', '.join(['%s'] * len(keys))})
+        """, keys)
+        seen = {row['idempotency_key'] for row in rows}
+    for entry in uow.ledger_entries:
+        if entry[4] in seen:
+            continue
+        if entry[4]:
+            seen.add(entry[4])
+        entries.append(entry)
+    if not entries:
+        return
+    uow.executemany("""
+        INSERT INTO points_ledger (user_id, amount, reason, complaint_id, idempotency_key)
+        VALUES (%s, %s, %s, %s, %s)
+    """, entries)
+
+    totals = {}
+    for user_id, amount, *_ in entries:
+        totals[user_id] = totals.get(user_id, 0) + amount
+    if len(totals) == 1:
+        # LAST_INSERT_ID(expr) hands the new total back in the OK packet, so
+        # the leaderboard write-through needs no extra SELECT
+        (user_id, amount), = totals.items()
+        cursor = uow.execute("""
+            UPDATE users
+            SET points = LAST_INSERT_ID(points + %s)
+            WHERE id = %s
+        """, (amount, user_id))
+        if cursor.rowcount:
+            total = cursor.lastrowid
+            uow.after_commit(lambda: leaderboard.get_board().record(user_id, total))
+    else:
+        uow.execute(f"""
+            UPDATE users u
+            JOIN ({' UNION ALL '.join(['SELECT %s AS user_id, %s AS amount'] * len(totals))}) d
+                ON d.user_id = u.id
+            SET u.points = u.points + d.amount
+        """, [value for item in totals.items() for value in item])
+        # Several totals changed at once; reload rather than patch
+        uow.after_commit(lambda: leaderboard.get_board().invalidate())
+    uow.after_commit(lambda: query_cache.bump('users', 'points_ledger'))
+
+
+# Fold ledger rows past the watermark into the daily and monthly tables.
+# The watermark row is locked, so overlapping runs serialize instead of
+# double counting. Ledger ids must grow with created_at, as they do for
+# live inserts; returns the number of ledger rows folded in.
+def rollup_once(uow):
+    last_id = uow.fetchone("SELECT last_id FROM rollup_state WHERE name = 'points' FOR UPDATE")['last_id']
+    row = uow.fetchone("""
+        SELECT id FROM points_ledger
+        WHERE created_at < NOW() - INTERVAL %s SECOND
+        ORDER BY created_at DESC, id DESC
+        LIMIT 1
+    """, (ROLLUP_LAG,))
+    upto = row['id'] if row else last_id
+    if upto <= last_id:
+        return 0
+    # Ids of rolled-back inserts leave gaps, so count the rows themselves
+    folded = uow.fetchone(
+        "SELECT COUNT(*) AS n FROM points_ledger WHERE id > %s AND id <= %s", (last_id, upto)
+    )['n']
+    uow.execute("""
+        INSERT INTO points_daily (day, user_id, points)
+        SELECT DATE(created_at), user_id, SUM(amount)
+        FROM points_ledger
+        WHERE id > %s AND id <= %s
+        GROUP BY DATE(created_at), user_id
+        ON DUPLICATE KEY UPDATE points = points_daily.points + VALUES(points)
+    """, (last_id, upto))
+    uow.execute("""
+        INSERT INTO points_monthly (month, user_id, points)
+        SELECT DATE(created_at) - INTERVAL DAYOFMONTH(created_at) - 1 DAY, user_id, SUM(amount)
+        FROM points_ledger
+        WHERE id > %s AND id <= %s
+        GROUP BY 1, user_id
+        ON DUPLICATE KEY UPDATE points = points_monthly.points + VALUES(points)
+    """, (last_id, upto))
+    uow.execute("UPDATE rollup_state SET last_id = %s WHERE name = 'points'", (upto,))
+    uow.after_commit(lambda: query_cache.bump('points_ledger'))
+    return folded
+
+
+# Periodic job: roll up, then schedule the next run
+@jobs.handler('rollup_points')
+def rollup(uow, payload=None):
+    rollup_once(uow)
+    jobs.enqueue(uow, 'rollup_points', {}, delay=ROLLUP_INTERVAL)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+# Semesters run January-June and July-December
+def semester_start(day):
+    return day.replace(month=1 if day.month <= 6 else 7, day=1)
+
+
+PERIODS = {
+    'month': month_start,
+    'semester': semester_start,
+}
+
+
+# Top students for the period containing today, from the monthly rollup
+# plus the ledger tail past the watermark. Returns dicts like
+# leaderboard.top().
+def top(uow, period, n=leaderboard.LEADERBOARD_SIZE, today=None):
+    start = PERIODS[period](today or date.today())
+    last_id = uow.fetchone("SELECT last_id FROM rollup_state WHERE name = 'points'")['last_id']
+    tail = {
+        row['user_id']: row['points'] for row in uow.fetchall("""
+            SELECT user_id, SUM(amount) AS points
+            FROM points_ledger
+            WHERE id > %s AND created_at >= %s
+            GROUP BY user_id
+        """, (last_id, start))
+    }
+    # Anyone in the tail could overtake the rolled-up top n, so fetch that
+    # many extra rows and the tail users' own rolled-up totals. Ties break
+    # on user_id here as in the ranking below, so the prefix matches it.
+    totals = {}
+    rows = uow.fetchall("""
+        SELECT user_id, SUM(points) AS points
+        FROM points_monthly
+        WHERE month >= %s
+        GROUP BY user_id
+        ORDER BY points DESC, user_id
+        LIMIT %s
+    """, (start, n + len(tail)))
+    if tail:
+        rows += uow.fetchall(f"""
+            SELECT user_id, SUM(points) AS points
+            FROM points_monthly
+            WHERE month >= %s AND user_id IN ({', '.join(['%s'] * len(tail))})
+            GROUP BY user_id
+        """, [start] + list(tail))
+    for row in rows:
+        totals[row['user_id']] = int(row['points'])
+    for user_id, points in tail.items():
+        totals[user_id] = totals.get(user_id, 0) + int(points)
+    ranked = sorted(((-points, user_id) for user_id, points in totals.items() if points > 0))[:n]
+    if not ranked:
+        return []
+    names = {
+        row['id']: row['username'] for row in uow.fetchall(f"""
+            SELECT id, username FROM users
+            WHERE role = 'student' AND id IN ({', '.join(['%s'] * len(ranked))})
+        """, [user_id for _, user_id in ranked])
+    }
+    return [
+        {'username': names[user_id], 'points': -points, 'role': 'student'}
+        for points, user_id in ranked if user_id in names
+    ]
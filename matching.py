@@ -0,0 +1,167 @@
+import re
+
+from PIL import Image
+
+# Lost reports are matched against found items that turned up at most this
+# many days after the loss (and a day before, for clock and entry slack)
+MATCH_WINDOW_DAYS = 14
+MAX_CANDIDATES = 50
+MAX_MATCHES = 5
+MIN_SCORE = 0.3
+# Tokens indexed per item; the name goes first so it always fits
+MAX_TOKENS = 40
+
+WEIGHTS = {'text': 0.5, 'place': 0.2, 'time': 0.2, 'image': 0.1}
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'from', 'has', 'have', 'i', 'in',
+    'is', 'it', 'its', 'my', 'near', 'of', 'on', 'or', 'the', 'there', 'this', 'to', 'was', 'with',
+}
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall((text or '').lower()):
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        # Cheap plural folding so "keys" finds "key"
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def item_tokens(name, description, place):
+    seen = []
+    for token in tokenize(name) + tokenize(place) + tokenize(description):
+        if token not in seen:
+            seen.append(token)
+    return seen[:MAX_TOKENS]
+
+
+# Whole days since 0001-01-01; the unit of the time-bucket index
+def time_bucket(when):
+    return when.toordinal()
+
+
+def jaccard(a, b):
+    a, b = set(a), set(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# 64-bit difference hash: robust to resizing and re-encoding
+def image_hash(path):
+    with Image.open(path) as image:
+        pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def hash_similarity(a, b):
+    return 1.0 - bin(a ^ b).count('1') / 64
+
+
+# Score a lost report against a found item, both dicts with name,
+# description, place, time and image_hash keys
+def score(lost, found):
+    lost_days = (found['time'] - lost['time']).total_seconds() / 86400
+    if lost_days < -1 or lost_days > MATCH_WINDOW_DAYS:
+        return None
+    parts = {
+        'text': jaccard(tokenize(lost['name']) + tokenize(lost['description']),
+                        tokenize(found['name']) + tokenize(found['description'])),
+        'place': jaccard(tokenize(lost['place']), tokenize(found['place'])),
+        'time': 1.0 - max(lost_days, 0) / MATCH_WINDOW_DAYS,
+    }
+    # Name overlap matters most; give it a floor inside the text score
+    parts['text'] = max(parts['text'], 0.8 * jaccard(tokenize(lost['name']), tokenize(found['name'])))
+    weights = dict(WEIGHTS)
+    if lost.get('image_hash') is not None and found.get('image_hash') is not None:
+        parts['image'] = hash_similarity(lost['image_hash'], found['image_hash'])
+    else:
+        del weights['image']
+    total = sum(weights[k] * parts[k] for k in weights) / sum(weights.values())
+    return round(total, 4), parts
+
+
+# Both sides of the match: table, columns and the status an item must still
+# have to be worth proposing
+SIDES = {
+    'lost': ('lost_items', 'lost_time', 'lost_place', 'Lost'),
+    'found': ('found_items', 'found_time', 'found_place', 'Unclaimed'),
+}
+OTHER = {'lost': 'found', 'found': 'lost'}
+
+
+# Record an item's tokens under its day bucket. The primary key
+# (kind, token, day_bucket, item_id) is what candidate lookups range-scan.
+def index_item(uow, kind, item_id, tokens, when):
+    bucket = time_bucket(when)
+    uow.executemany("""
+        INSERT IGNORE INTO item_tokens (kind, token, day_bucket, item_id)
+        VALUES (%s, %s, %s, %s)
+    """, [(kind, token[:40], bucket, item_id) for token in tokens])
+
+
+# Items of the other kind sharing tokens with this one inside the time
+# window, most shared tokens first
+def candidates(uow, kind, tokens, when):
+    if not tokens:
+        return []
+    bucket = time_bucket(when)
+    # A found item can only turn up after the loss, give or take a day
+    if kind == 'lost':
+        first, last = bucket - 1, bucket + MATCH_WINDOW_DAYS
+    else:
+        first, last = bucket - MATCH_WINDOW_DAYS, bucket + 1
+    placeholders = ', '.join(['%s'] * len(tokens))
+    rows = uow.fetchall(f"""
+        SELECT item_id, COUNT(*) AS shared
+        FROM item_tokens
+        WHERE kind = %s AND token IN ({placeholders}) AND day_bucket BETWEEN %s AND %s
+        GROUP BY item_id
+        ORDER BY shared DESC, item_id DESC
+        LIMIT %s
+    """, [OTHER[kind]] + [token[:40] for token in tokens] + [first, last, MAX_CANDIDATES])
+    return [row['item_id'] for row in rows]
+
+
+# Index a newly reported item and store its best matches against open items
+# of the other kind. item has id, name, description, place, time and
+# image_hash. Returns [(other_id, score)], best first.
+def match_item(uow, kind, item):
+    tokens = item_tokens(item['name'], item['description'], item['place'])
+    index_item(uow, kind, item['id'], tokens, item['time'])
+    ids = candidates(uow, kind, tokens, item['time'])
+    if not ids:
+        return []
+    table, time_column, place_column, open_status = SIDES[OTHER[kind]]
+    placeholders = ', '.join(['%s'] * len(ids))
+    rows = uow.fetchall(f"""
+        SELECT id, item_name AS name, description, {place_column} AS place,
+               {time_column} AS time, image_hash
+        FROM {table}
+        WHERE id IN ({placeholders}) AND status = %s
+    """, ids + [open_status])
+    scored = []
+    for row in rows:
+        result = score(item, row) if kind == 'lost' else score(row, item)
+        if result and result[0] >= MIN_SCORE:
+            scored.append((row['id'], result[0]))
+    scored.sort(key=lambda match: (-match[1], -match[0]))
+    scored = scored[:MAX_MATCHES]
+    uow.executemany("""
+        INSERT INTO item_matches (lost_id, found_id, score)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE score = VALUES(score)
+    """, [
+        (item['id'], other_id, value) if kind == 'lost' else (other_id, item['id'], value)
+        for other_id, value in scored
+    ])
+    return scored
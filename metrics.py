@@ -0,0 +1,264 @@
+import bisect
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Query, pool and render instrumentation. Every call updates a few
+# counters; result sizes are only measured and statements only sampled
+# when SBMS_QUERY_SAMPLE_RATE is above zero. Statements slower than
+# SBMS_SLOW_QUERY_MS are always kept with their SQL text.
+
+SAMPLE_RATE = float(os.environ.get('SBMS_QUERY_SAMPLE_RATE', '0'))
+SLOW_QUERY_SECONDS = float(os.environ.get('SBMS_SLOW_QUERY_MS', '200')) / 1000
+METRICS_PORT = int(os.environ.get('SBMS_METRICS_PORT', '0'))
+SAMPLES_KEPT = 200
+RERUNS_KEPT = 100
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_local = threading.local()
+_totals = {
+    'queries': 0, 'query_seconds': 0.0, 'rows': 0, 'bytes': 0,
+    'pool_waits': 0, 'pool_wait_seconds': 0.0, 'connections_opened': 0,
+    'renders': 0, 'render_seconds': 0.0, 'reruns': 0, 'rerun_seconds': 0.0,
+}
+_query_buckets = [0] * (len(BUCKETS) + 1)
+_rerun_buckets = [0] * (len(BUCKETS) + 1)
+_samples = deque(maxlen=SAMPLES_KEPT)
+_reruns = deque(maxlen=RERUNS_KEPT)
+_collectors = {}
+
+
+class Rerun:
+    # Totals for one script run on this thread, plus the fragment reruns
+    # that follow it until the next full run
+    def __init__(self, label):
+        self.label = label
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.seconds = None
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.pool_wait_seconds = 0.0
+        self.connections_opened = 0
+        self.renders = 0
+        self.render_seconds = 0.0
+
+    def as_dict(self):
+        return {key: value for key, value in vars(self).items() if not key.startswith('_')}
+
+
+def _observe(buckets, seconds):
+    buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+
+def begin_rerun(label):
+    rerun = Rerun(label)
+    _local.rerun = rerun
+    with _lock:
+        _reruns.append(rerun)
+    return rerun
+
+
+def end_rerun():
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is None or rerun.seconds is not None:
+        return
+    rerun.seconds = time.perf_counter() - rerun._started
+    with _lock:
+        _totals['reruns'] += 1
+        _totals['rerun_seconds'] += rerun.seconds
+        _observe(_rerun_buckets, rerun.seconds)
+
+
+def current_rerun():
+    return getattr(_local, 'rerun', None)
+
+
+def _result_bytes(rows):
+    size = 0
+    for row in rows:
+        for value in (row.values() if isinstance(row, dict) else row):
+            size += len(value) if isinstance(value, (str, bytes, bytearray)) else 8
+    return size
+
+
+# rows is the number of rows returned or affected; result, when given, is
+# the fetched rows and is only walked for its size while sampling is on
+def record_query(sql, seconds, rows, result=None):
+    size = _result_bytes(result) if SAMPLE_RATE and result else 0
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is not None:
+        rerun.queries += 1
+        rerun.query_seconds += seconds
+        rerun.rows += rows
+        rerun.bytes += size
+    with _lock:
+        _totals['queries'] += 1
+        _totals['query_seconds'] += seconds
+        _totals['rows'] += rows
+        _totals['bytes'] += size
+        _observe(_query_buckets, seconds)
+        slow = seconds >= SLOW_QUERY_SECONDS
+        if slow or (SAMPLE_RATE and random.random() < SAMPLE_RATE):
+            _samples.append({
+                'at': time.time(), 'ms': 1000 * seconds, 'rows': rows, 'bytes': size, 'slow': slow,
+                'rerun': rerun.label if rerun else None, 'sql': ' '.join(sql.split()),
+            })
+
+
+class query_timer:
+    # Times a statement run on a raw cursor outside a UnitOfWork; set
+    # .result to the fetched row or rows inside the block
+    def __init__(self, sql):
+        self.sql = sql
+        self.result = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            rows = self.result if isinstance(self.result, list) else [self.result] if self.result else []
+            record_query(self.sql, time.perf_counter() - self._started, len(rows), rows)
+        return False
+
+
+def record_pool_wait(seconds):
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is not None:
+        rerun.pool_wait_seconds += seconds
+    with _lock:
+        _totals['pool_waits'] += 1
+        _totals['pool_wait_seconds'] += seconds
+
+
+def record_connection_opened():
+    rerun = getattr(_local, 'rerun', None)
+    if rerun is not None:
+        rerun.connections_opened += 1
+    with _lock:
+        _totals['connections_opened'] += 1
+
+
+@contextmanager
+def render_timer():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        rerun = getattr(_local, 'rerun', None)
+        if rerun is not None:
+            rerun.renders += 1
+            rerun.render_seconds += seconds
+        with _lock:
+            _totals['renders'] += 1
+            _totals['render_seconds'] += seconds
+
+
+def recent_reruns():
+    with _lock:
+        return [rerun.as_dict() for rerun in reversed(_reruns)]
+
+
+def samples():
+    with _lock:
+        return list(reversed(_samples))
+
+
+# Register fn() -> [(name, type, help, [(labels dict, value)])] to be
+# included in the Prometheus dump; re-registering a name replaces it
+def register_collector(name, fn):
+    _collectors[name] = fn
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in labels.items()) + '}'
+
+
+def _histogram(lines, name, help_text, buckets, total, count):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    cumulative = 0
+    for bound, n in zip(BUCKETS + (float('inf'),), buckets):
+        cumulative += n
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f'{name}_bucket{{le="{le}"}} {cumulative}')
+    lines.append(f'{name}_sum {total}')
+    lines.append(f'{name}_count {count}')
+
+
+# Prometheus text exposition format
+def prometheus_text():
+    with _lock:
+        totals = dict(_totals)
+        query_buckets = list(_query_buckets)
+        rerun_buckets = list(_rerun_buckets)
+    lines = []
+    _histogram(lines, 'sbms_db_query_seconds', 'Database statement latency.',
+               query_buckets, totals['query_seconds'], totals['queries'])
+    _histogram(lines, 'sbms_rerun_seconds', 'Streamlit script run duration.',
+               rerun_buckets, totals['rerun_seconds'], totals['reruns'])
+    for name, key, help_text in (
+        ('sbms_db_rows_total', 'rows', 'Rows returned or affected.'),
+        ('sbms_db_result_bytes_total', 'bytes', 'Approximate result bytes (measured while sampling).'),
+        ('sbms_pool_checkouts_total', 'pool_waits', 'Connections checked out of the pool.'),
+        ('sbms_pool_wait_seconds_total', 'pool_wait_seconds', 'Time spent waiting for a pooled connection.'),
+        ('sbms_pool_connections_opened_total', 'connections_opened', 'New database connections opened.'),
+        ('sbms_image_renders_total', 'renders', 'Image renditions served.'),
+        ('sbms_image_render_seconds_total', 'render_seconds', 'Time spent serving image renditions.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter', f'{name} {totals[key]}']
+    for fn in list(_collectors.values()):
+        for name, kind, help_text, values in fn():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            lines += [f'{name}{_format_labels(labels)} {value}' for labels, value in values]
+    return '\n'.join(lines) + '\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+# Serve /metrics on localhost once per process when SBMS_METRICS_PORT is set
+def start_server(port=METRICS_PORT):
+    global _server
+    if _server is None and port:
+        with _server_lock:
+            if _server is None:
+                try:
+                    _server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+                except OSError:
+                    log.exception('cannot serve metrics on port %s', port)
+                    return None
+                threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+    return _server
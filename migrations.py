@@ -0,0 +1,701 @@
+import argparse
+import sys
+
+import changes
+import db
+import dedupe
+import leaderboard
+import matching
+import repository
+import routing
+
+# Each migration is (version, description, steps). A step is either a SQL
+# statement or a callable taking a cursor. Steps must be safe to re-run,
+# since MySQL commits DDL implicitly and a migration can stop half way.
+
+
+def add_index(table, name, columns, kind='INDEX'):
+    def step(cursor):
+        cursor.execute("""
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            LIMIT 1
+        """, (table, name))
+        if cursor.fetchone() is None:
+            cursor.execute(f"ALTER TABLE {table} ADD {kind} {name} ({columns})")
+    return step
+
+
+def drop_index(table, name):
+    def step(cursor):
+        cursor.execute("""
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+            LIMIT 1
+        """, (table, name))
+        if cursor.fetchone() is not None:
+            cursor.execute(f"ALTER TABLE {table} DROP INDEX {name}")
+    return step
+
+
+def add_column(table, name, definition):
+    def step(cursor):
+        cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+            LIMIT 1
+        """, (table, name))
+        if cursor.fetchone() is None:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+    return step
+
+
+# Token-index the lost reports that predate the matching engine
+def index_existing_lost_items(cursor):
+    cursor.execute("SELECT id, item_name, description, lost_place, lost_time FROM lost_items")
+    rows = []
+    for item_id, name, description, place, lost_time in cursor.fetchall():
+        bucket = matching.time_bucket(lost_time)
+        rows += [('lost', token[:40], bucket, item_id)
+                 for token in matching.item_tokens(name, description, place)]
+    for start in range(0, len(rows), 1000):
+        cursor.executemany("""
+            INSERT IGNORE INTO item_tokens (kind, token, day_bucket, item_id)
+            VALUES (%s, %s, %s, %s)
+        """, rows[start:start + 1000])
+
+
+# Signatures and LSH rows for the open complaints inside the dedupe window
+def index_open_complaints(cursor):
+    cursor.execute("""
+        SELECT id, title, description, category, created_at FROM complaints
+        WHERE parent_id IS NULL AND status IN ('Pending Admin Review', 'In Progress')
+          AND created_at >= NOW() - INTERVAL %s DAY
+    """, (dedupe.WINDOW_DAYS,))
+    for complaint_id, title, description, category, created_at in cursor.fetchall():
+        sig = dedupe.signature(title, description)
+        if sig is None:
+            continue
+        cursor.execute("UPDATE complaints SET minhash = %s WHERE id = %s", (dedupe.pack(sig), complaint_id))
+        day = matching.time_bucket(created_at)
+        cursor.executemany("""
+            INSERT IGNORE INTO complaint_lsh (category, band, bucket, created_day, complaint_id)
+            VALUES (%s, %s, %s, %s, %s)
+        """, [(category, band, bucket, day, complaint_id) for band, bucket in dedupe.band_keys(sig)])
+
+
+# Lifecycle events for existing tickets. Their history was never kept, so
+# they open at created_at and carry no durations; the rollups pick them up
+# like any other events.
+def backfill_sla_events(cursor):
+    mapping = list(routing.CATEGORY_TO_DEPARTMENT.items())
+    department = f"CASE category {' '.join(['WHEN %s THEN %s'] * len(mapping))} ELSE 'Other' END"
+    params = [value for pair in mapping for value in pair]
+    for kind, condition in (
+        ('opened', 'TRUE'),
+        ('assigned', 'assigned_to IS NOT NULL'),
+        ('resolved', "status NOT IN ('Pending Admin Review', 'In Progress')"),
+    ):
+        cursor.execute(f"""
+            INSERT INTO sla_events (complaint_id, kind, to_status, department, category, priority, changed_at)
+            SELECT id, %s, IF(%s = 'resolved', status, NULL), {department}, category, priority, created_at
+            FROM complaints
+            WHERE parent_id IS NULL AND {condition}
+              AND NOT EXISTS (SELECT 1 FROM sla_events e WHERE e.complaint_id = complaints.id AND e.kind = %s)
+            ORDER BY id
+        """, [kind, kind] + params + [kind])
+
+
+MIGRATIONS = [
+    (1, 'initial schema', [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(80) UNIQUE NOT NULL,
+            password VARCHAR(120) NOT NULL,
+            role VARCHAR(20) NOT NULL,
+            department VARCHAR(50),
+            points INT DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS complaints (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            title VARCHAR(100) NOT NULL,
+            description TEXT NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            priority VARCHAR(20) NOT NULL,
+            status VARCHAR(20) DEFAULT 'Pending Admin Review',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            user_id INT NOT NULL,
+            assigned_to INT,
+            admin_notes TEXT,
+            officer_notes TEXT,
+            image_path VARCHAR(255),
+            points_awarded BOOLEAN DEFAULT FALSE,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (assigned_to) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS lost_items (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            item_name VARCHAR(100) NOT NULL,
+            description TEXT NOT NULL,
+            lost_time DATETIME NOT NULL,
+            lost_place VARCHAR(100) NOT NULL,
+            status VARCHAR(20) DEFAULT 'Lost',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            user_id INT NOT NULL,
+            admin_notes TEXT,
+            image_path VARCHAR(255),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+    ]),
+    (2, 'indexes for listing, leaderboard and routing queries', [
+        add_index('complaints', 'idx_complaints_created', 'created_at, id'),
+        add_index('complaints', 'idx_complaints_assignee_created', 'assigned_to, created_at, id'),
+        add_index('complaints', 'idx_complaints_user_created', 'user_id, created_at, id'),
+        add_index('lost_items', 'idx_lost_items_created', 'created_at, id'),
+        add_index('lost_items', 'idx_lost_items_user_created', 'user_id, created_at, id'),
+        add_index('users', 'idx_users_role_points', 'role, points'),
+        add_index('users', 'idx_users_role_department', 'role, department'),
+    ]),
+    (3, 'enum status columns and status-filtered listing indexes', [
+        """
+        ALTER TABLE complaints MODIFY status
+            ENUM('Pending Admin Review', 'In Progress', 'Resolved', 'Closed')
+            NOT NULL DEFAULT 'Pending Admin Review'
+        """,
+        """
+        ALTER TABLE lost_items MODIFY status
+            ENUM('Lost', 'Found', 'Collected')
+            NOT NULL DEFAULT 'Lost'
+        """,
+        add_index('complaints', 'idx_complaints_user_status_created', 'user_id, status, created_at, id'),
+        add_index('complaints', 'idx_complaints_status_created', 'status, created_at, id'),
+    ]),
+    (4, 'full-text indexes for complaint and lost item search', [
+        add_index('complaints', 'ft_complaints_text', 'title, description, admin_notes, officer_notes', kind='FULLTEXT INDEX'),
+        add_index('lost_items', 'ft_lost_items_text', 'item_name, description, lost_place', kind='FULLTEXT INDEX'),
+    ]),
+    (5, 'found items and lost-and-found matching indexes', [
+        """
+        CREATE TABLE IF NOT EXISTS found_items (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            item_name VARCHAR(100) NOT NULL,
+            description TEXT NOT NULL,
+            found_time DATETIME NOT NULL,
+            found_place VARCHAR(100) NOT NULL,
+            status ENUM('Unclaimed', 'Matched', 'Returned') NOT NULL DEFAULT 'Unclaimed',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            user_id INT NOT NULL,
+            image_path VARCHAR(255),
+            image_hash BIGINT UNSIGNED,
+            lost_item_id INT,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (lost_item_id) REFERENCES lost_items(id),
+            INDEX idx_found_items_status_created (status, created_at, id)
+        )
+        """,
+        add_column('lost_items', 'image_hash', 'BIGINT UNSIGNED'),
+        """
+        CREATE TABLE IF NOT EXISTS item_tokens (
+            kind ENUM('lost', 'found') NOT NULL,
+            token VARCHAR(40) NOT NULL,
+            day_bucket INT NOT NULL,
+            item_id INT NOT NULL,
+            PRIMARY KEY (kind, token, day_bucket, item_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS item_matches (
+            lost_id INT NOT NULL,
+            found_id INT NOT NULL,
+            score FLOAT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (lost_id, found_id),
+            INDEX idx_item_matches_found_score (found_id, score),
+            FOREIGN KEY (lost_id) REFERENCES lost_items(id) ON DELETE CASCADE,
+            FOREIGN KEY (found_id) REFERENCES found_items(id) ON DELETE CASCADE
+        )
+        """,
+        index_existing_lost_items,
+    ]),
+    (6, 'near-duplicate complaint signatures and parent links', [
+        add_column('complaints', 'parent_id', 'INT NULL'),
+        add_column('complaints', 'duplicate_count', 'INT NOT NULL DEFAULT 0'),
+        add_column('complaints', 'minhash', 'VARBINARY(384) NULL'),
+        add_index('complaints', 'idx_complaints_parent', 'parent_id'),
+        """
+        CREATE TABLE IF NOT EXISTS complaint_lsh (
+            category VARCHAR(50) NOT NULL,
+            band TINYINT UNSIGNED NOT NULL,
+            bucket INT UNSIGNED NOT NULL,
+            created_day INT NOT NULL,
+            complaint_id INT NOT NULL,
+            PRIMARY KEY (category, band, bucket, created_day, complaint_id)
+        )
+        """,
+        index_open_complaints,
+    ]),
+    (7, 'background job queue', [
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            kind VARCHAR(40) NOT NULL,
+            payload TEXT NOT NULL,
+            status ENUM('queued', 'running', 'done', 'failed') NOT NULL DEFAULT 'queued',
+            attempts INT NOT NULL DEFAULT 0,
+            max_attempts INT NOT NULL DEFAULT 5,
+            run_after DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            locked_by VARCHAR(100),
+            locked_at DATETIME,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME,
+            INDEX idx_jobs_status_run_after (status, run_after, id)
+        )
+        """,
+        # Rows from before the queue count as processed; new ones are
+        # inserted unprocessed and finished by the process_complaint job
+        add_column('complaints', 'processed', 'BOOLEAN NOT NULL DEFAULT TRUE'),
+    ]),
+    (8, 'points ledger with daily and monthly rollups', [
+        """
+        CREATE TABLE IF NOT EXISTS points_ledger (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            user_id INT NOT NULL,
+            amount INT NOT NULL,
+            reason VARCHAR(40) NOT NULL,
+            complaint_id INT,
+            idempotency_key VARCHAR(100),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uq_points_ledger_key (idempotency_key),
+            INDEX idx_points_ledger_created (created_at, id),
+            INDEX idx_points_ledger_user_created (user_id, created_at),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS points_daily (
+            day DATE NOT NULL,
+            user_id INT NOT NULL,
+            points INT NOT NULL,
+            PRIMARY KEY (day, user_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS points_monthly (
+            month DATE NOT NULL,
+            user_id INT NOT NULL,
+            points INT NOT NULL,
+            PRIMARY KEY (month, user_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name VARCHAR(40) PRIMARY KEY,
+            last_id BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        "INSERT IGNORE INTO rollup_state (name, last_id) VALUES ('points', 0)",
+        # Existing balances enter the ledger dated before any window, so they
+        # count towards all time only
+        """
+        INSERT IGNORE INTO points_ledger (user_id, amount, reason, idempotency_key, created_at)
+        SELECT id, points, 'opening_balance', CONCAT('opening_balance:', id), '2000-01-01'
+        FROM users
+        WHERE points <> 0
+        """,
+        # Start the self-rescheduling rollup
+        """
+        INSERT INTO jobs (kind, payload)
+        SELECT 'rollup_points', '{}' FROM DUAL
+        WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind = 'rollup_points' AND status IN ('queued', 'running'))
+        """,
+    ]),
+    (9, 'complaint lifecycle events with SLA rollups', [
+        """
+        CREATE TABLE IF NOT EXISTS sla_events (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            complaint_id INT NOT NULL,
+            kind ENUM('opened', 'assigned', 'status', 'resolved', 'reopened') NOT NULL,
+            from_status VARCHAR(20),
+            to_status VARCHAR(20),
+            department VARCHAR(50) NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            priority VARCHAR(20) NOT NULL,
+            seconds INT,
+            changed_at DATETIME NOT NULL,
+            recorded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_sla_events_recorded (recorded_at, id),
+            INDEX idx_sla_events_complaint (complaint_id, id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sla_hourly (
+            hour DATETIME NOT NULL,
+            department VARCHAR(50) NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            priority VARCHAR(20) NOT NULL,
+            opened INT NOT NULL DEFAULT 0,
+            assigned INT NOT NULL DEFAULT 0,
+            resolved INT NOT NULL DEFAULT 0,
+            reopened INT NOT NULL DEFAULT 0,
+            assign_seconds BIGINT NOT NULL DEFAULT 0,
+            assign_timed INT NOT NULL DEFAULT 0,
+            resolve_seconds BIGINT NOT NULL DEFAULT 0,
+            resolve_timed INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, department, category, priority)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sla_daily (
+            day DATE NOT NULL,
+            department VARCHAR(50) NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            priority VARCHAR(20) NOT NULL,
+            opened INT NOT NULL DEFAULT 0,
+            assigned INT NOT NULL DEFAULT 0,
+            resolved INT NOT NULL DEFAULT 0,
+            reopened INT NOT NULL DEFAULT 0,
+            assign_seconds BIGINT NOT NULL DEFAULT 0,
+            assign_timed INT NOT NULL DEFAULT 0,
+            resolve_seconds BIGINT NOT NULL DEFAULT 0,
+            resolve_timed INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, department, category, priority)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sla_durations (
+            day DATE NOT NULL,
+            department VARCHAR(50) NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            priority VARCHAR(20) NOT NULL,
+            kind ENUM('assigned', 'resolved') NOT NULL,
+            bucket SMALLINT NOT NULL,
+            n INT NOT NULL,
+            PRIMARY KEY (day, department, category, priority, kind, bucket)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sla_backlog (
+            department VARCHAR(50) NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            priority VARCHAR(20) NOT NULL,
+            open_count INT NOT NULL,
+            PRIMARY KEY (department, category, priority)
+        )
+        """,
+        "INSERT IGNORE INTO rollup_state (name, last_id) VALUES ('sla', 0)",
+        backfill_sla_events,
+        """
+        INSERT INTO jobs (kind, payload)
+        SELECT 'rollup_sla', '{}' FROM DUAL
+        WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind = 'rollup_sla' AND status IN ('queued', 'running'))
+        """,
+    ]),
+    (10, 'row versions and the change feed', [
+        add_column('complaints', 'version', 'BIGINT NOT NULL DEFAULT 1'),
+        add_column('complaints', 'updated_at', 'DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'),
+        add_column('lost_items', 'version', 'BIGINT NOT NULL DEFAULT 1'),
+        add_column('lost_items', 'updated_at', 'DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP'),
+        """
+        CREATE TABLE IF NOT EXISTS change_events (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            entity ENUM('complaints', 'lost_items') NOT NULL,
+            entity_id INT NOT NULL,
+            op ENUM('insert', 'update', 'delete') NOT NULL,
+            version BIGINT,
+            changed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_change_events_entity (entity, id),
+            INDEX idx_change_events_changed (changed_at)
+        )
+        """,
+        """
+        INSERT INTO jobs (kind, payload)
+        SELECT 'prune_changes', '{}' FROM DUAL
+        WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind = 'prune_changes' AND status IN ('queued', 'running'))
+        """,
+    ]),
+    # Partitioned tables take no foreign keys or FULLTEXT indexes, and the
+    # partitioning column must be in the primary key. The archive job splits
+    # monthly partitions off p_future as it needs them.
+    (11, 'month-partitioned archive tables', [
+        """
+        CREATE TABLE IF NOT EXISTS complaints_archive (
+            id INT NOT NULL,
+            title VARCHAR(100) NOT NULL,
+            description TEXT NOT NULL,
+            category VARCHAR(50) NOT NULL,
+            priority VARCHAR(20) NOT NULL,
+            status ENUM('Pending Admin Review', 'In Progress', 'Resolved', 'Closed') NOT NULL,
+            created_at DATETIME NOT NULL,
+            user_id INT NOT NULL,
+            assigned_to INT,
+            admin_notes TEXT,
+            officer_notes TEXT,
+            image_path VARCHAR(255),
+            points_awarded BOOLEAN NOT NULL DEFAULT FALSE,
+            parent_id INT,
+            duplicate_count INT NOT NULL DEFAULT 0,
+            version BIGINT NOT NULL DEFAULT 1,
+            updated_at DATETIME,
+            archived_at DATETIME NOT NULL,
+            PRIMARY KEY (id, created_at),
+            INDEX idx_complaints_archive_created (created_at, id),
+            INDEX idx_complaints_archive_assignee_created (assigned_to, created_at, id),
+            INDEX idx_complaints_archive_user_created (user_id, created_at, id)
+        )
+        PARTITION BY RANGE (TO_DAYS(created_at)) (PARTITION p_future VALUES LESS THAN MAXVALUE)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS lost_items_archive (
+            id INT NOT NULL,
+            item_name VARCHAR(100) NOT NULL,
+            description TEXT NOT NULL,
+            lost_time DATETIME NOT NULL,
+            lost_place VARCHAR(100) NOT NULL,
+            status ENUM('Lost', 'Found', 'Collected') NOT NULL,
+            created_at DATETIME NOT NULL,
+            user_id INT NOT NULL,
+            admin_notes TEXT,
+            image_path VARCHAR(255),
+            image_hash BIGINT UNSIGNED,
+            version BIGINT NOT NULL DEFAULT 1,
+            updated_at DATETIME,
+            archived_at DATETIME NOT NULL,
+            PRIMARY KEY (id, created_at),
+            INDEX idx_lost_items_archive_created (created_at, id),
+            INDEX idx_lost_items_archive_user_created (user_id, created_at, id)
+        )
+        PARTITION BY RANGE (TO_DAYS(created_at)) (PARTITION p_future VALUES LESS THAN MAXVALUE)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS found_items_archive (
+            id INT NOT NULL,
+            item_name VARCHAR(100) NOT NULL,
+            description TEXT NOT NULL,
+            found_time DATETIME NOT NULL,
+            found_place VARCHAR(100) NOT NULL,
+            status ENUM('Unclaimed', 'Matched', 'Returned') NOT NULL,
+            created_at DATETIME NOT NULL,
+            user_id INT NOT NULL,
+            image_path VARCHAR(255),
+            image_hash BIGINT UNSIGNED,
+            lost_item_id INT,
+            archived_at DATETIME NOT NULL,
+            PRIMARY KEY (id, created_at),
+            INDEX idx_found_items_archive_lost (lost_item_id)
+        )
+        PARTITION BY RANGE (TO_DAYS(created_at)) (PARTITION p_future VALUES LESS THAN MAXVALUE)
+        """,
+        # The archive job checks whether a moved image is still used
+        add_index('complaints', 'idx_complaints_image', 'image_path'),
+        add_index('lost_items', 'idx_lost_items_image', 'image_path'),
+        add_index('found_items', 'idx_found_items_image', 'image_path'),
+        """
+        INSERT INTO jobs (kind, payload)
+        SELECT 'archive', '{}' FROM DUAL
+        WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind = 'archive' AND status IN ('queued', 'running'))
+        """,
+    ]),
+    # Query cache table versions shared by every process
+    (12, 'shared query cache versions', [
+        """
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name VARCHAR(64) PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+        """,
+    ]),
+    # Bulk imports tag rows so their ids can be read back
+    (13, 'import keys', [
+        add_column('complaints', 'import_key', 'VARCHAR(48)'),
+        add_index('complaints', 'idx_complaints_import_key', 'import_key'),
+        add_column('lost_items', 'import_key', 'VARCHAR(48)'),
+        add_index('lost_items', 'idx_lost_items_import_key', 'import_key'),
+    ]),
+    # The board ties on id ascending under points descending, an order
+    # (role, points) can only give with a filesort
+    (14, 'leaderboard index in board order', [
+        add_index('users', 'idx_users_role_points_id', 'role, points DESC, id'),
+        drop_index('users', 'idx_users_role_points'),
+    ]),
+]
+
+# Complaint list reads as repository builds them, one entry per read
+def _complaint_lists(name, role, index, statuses=None, include_archived=False):
+    queries = repository.complaint_list_queries(1, role, statuses=statuses, include_archived=include_archived)
+    return [
+        (f'{name} ({n + 1} of {len(queries)})' if len(queries) > 1 else name, sql, params, index)
+        for n, (sql, params) in enumerate(queries)
+    ]
+
+
+# Hot queries and the index each one must use: (name, sql, params, index).
+# Where repository or a job keeps its SQL in a constant or builder, the
+# entry uses it, so the check follows the statements that actually run.
+HOT_QUERIES = [
+    *_complaint_lists('admin complaint list', 'admin', 'idx_complaints_created'),
+    *_complaint_lists('officer complaint list', 'officer', 'idx_complaints_assignee_created'),
+    *_complaint_lists('student complaint list', 'student', 'idx_complaints_user_created'),
+    *_complaint_lists('student complaint tab', 'student', 'idx_complaints_user_status_created', ('In Progress',)),
+    *_complaint_lists('student resolved/closed tab', 'student', 'idx_complaints_user_status_created',
+                      ('Resolved', 'Closed')),
+    ('student complaint counts', *repository.complaint_count_query(1, 'student'), 'idx_complaints_user_status_created'),
+    ('admin lost item list', """
+        SELECT l.id, l.item_name, l.status, l.created_at FROM lost_items l
+        ORDER BY l.created_at DESC, l.id DESC LIMIT 21
+    """, (), 'idx_lost_items_created'),
+    ('student lost item list', """
+        SELECT l.id, l.item_name, l.status, l.created_at FROM lost_items l
+        WHERE l.user_id = %s ORDER BY l.created_at DESC, l.id DESC LIMIT 21
+    """, (1,), 'idx_lost_items_user_created'),
+    ('complaint search', """
+        SELECT c.id FROM complaints c
+        WHERE MATCH(c.title, c.description, c.admin_notes, c.officer_notes) AGAINST (%s IN NATURAL LANGUAGE MODE)
+        LIMIT 50
+    """, ('projector',), 'ft_complaints_text'),
+    ('lost item search', """
+        SELECT l.id FROM lost_items l
+        WHERE MATCH(l.item_name, l.description, l.lost_place) AGAINST (%s IN NATURAL LANGUAGE MODE)
+        LIMIT 50
+    """, ('wallet',), 'ft_lost_items_text'),
+    ('match candidates', """
+        SELECT item_id, COUNT(*) AS shared FROM item_tokens
+        WHERE kind = 'found' AND token IN ('wallet', 'black') AND day_bucket BETWEEN %s AND %s
+        GROUP BY item_id
+    """, (739000, 739014), 'PRIMARY'),
+    ('duplicate candidates', """
+        SELECT complaint_id, COUNT(*) AS bands FROM complaint_lsh
+        WHERE category = 'Electrical Issues' AND (band, bucket) IN ((0, 1), (1, 2)) AND created_day >= %s
+        GROUP BY complaint_id
+    """, (739000,), 'PRIMARY'),
+    ('unclaimed found items', """
+        SELECT f.id, f.item_name, f.created_at FROM found_items f
+        WHERE f.status = 'Unclaimed' ORDER BY f.created_at DESC, f.id DESC LIMIT 21
+    """, (), 'idx_found_items_status_created'),
+    ('job claim', """
+        SELECT id, kind, payload, attempts FROM jobs
+        WHERE status = 'queued' AND run_after <= NOW()
+        ORDER BY run_after, id LIMIT 10
+    """, (), 'idx_jobs_status_run_after'),
+    ('ledger tail', """
+        SELECT id FROM points_ledger
+        WHERE created_at < NOW() - INTERVAL 60 SECOND
+        ORDER BY created_at DESC, id DESC LIMIT 1
+    """, (), 'idx_points_ledger_created'),
+    ('sla events tail', """
+        SELECT id FROM sla_events
+        WHERE recorded_at < NOW() - INTERVAL 60 SECOND
+        ORDER BY recorded_at DESC, id DESC LIMIT 1
+    """, (), 'idx_sla_events_recorded'),
+    ('complaint changes since cursor', changes.SINCE_SQL,
+     (changes.CURSOR_LAG, 'complaints', 0, changes.MAX_EVENTS + 1), 'idx_change_events_entity'),
+    ('change cursor', changes.LATEST_SQL, (changes.CURSOR_LAG,), 'idx_change_events_changed'),
+    ('archive candidates', """
+        SELECT id FROM complaints
+        WHERE status IN ('Resolved', 'Closed') AND parent_id IS NULL
+          AND created_at < NOW() - INTERVAL 180 DAY AND updated_at < NOW() - INTERVAL 7 DAY
+        LIMIT 500
+    """, (), 'idx_complaints_status_created'),
+    ('archived student complaint list', *repository.complaint_list_queries(1, 'student', include_archived=True)[1],
+     'idx_complaints_archive_user_created'),
+    ('leaderboard', leaderboard.LOAD_SQL, (leaderboard.CAPACITY,), 'idx_users_role_points_id'),
+    ('officer by department', """
+        SELECT id FROM users WHERE role = 'officer' AND department = %s
+    """, ('Plumbing',), 'idx_users_role_department'),
+]
+
+
+def ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    ensure_version_table(cursor)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+# Apply every pending migration in order; returns the versions applied
+def migrate(conn):
+    cursor = conn.cursor()
+    try:
+        done = applied_versions(cursor)
+        applied = []
+        for version, description, steps in MIGRATIONS:
+            if version in done:
+                continue
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (version, description),
+            )
+            conn.commit()
+            applied.append(version)
+        return applied
+    finally:
+        cursor.close()
+
+
+# EXPLAIN every hot query; returns a list of (name, problem) for the ones
+# that no longer use their index or need a filesort
+def check_hot_queries(conn):
+    cursor = conn.cursor(dictionary=True)
+    failures = []
+    try:
+        for name, sql, params, index in HOT_QUERIES:
+            cursor.execute("EXPLAIN " + sql, params)
+            plan = cursor.fetchall()
+            driving = plan[0] if plan else {}
+            if driving.get('key') != index:
+                failures.append((name, f"uses index {driving.get('key')!r}, expected {index!r}"))
+            elif 'filesort' in (driving.get('Extra') or ''):
+                failures.append((name, 'needs a filesort'))
+        return failures
+    finally:
+        cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply database migrations')
+    parser.add_argument('--status', action='store_true', help='list applied and pending migrations')
+    parser.add_argument('--check', action='store_true', help='EXPLAIN the hot queries and fail if one stops using its index')
+    args = parser.parse_args(argv)
+
+    with db.get_pool().connection() as conn:
+        if args.status:
+            cursor = conn.cursor()
+            done = applied_versions(cursor)
+            cursor.close()
+            for version, description, _ in MIGRATIONS:
+                print(f"{'applied' if version in done else 'pending'}  {version:>4}  {description}")
+            return 0
+        if args.check:
+            failures = check_hot_queries(conn)
+            for name, problem in failures:
+                print(f'FAIL  {name}: {problem}')
+            if not failures:
+                print(f'OK  {len(HOT_QUERIES)} hot queries use their indexes')
+            return 1 if failures else 0
+        applied = migrate(conn)
+        print(f"Applied migrations: {', '.join(map(str, applied))}" if applied else 'Schema is up to date')
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import copy
+import functools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from mysql.connector import Error
+
+import db
+import metrics
+
+CACHE_TTL = float(os.environ.get('SBMS_QUERY_CACHE_TTL', '30'))
+CACHE_MAX_ENTRIES = int(os.environ.get('SBMS_QUERY_CACHE_MAX_ENTRIES', '2048'))
+# How often a process rereads the shared table versions on its own; the
+# API also rereads them at the start of every request
+SYNC_INTERVAL = float(os.environ.get('SBMS_QUERY_CACHE_SYNC', '1'))
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_SQL = "SELECT name, version FROM cache_versions"
+# LAST_INSERT_ID(expr) hands the new version back in the OK packet
+BUMP_SQL = """
+    INSERT INTO cache_versions (name, version) VALUES (%s, 1)
+    ON DUPLICATE KEY UPDATE version = LAST_INSERT_ID(version + 1)
+"""
+
+
+class SharedVersions:
+    # Table versions in the cache_versions table, so a write committed by
+    # any process (app, API worker, worker.py) invalidates every process's
+    # entries for that table
+    def load(self):
+        with db.get_pool().connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                with metrics.query_timer(VERSIONS_SQL) as timer:
+                    cursor.execute(VERSIONS_SQL)
+                    rows = timer.result = cursor.fetchall()
+            finally:
+                cursor.close()
+        return {row['name']: row['version'] for row in rows}
+
+    def bump(self, tables):
+        versions = {}
+        with db.get_pool().connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for table in tables:
+                    with metrics.query_timer(BUMP_SQL):
+                        cursor.execute(BUMP_SQL, (table,))
+                    versions[table] = cursor.lastrowid or 1
+            finally:
+                cursor.close()
+        return versions
+
+
+class QueryCache:
+    # Read-through cache with TTL and LRU bounds. Every entry remembers the
+    # version of each table it was read from; writers bump those versions
+    # after commit, so a reader never gets a result older than its own write.
+    # With a store the versions are shared between processes: bumps are
+    # written through and the store is reread every sync_interval seconds.
+    # Without one (tests, tools) they are local to the process. Callers get
+    # their own copy of a result, so editing a row never changes the cache.
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, store=None, sync_interval=SYNC_INTERVAL):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.store = store
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._synced_at = None
+        self.hits = 0
+        self.misses = 0
+
+    def _snapshot(self, tables):
+        return tuple(self._versions.get(table, 0) for table in tables)
+
+    def _merge(self, versions):
+        with self._lock:
+            for table, version in versions.items():
+                if version > self._versions.get(table, 0):
+                    self._versions[table] = version
+
+    # Pick up bumps made by other processes. force=False only rereads once
+    # sync_interval has passed. A failed read keeps the versions we have;
+    # entries still expire after the TTL.
+    def sync(self, force=True):
+        if self.store is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._synced_at is not None and now - self._synced_at < self.sync_interval:
+                return
+            self._synced_at = now
+        try:
+            versions = self.store.load()
+        except Error as e:
+            logger.warning('could not read cache versions: %s', e)
+            return
+        self._merge(versions)
+
+    def get_or_load(self, key, tables, loader):
+        self.sync(force=False)
+        with self._lock:
+            entry = self._entries.get(key)
+            versions = self._snapshot(tables)
+            if entry is not None:
+                expires_at, entry_versions, value = entry
+                if entry_versions == versions and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+            self.misses += 1
+        # Load outside the lock; the entry is stored with the versions seen
+        # before loading, so a write that lands meanwhile makes it stale
+        value = loader()
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, versions, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def bump(self, *tables):
+        if self.store is not None:
+            try:
+                self._merge(self.store.bump(tables))
+                return
+            except Error as e:
+                # Other processes see the write once their entries expire
+                logger.warning('could not share cache versions for %s: %s', ', '.join(tables), e)
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'versions': dict(self._versions),
+            }
+
+
+_cache = QueryCache(store=SharedVersions())
+
+
+def get_cache():
+    return _cache
+
+
+def bump(*tables):
+    _cache.bump(*tables)
+
+
+def sync():
+    _cache.sync()
+
+
+# Cache a read function by (name, arguments) against the tables it reads
+def cached(*tables):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+            return _cache.get_or_load(key, tables, lambda: fn(*args, **kwargs))
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
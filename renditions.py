@@ -0,0 +1,109 @@
+import hashlib
+import os
+import threading
+import time
+
+from PIL import Image, ImageOps
+
+import storage
+
+# Fixed-size renditions served instead of the full-resolution upload
+RENDITIONS = {
+    'thumb': (320, 320),
+    'detail': (1280, 1280),
+}
+RENDITION_DIR = os.environ.get('SBMS_RENDITION_DIR', os.path.join('cache', 'renditions'))
+CACHE_MAX_BYTES = int(os.environ.get('SBMS_RENDITION_CACHE_MB', '512')) * 1024 * 1024
+# How often the cache directory is scanned for eviction
+EVICT_INTERVAL = 60
+JPEG_QUALITY = 80
+
+_evict_lock = threading.Lock()
+_last_evict = 0.0
+
+
+# Keyed by path and size; files not stored by content hash also key on
+# mtime so a replaced original never serves a stale rendition. Stored files
+# only ever have their mtime touched (storage.save_upload marks reuse).
+def rendition_path(image_path, name):
+    stat = os.stat(image_path)
+    key = f'{image_path}:{stat.st_size}'
+    if not storage.is_content_path(image_path):
+        key = f'{key}:{stat.st_mtime_ns}'
+    key = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(RENDITION_DIR, key[:2], f'{key}_{name}.jpg')
+
+
+# Decode the original once and write every rendition from it
+def generate(image_path, names=None):
+    names = names or list(RENDITIONS)
+    paths = {}
+    with Image.open(image_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for name in names:
+            path = rendition_path(image_path, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            copy = image.copy()
+            copy.thumbnail(RENDITIONS[name])
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            copy.save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            os.replace(tmp_path, path)
+            paths[name] = path
+    _maybe_evict()
+    return paths
+
+
+# Generate whichever renditions are missing, decoding the original at most once
+def ensure(image_path):
+    missing = [name for name in RENDITIONS if not os.path.exists(rendition_path(image_path, name))]
+    if missing:
+        generate(image_path, missing)
+
+
+# Path of a cached rendition, generating it on first use for older uploads
+def get_rendition(image_path, name):
+    path = rendition_path(image_path, name)
+    if os.path.exists(path):
+        # mtime doubles as last-use time for eviction; only bump it occasionally
+        if time.time() - os.path.getmtime(path) > EVICT_INTERVAL:
+            os.utime(path)
+        return path
+    return generate(image_path, [name])[name]
+
+
+def _maybe_evict():
+    global _last_evict
+    with _evict_lock:
+        if time.monotonic() - _last_evict < EVICT_INTERVAL:
+            return
+        _last_evict = time.monotonic()
+    evict()
+
+
+# Drop least recently used renditions until the cache fits in max_bytes
+def evict(max_bytes=CACHE_MAX_BYTES):
+    files = []
+    total = 0
+    for root, _, names in os.walk(RENDITION_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    files.sort()
+    removed = 0
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
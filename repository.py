@@ -0,0 +1,844 @@
+import os
+import threading
+import time
+from collections import defaultdict
+
+import archive
+import changes
+import db
+import dedupe
+import jobs
+import leaderboard
+import ledger
+import matching
+import metrics
+import query_cache
+import renditions
+import routing
+import sla
+import storage
+
+SUBMIT_POINTS = 1
+RESOLVE_POINTS = 3
+
+# Listings are paged by keyset on (created_at, id), newest first
+PAGE_SIZE = 20
+
+_stats_lock = threading.Lock()
+_action_stats = defaultdict(lambda: {'count': 0, 'round_trips': 0, 'time': 0.0})
+_thread_stats = threading.local()
+
+
+class UnitOfWork:
+    # One pooled connection and one transaction for a whole user action.
+    # Every statement goes through execute() so round-trips are counted
+    # per action; callbacks registered with before_commit run inside the
+    # transaction just before COMMIT, after_commit ones only once it has
+    # committed and after_rollback ones only if it did not.
+    def __init__(self, action, pool=None, transaction=True):
+        self.action = action
+        self.pool = pool or db.get_pool()
+        # Plain reads skip START TRANSACTION / COMMIT and run in autocommit
+        self.transaction = transaction
+        self.round_trips = 0
+        self._before_commit = []
+        self._after_commit = []
+        self._after_rollback = []
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self.conn = self.pool.get_connection()
+        try:
+            self.cursor = self.conn.cursor(dictionary=True)
+            if self.transaction:
+                self.conn.start_transaction()
+                self.round_trips += 1
+        except BaseException:
+            self.conn.close()
+            raise
+        return self
+
+    # Statements are timed into metrics; for reads the time includes
+    # fetching the rows, which the unbuffered cursor does after execute
+    def execute(self, sql, params=()):
+        self.round_trips += 1
+        started = time.perf_counter()
+        self.cursor.execute(sql, params)
+        metrics.record_query(sql, time.perf_counter() - started, max(self.cursor.rowcount, 0))
+        return self.cursor
+
+    def executemany(self, sql, seq_params):
+        # mysql.connector rewrites batched INSERTs into one multi-row
+        # statement; other statements are sent one by one
+        seq_params = list(seq_params)
+        if not seq_params:
+            return self.cursor
+        batched = sql.lstrip().upper().startswith(('INSERT', 'REPLACE'))
+        self.round_trips += 1 if batched else len(seq_params)
+        started = time.perf_counter()
+        self.cursor.executemany(sql, seq_params)
+        metrics.record_query(sql, time.perf_counter() - started, max(self.cursor.rowcount, 0))
+        return self.cursor
+
+    def fetchone(self, sql, params=()):
+        self.round_trips += 1
+        started = time.perf_counter()
+        self.cursor.execute(sql, params)
+        row = self.cursor.fetchone()
+        metrics.record_query(sql, time.perf_counter() - started, int(row is not None), row and [row])
+        return row
+
+    def fetchall(self, sql, params=()):
+        self.round_trips += 1
+        started = time.perf_counter()
+        self.cursor.execute(sql, params)
+        rows = self.cursor.fetchall()
+        metrics.record_query(sql, time.perf_counter() - started, len(rows), rows)
+        return rows
+
+    def before_commit(self, callback):
+        self._before_commit.append(callback)
+
+    def after_commit(self, callback):
+        self._after_commit.append(callback)
+
+    def after_rollback(self, callback):
+        self._after_rollback.append(callback)
+
+    def _commit(self):
+        try:
+            for callback in self._before_commit:
+                callback()
+        except BaseException:
+            if self.transaction:
+                self.conn.rollback()
+                self.round_trips += 1
+            raise
+        if self.transaction:
+            self.conn.commit()
+            self.round_trips += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        committed = False
+        try:
+            if exc_type is None:
+                self._commit()
+                committed = True
+            elif self.transaction:
+                self.conn.rollback()
+                self.round_trips += 1
+        finally:
+            self.cursor.close()
+            self.conn.close()
+            _record(self.action, self.round_trips, time.perf_counter() - self._started)
+            for callback in self._after_commit if committed else self._after_rollback:
+                callback()
+        return False
+
+
+def _record(action, round_trips, elapsed):
+    _thread_stats.round_trips = getattr(_thread_stats, 'round_trips', 0) + round_trips
+    with _stats_lock:
+        stats = _action_stats[action]
+        stats['count'] += 1
+        stats['round_trips'] += round_trips
+        stats['time'] += elapsed
+
+
+# Average round-trips and latency per action since the process started
+def action_stats():
+    with _stats_lock:
+        return {
+            action: {
+                'count': s['count'],
+                'avg_round_trips': s['round_trips'] / s['count'],
+                'avg_ms': 1000 * s['time'] / s['count'],
+            }
+            for action, s in _action_stats.items()
+        }
+
+
+def _action_metrics():
+    with _stats_lock:
+        stats = {action: dict(s) for action, s in _action_stats.items()}
+    return [
+        ('sbms_action_total', 'counter', 'Units of work run, by action.',
+         [({'action': action}, s['count']) for action, s in stats.items()]),
+        ('sbms_action_round_trips_total', 'counter', 'Database round-trips, by action.',
+         [({'action': action}, s['round_trips']) for action, s in stats.items()]),
+        ('sbms_action_seconds_total', 'counter', 'Time spent in units of work, by action.',
+         [({'action': action}, s['time']) for action, s in stats.items()]),
+    ]
+
+
+metrics.register_collector('actions', _action_metrics)
+
+
+# Round-trips made by the calling thread so far; differences around a call
+# give its query count (the benchmark uses this)
+def thread_round_trips():
+    return getattr(_thread_stats, 'round_trips', 0)
+
+
+def keyset_condition(alias):
+    return f"({alias}.created_at < %s OR ({alias}.created_at = %s AND {alias}.id < %s))"
+
+
+def keyset_params(after):
+    created_at, row_id = after
+    return [created_at, created_at, row_id]
+
+
+# Trim the look-ahead row and return the cursor for the next page, if any
+def next_page(rows, page_size):
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        return rows, (rows[-1]['created_at'], rows[-1]['id'])
+    return rows, None
+
+
+# List rows come from the hot table or, flagged as archived, from its
+# archive, which has the same columns
+def _complaint_list_sql(table, archived):
+    return f"""
+    SELECT c.id, c.title, c.category, c.priority, c.status, c.created_at,
+           c.image_path, c.user_id, c.assigned_to, c.parent_id, c.duplicate_count, c.version, {archived} AS archived,
+           u1.username as reporter, u2.username as assigned_to_name
+    FROM {table} c
+    LEFT JOIN users u1 ON c.user_id = u1.id
+    LEFT JOIN users u2 ON c.assigned_to = u2.id
+"""
+
+
+COMPLAINT_LIST_SQL = _complaint_list_sql('complaints', 'FALSE')
+ARCHIVED_COMPLAINT_LIST_SQL = _complaint_list_sql(archive.ARCHIVE_TABLES['complaints'], 'TRUE')
+
+
+# One read of a list: its first page_size + 1 rows in index order
+def list_query(alias, sql, where, params, page_size):
+    order = f'ORDER BY {alias}.created_at DESC, {alias}.id DESC LIMIT %s'
+    return f"{sql} {where} {order}", params + [page_size + 1]
+
+
+# One page from one or more list reads (a hot list and its archive, or one
+# read per status): each reads its own first page_size + 1 rows and the
+# outer sort picks
+def _list_page(uow, queries, page_size):
+    query, params = queries[0]
+    if len(queries) > 1:
+        query = f"""
+            {' UNION ALL '.join(f'({sql})' for sql, _ in queries)}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s
+        """
+        params = [param for _, query_params in queries for param in query_params] + [page_size + 1]
+    return next_page(uow.fetchall(query, params), page_size)
+
+
+# The complaints a user's lists show
+def _complaint_scope(user_id, role):
+    conditions, params = [], []
+    if role == 'officer':
+        conditions.append('c.assigned_to = %s')
+        params.append(user_id)
+    elif role != 'admin':  # student
+        conditions.append('c.user_id = %s')
+        params.append(user_id)
+    if role in ('admin', 'officer'):
+        # Linked duplicates follow their parent and are not worked separately
+        conditions.append('c.parent_id IS NULL')
+    return conditions, params
+
+
+# The reads behind one page of a complaint list, as (sql, params); migrations
+# --check EXPLAINs these same statements. Several statuses are read one
+# status each, as (user_id, status, created_at, id) only keeps created_at
+# order within a single status.
+def complaint_list_queries(user_id, role, page_size=PAGE_SIZE, after=None, statuses=None, include_archived=False):
+    scope, scope_params = _complaint_scope(user_id, role)
+    keyset, keyset_values = ([keyset_condition('c')], keyset_params(after)) if after else ([], [])
+    tables = [COMPLAINT_LIST_SQL] + ([ARCHIVED_COMPLAINT_LIST_SQL] if include_archived else [])
+    queries = []
+    for sql in tables:
+        for status in statuses or (None,):
+            conditions = scope + (['c.status = %s'] if status else []) + keyset
+            params = scope_params + ([status] if status else []) + keyset_values
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            queries.append(list_query('c', sql, where, params, page_size))
+    return queries
+
+
+# statuses optionally restricts the page to a tuple of status values;
+# include_archived also reads the archive
+@query_cache.cached('complaints', 'users')
+def get_user_complaints(user_id, role, page_size=PAGE_SIZE, after=None, statuses=None, include_archived=False):
+    queries = complaint_list_queries(user_id, role, page_size, after, statuses, include_archived)
+    with UnitOfWork('get_user_complaints', transaction=False) as uow:
+        return _list_page(uow, queries, page_size)
+
+
+# Cursor to pass to get_complaint_changes for a list about to be loaded
+def get_change_cursor():
+    with UnitOfWork('get_change_cursor', transaction=False) as uow:
+        return changes.latest(uow)
+
+
+# What changed in a user's complaint list since cursor: (rows, removed_ids,
+# cursor). rows are changed or new complaints in the user's scope, in the
+# shape get_user_complaints returns; removed_ids were deleted or have left
+# the scope. rows is None when too much changed and the list should be
+# reloaded. Not cached: other processes write too, and when nothing changed
+# this is a single index range read.
+def get_complaint_changes(user_id, role, cursor):
+    with UnitOfWork('get_complaint_changes', transaction=False) as uow:
+        events, cursor = changes.since(uow, 'complaints', cursor)
+        if not events:
+            return events, [], cursor
+        ids = list(dict.fromkeys(entity_id for entity_id, _ in events))
+        conditions, params = _complaint_scope(user_id, role)
+        conditions.append(f"c.id IN ({', '.join(['%s'] * len(ids))})")
+        rows = uow.fetchall(f"""
+            {COMPLAINT_LIST_SQL}
+            WHERE {' AND '.join(conditions)}
+        """, params + ids)
+    found = {row['id'] for row in rows}
+    return rows, [complaint_id for complaint_id in ids if complaint_id not in found], cursor
+
+
+def complaint_count_query(user_id, role):
+    conditions, params = [], []
+    if role == 'officer':
+        conditions.append('assigned_to = %s')
+        params.append(user_id)
+    elif role != 'admin':  # student
+        conditions.append('user_id = %s')
+        params.append(user_id)
+    if role in ('admin', 'officer'):
+        conditions.append('parent_id IS NULL')
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f"SELECT status, COUNT(*) AS n FROM complaints {where} GROUP BY status", params
+
+
+# Complaint counts per status for the tab headers
+@query_cache.cached('complaints')
+def count_complaints_by_status(user_id, role):
+    with UnitOfWork('count_complaints_by_status', transaction=False) as uow:
+        rows = uow.fetchall(*complaint_count_query(user_id, role))
+    return {row['status']: row['n'] for row in rows}
+
+
+# One live complaint in the list shape, or None
+@query_cache.cached('complaints', 'users')
+def get_complaint(complaint_id):
+    with UnitOfWork('get_complaint', transaction=False) as uow:
+        return uow.fetchone(f"{COMPLAINT_LIST_SQL} WHERE c.id = %s", (complaint_id,))
+
+
+# Full text fields are only loaded when a card is opened
+@query_cache.cached('complaints')
+def get_complaint_details(complaint_id, archived=False):
+    table = archive.ARCHIVE_TABLES['complaints'] if archived else 'complaints'
+    with UnitOfWork('get_complaint_details', transaction=False) as uow:
+        return uow.fetchone(f"""
+            SELECT description, admin_notes, officer_notes
+            FROM {table}
+            WHERE id = %s
+        """, (complaint_id,))
+
+
+@query_cache.cached('users')
+def get_officers():
+    with UnitOfWork('get_officers', transaction=False) as uow:
+        return uow.fetchall("SELECT id, username, department FROM users WHERE role = 'officer'")
+
+
+def _lost_item_list_sql(table, archived):
+    return f"""
+    SELECT l.id, l.item_name, l.status, l.lost_time, l.lost_place,
+           l.created_at, l.image_path, {archived} AS archived, u.username as reporter
+    FROM {table} l
+    LEFT JOIN users u ON l.user_id = u.id
+"""
+
+
+LOST_ITEM_LIST_SQL = _lost_item_list_sql('lost_items', 'FALSE')
+ARCHIVED_LOST_ITEM_LIST_SQL = _lost_item_list_sql(archive.ARCHIVE_TABLES['lost_items'], 'TRUE')
+
+
+@query_cache.cached('lost_items', 'users')
+def get_lost_items(user_id, role, page_size=PAGE_SIZE, after=None, include_archived=False):
+    conditions, params = [], []
+    if role != 'admin':  # student
+        conditions.append('l.user_id = %s')
+        params.append(user_id)
+    if after:
+        conditions.append(keyset_condition('l'))
+        params.extend(keyset_params(after))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    tables = [LOST_ITEM_LIST_SQL] + ([ARCHIVED_LOST_ITEM_LIST_SQL] if include_archived else [])
+    queries = [list_query('l', sql, where, params, page_size) for sql in tables]
+    with UnitOfWork('get_lost_items', transaction=False) as uow:
+        return _list_page(uow, queries, page_size)
+
+
+SEARCH_LIMIT = 50
+COMPLAINT_TEXT = 'c.title, c.description, c.admin_notes, c.officer_notes'
+LOST_ITEM_TEXT = 'l.item_name, l.description, l.lost_place'
+
+
+def _date_range_conditions(column, date_from, date_to):
+    conditions, params = [], []
+    if date_from:
+        conditions.append(f'{column} >= %s')
+        params.append(date_from)
+    if date_to:
+        # Inclusive of the whole end day
+        conditions.append(f'{column} < %s + INTERVAL 1 DAY')
+        params.append(date_to)
+    return conditions, params
+
+
+# Ranked full-text search over the FULLTEXT indexes, scoped like the listings
+@query_cache.cached('complaints', 'users')
+def search_complaints(user_id, role, text, category=None, status=None, priority=None,
+                      date_from=None, date_to=None, limit=SEARCH_LIMIT):
+    conditions = [f'MATCH({COMPLAINT_TEXT}) AGAINST (%s IN NATURAL LANGUAGE MODE)']
+    params = [text]
+    if role == 'officer':
+        conditions.append('c.assigned_to = %s')
+        params.append(user_id)
+    elif role != 'admin':  # student
+        conditions.append('c.user_id = %s')
+        params.append(user_id)
+    for column, value in (('c.category', category), ('c.status', status), ('c.priority', priority)):
+        if value:
+            conditions.append(f'{column} = %s')
+            params.append(value)
+    date_conditions, date_params = _date_range_conditions('c.created_at', date_from, date_to)
+    conditions += date_conditions
+    params += date_params
+    with UnitOfWork('search_complaints', transaction=False) as uow:
+        return uow.fetchall(f"""
+            SELECT c.id, c.title, c.category, c.priority, c.status, c.created_at,
+                   c.image_path, c.assigned_to,
+                   u1.username as reporter, u2.username as assigned_to_name,
+                   MATCH({COMPLAINT_TEXT}) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score
+            FROM complaints c
+            LEFT JOIN users u1 ON c.user_id = u1.id
+            LEFT JOIN users u2 ON c.assigned_to = u2.id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY score DESC
+            LIMIT %s
+        """, [text] + params + [limit])
+
+
+@query_cache.cached('lost_items', 'users')
+def search_lost_items(user_id, role, text, status=None, date_from=None, date_to=None, limit=SEARCH_LIMIT):
+    conditions = [f'MATCH({LOST_ITEM_TEXT}) AGAINST (%s IN NATURAL LANGUAGE MODE)']
+    params = [text]
+    if role != 'admin':  # student
+        conditions.append('l.user_id = %s')
+        params.append(user_id)
+    if status:
+        conditions.append('l.status = %s')
+        params.append(status)
+    date_conditions, date_params = _date_range_conditions('l.lost_time', date_from, date_to)
+    conditions += date_conditions
+    params += date_params
+    with UnitOfWork('search_lost_items', transaction=False) as uow:
+        return uow.fetchall(f"""
+            SELECT l.id, l.item_name, l.status, l.lost_time, l.lost_place,
+                   l.created_at, l.image_path, u.username as reporter,
+                   MATCH({LOST_ITEM_TEXT}) AGAINST (%s IN NATURAL LANGUAGE MODE) AS score
+            FROM lost_items l
+            LEFT JOIN users u ON l.user_id = u.id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY score DESC
+            LIMIT %s
+        """, [text] + params + [limit])
+
+
+@query_cache.cached('lost_items')
+def get_lost_item_details(item_id, archived=False):
+    table = archive.ARCHIVE_TABLES['lost_items'] if archived else 'lost_items'
+    with UnitOfWork('get_lost_item_details', transaction=False) as uow:
+        return uow.fetchone(f"SELECT description, admin_notes FROM {table} WHERE id = %s", (item_id,))
+
+
+# The all-time board straight from users, for processes that do not keep
+# an in-process leaderboard current; same rows as leaderboard.top()
+@query_cache.cached('users')
+def get_leaderboard(n=leaderboard.LEADERBOARD_SIZE):
+    with UnitOfWork('get_leaderboard', transaction=False) as uow:
+        rows = uow.fetchall(leaderboard.LOAD_SQL, (n,))
+    return [{'username': row['username'], 'points': row['points'], 'role': 'student'} for row in rows]
+
+
+# Top students for 'month' or 'semester' from the ledger rollups
+@query_cache.cached('points_ledger', 'users')
+def get_period_leaderboard(period):
+    with UnitOfWork('get_period_leaderboard', transaction=False) as uow:
+        return ledger.top(uow, period)
+
+
+# SLA figures per department, category or priority over the last `days`
+# days, read from the rollups
+@query_cache.cached('sla_rollups')
+def get_sla_summary(days, group, department=None, category=None, priority=None):
+    with UnitOfWork('get_sla_summary', transaction=False) as uow:
+        return sla.summary(uow, sla.days_ago(days), group,
+                           department=department, category=category, priority=priority)
+
+
+# Opened, resolved and backlog per day over `days` days, or per hour over
+# `hours` hours
+@query_cache.cached('sla_rollups')
+def get_sla_trend(days=None, hours=None, department=None, category=None, priority=None):
+    since, period = (sla.hours_ago(hours), 'hour') if hours else (sla.days_ago(days), 'day')
+    with UnitOfWork('get_sla_trend', transaction=False) as uow:
+        return sla.trend(uow, since, period, department=department, category=category, priority=priority)
+
+
+# Points go through the ledger; the key makes each award happen at most once
+def award_points(uow, user_id, points, reason, complaint_id=None):
+    ledger.record(uow, user_id, points, reason, complaint_id, key=f'{reason}:{complaint_id}' if complaint_id else None)
+
+
+# Submitting is one INSERT plus its job, committed together. Routing,
+# duplicate linking, the submission point and image storage happen in the
+# process_complaint job. Returns the complaint id.
+def submit_complaint(title, description, category, priority, user_id, image_path=None):
+    with UnitOfWork('submit_complaint') as uow:
+        cursor = uow.execute("""
+            INSERT INTO complaints (title, description, category, priority, user_id, status, image_path, processed)
+            VALUES (%s, %s, %s, %s, %s, 'Pending Admin Review', %s, FALSE)
+        """, (title, description, category, priority, user_id, image_path))
+        complaint_id = cursor.lastrowid
+        changes.record(uow, 'complaints', [complaint_id], 'insert')
+        jobs.enqueue(uow, 'process_complaint', {'complaint_id': complaint_id})
+        uow.after_commit(lambda: query_cache.bump('complaints'))
+    return complaint_id
+
+
+# Move an upload from uploads/incoming into the content-addressed store and
+# build its renditions; the incoming copy goes once the new path commits
+def _store_image(uow, table, row_id, image_path):
+    path = storage.store_incoming(image_path)
+    try:
+        renditions.ensure(path)
+    except OSError:
+        pass  # not an image; served as stored
+    uow.execute(f"UPDATE {table} SET image_path = %s WHERE id = %s", (path, row_id))
+    if table in changes.TABLES:
+        changes.record(uow, table, [row_id])
+    uow.after_commit(lambda: os.path.exists(image_path) and os.remove(image_path))
+    return path
+
+
+# A near-duplicate of an open complaint is linked to it: it takes the
+# parent's assignee and status, and gets no routing slot, point or SLA
+# events of its own. SLA figures count tickets, and the parent's events
+# already time the work; counting repeats would inflate volumes and skew
+# durations (the parent's duplicate_count shows how often it was reported).
+# Anything else is routed, indexed for dedupe and earns the point. The
+# processed flag makes a re-delivered job a no-op.
+@jobs.handler('process_complaint')
+def process_complaint(uow, payload):
+    complaint_id = payload['complaint_id']
+    cursor = uow.execute(
+        "UPDATE complaints SET processed = TRUE WHERE id = %s AND processed = FALSE", (complaint_id,)
+    )
+    if not cursor.rowcount:
+        return
+    complaint = uow.fetchone("""
+        SELECT id, title, description, category, priority, user_id, status, assigned_to, image_path, created_at
+        FROM complaints
+        WHERE id = %s
+    """, (complaint_id,))
+    uow.after_commit(lambda: query_cache.bump('complaints'))
+    if storage.is_incoming(complaint['image_path']):
+        _store_image(uow, 'complaints', complaint_id, complaint['image_path'])
+    # An admin may already have picked the complaint up; leave it alone then
+    untouched = complaint['status'] == 'Pending Admin Review' and complaint['assigned_to'] is None
+    category = complaint['category']
+    sig = dedupe.signature(complaint['title'], complaint['description'])
+    parent = dedupe.find_parent(uow, category, sig, complaint['created_at']) if sig and untouched else None
+    if parent:
+        uow.execute(
+            "UPDATE complaints SET parent_id = %s, status = %s, assigned_to = %s WHERE id = %s",
+            (parent['id'], parent['status'], parent['assigned_to'], complaint_id),
+        )
+        uow.execute("UPDATE complaints SET duplicate_count = duplicate_count + 1 WHERE id = %s", (parent['id'],))
+        changes.record(uow, 'complaints', [complaint_id, parent['id']])
+        return
+    sla.record(uow, complaint, 'opened', to_status=complaint['status'], changed_at=complaint['created_at'])
+    assigned_to = None
+    if untouched:
+        table = routing.get_table()
+        assigned_to = table.assign(uow, category)
+        if assigned_to:
+            uow.after_rollback(lambda: table.release(assigned_to))
+            sla.record(uow, complaint, 'assigned')
+    uow.execute(
+        "UPDATE complaints SET assigned_to = COALESCE(%s, assigned_to), minhash = %s WHERE id = %s",
+        (assigned_to, dedupe.pack(sig) if sig else None, complaint_id),
+    )
+    if assigned_to:
+        changes.record(uow, 'complaints', [complaint_id])
+    if sig:
+        dedupe.index_complaint(uow, complaint_id, category, sig, complaint['created_at'])
+    award_points(uow, complaint['user_id'], SUBMIT_POINTS, 'submit', complaint_id)
+
+
+# Linked duplicates mirror their parent's status and assignee
+def _update_duplicates(uow, parent_ids, status, assigned_to):
+    placeholders = ', '.join(['%s'] * len(parent_ids))
+    uow.execute(f"""
+        UPDATE complaints
+        SET status = %s, assigned_to = COALESCE(%s, assigned_to)
+        WHERE parent_id IN ({placeholders})
+    """, [status, assigned_to] + list(parent_ids))
+    changes.record(uow, 'complaints', parent_ids=parent_ids)
+
+
+# Update status and notes; the resolution award is a conditional UPDATE on
+# points_awarded, so concurrent updates can never award twice. Notes go to
+# the column of whoever wrote them, and an unset assignee or empty note
+# keeps the current value. Returns True when resolution points were awarded.
+def update_complaint_status(complaint_id, status, notes=None, assigned_to=None, is_admin=False):
+    notes_column = 'admin_notes' if is_admin else 'officer_notes'
+    params = (status, assigned_to, notes or None, complaint_id)
+    with UnitOfWork('update_complaint_status') as uow:
+        current = uow.fetchone("""
+            SELECT id, status, assigned_to, user_id, duplicate_count, parent_id, category, priority, created_at
+            FROM complaints
+            WHERE id = %s
+            FOR UPDATE
+        """, (complaint_id,))
+        if current is None:
+            return False
+        if current['parent_id'] is None:
+            sla.record_change(uow, current, status, assigned_to)
+        awarded = False
+        if status == 'Resolved':
+            cursor = uow.execute(f"""
+                UPDATE complaints
+                SET status = %s, assigned_to = COALESCE(%s, assigned_to),
+                    {notes_column} = COALESCE(%s, {notes_column}), points_awarded = TRUE
+                WHERE id = %s AND points_awarded = FALSE
+            """, params)
+            awarded = cursor.rowcount == 1
+            if awarded:
+                award_points(uow, current['user_id'], RESOLVE_POINTS, 'resolve', complaint_id)
+        if not awarded:
+            uow.execute(f"""
+                UPDATE complaints
+                SET status = %s, assigned_to = COALESCE(%s, assigned_to),
+                    {notes_column} = COALESCE(%s, {notes_column})
+                WHERE id = %s
+            """, params)
+        if current['duplicate_count']:
+            _update_duplicates(uow, [complaint_id], status, assigned_to)
+        changes.record(uow, 'complaints', [complaint_id])
+        uow.after_commit(lambda: query_cache.bump('complaints'))
+        uow.after_commit(lambda: routing.get_table().moved(
+            current['assigned_to'], routing.is_open(current['status']),
+            assigned_to or current['assigned_to'], routing.is_open(status),
+        ))
+    return awarded
+
+
+# Apply many admin status/assignee/notes changes in one transaction.
+# updates is a list of (complaint_id, status, assigned_to, notes). Rows are
+# locked and read once, resolution points for the rows being resolved for
+# the first time go to the ledger as one batch, and rows that get the same
+# new values share one UPDATE ... WHERE id IN (...). (executemany on UPDATE
+# is only a client-side loop in mysql.connector.)
+# Returns (updated, awarded).
+def bulk_update_complaints(updates):
+    updates = {complaint_id: (status, assigned_to, notes or None)
+               for complaint_id, status, assigned_to, notes in updates}
+    if not updates:
+        return 0, 0
+    ids = list(updates)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with UnitOfWork('bulk_update_complaints') as uow:
+        current = {
+            row['id']: row for row in uow.fetchall(f"""
+                SELECT id, status, assigned_to, user_id, points_awarded, duplicate_count, parent_id,
+                       category, priority, created_at
+                FROM complaints
+                WHERE id IN ({placeholders})
+                FOR UPDATE
+            """, ids)
+        }
+        for complaint_id, row in current.items():
+            if row['parent_id'] is None:
+                status, assigned_to, _ = updates[complaint_id]
+                sla.record_change(uow, row, status, assigned_to)
+        newly_resolved = [
+            complaint_id for complaint_id, (status, _, _) in updates.items()
+            if status == 'Resolved' and complaint_id in current and not current[complaint_id]['points_awarded']
+        ]
+        for complaint_id in newly_resolved:
+            award_points(uow, current[complaint_id]['user_id'], RESOLVE_POINTS, 'resolve', complaint_id)
+
+        groups = {}
+        for complaint_id, values in updates.items():
+            if complaint_id in current:
+                groups.setdefault(values, []).append(complaint_id)
+        for (status, assigned_to, notes), group_ids in groups.items():
+            group_placeholders = ', '.join(['%s'] * len(group_ids))
+            uow.execute(f"""
+                UPDATE complaints
+                SET status = %s, assigned_to = COALESCE(%s, assigned_to),
+                    admin_notes = COALESCE(%s, admin_notes),
+                    points_awarded = points_awarded OR %s
+                WHERE id IN ({group_placeholders})
+            """, [status, assigned_to, notes, status == 'Resolved'] + group_ids)
+            parents = [complaint_id for complaint_id in group_ids if current[complaint_id]['duplicate_count']]
+            if parents:
+                _update_duplicates(uow, parents, status, assigned_to)
+            changes.record(uow, 'complaints', group_ids)
+
+        def after_commit():
+            table = routing.get_table()
+            for complaint_id, row in current.items():
+                status, assigned_to, _ = updates[complaint_id]
+                table.moved(row['assigned_to'], routing.is_open(row['status']),
+                            assigned_to or row['assigned_to'], routing.is_open(status))
+            query_cache.bump('complaints')
+        uow.after_commit(after_commit)
+    return len(current), len(newly_resolved)
+
+
+# Perceptual hash for matching; an unreadable image just matches on text
+def _image_hash(image_path):
+    if not image_path:
+        return None
+    try:
+        return matching.image_hash(image_path)
+    except OSError:
+        return None
+
+
+def submit_lost_item(item_name, description, lost_time, lost_place, user_id, image_path=None):
+    with UnitOfWork('submit_lost_item') as uow:
+        cursor = uow.execute("""
+            INSERT INTO lost_items (item_name, description, lost_time, lost_place, user_id, image_path)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (item_name, description, lost_time, lost_place, user_id, image_path))
+        item_id = cursor.lastrowid
+        changes.record(uow, 'lost_items', [item_id], 'insert')
+        jobs.enqueue(uow, 'process_item', {'kind': 'lost', 'item_id': item_id})
+        uow.after_commit(lambda: query_cache.bump('lost_items'))
+        return item_id
+
+
+# Store the item's image, hash it and match the item against open items of
+# the other kind. Every step is idempotent, so a retried job is harmless.
+@jobs.handler('process_item')
+def process_item(uow, payload):
+    kind, item_id = payload['kind'], payload['item_id']
+    table, time_column, place_column, _ = matching.SIDES[kind]
+    item = uow.fetchone(f"""
+        SELECT id, item_name AS name, description, {place_column} AS place, {time_column} AS time,
+               image_path, image_hash
+        FROM {table}
+        WHERE id = %s
+    """, (item_id,))
+    if item is None:
+        return
+    if storage.is_incoming(item['image_path']):
+        item['image_path'] = _store_image(uow, table, item_id, item['image_path'])
+    if item['image_path'] and item['image_hash'] is None:
+        item['image_hash'] = _image_hash(item['image_path'])
+        if item['image_hash'] is not None:
+            uow.execute(f"UPDATE {table} SET image_hash = %s WHERE id = %s", (item['image_hash'], item_id))
+    matching.match_item(uow, kind, item)
+    uow.after_commit(lambda: query_cache.bump(table, 'item_matches'))
+
+
+def update_lost_item_status(item_id, status, notes=None):
+    with UnitOfWork('update_lost_item_status') as uow:
+        uow.execute("""
+            UPDATE lost_items
+            SET status = %s, admin_notes = %s
+            WHERE id = %s
+        """, (status, notes, item_id))
+        changes.record(uow, 'lost_items', [item_id])
+        uow.after_commit(lambda: query_cache.bump('lost_items'))
+
+
+# Log an item handed in at the desk; the process_item job then ranks the open
+# lost reports it could belong to. Returns the found item id.
+def submit_found_item(item_name, description, found_time, found_place, user_id, image_path=None):
+    with UnitOfWork('submit_found_item') as uow:
+        cursor = uow.execute("""
+            INSERT INTO found_items (item_name, description, found_time, found_place, user_id, image_path)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (item_name, description, found_time, found_place, user_id, image_path))
+        found_id = cursor.lastrowid
+        jobs.enqueue(uow, 'process_item', {'kind': 'found', 'item_id': found_id})
+        uow.after_commit(lambda: query_cache.bump('found_items'))
+    return found_id
+
+
+@query_cache.cached('found_items', 'users')
+def get_found_items(status='Unclaimed', page_size=PAGE_SIZE, after=None):
+    conditions, params = ['f.status = %s'], [status]
+    if after:
+        conditions.append(keyset_condition('f'))
+        params.extend(keyset_params(after))
+    with UnitOfWork('get_found_items', transaction=False) as uow:
+        rows = uow.fetchall(f"""
+            SELECT f.id, f.item_name, f.description, f.status, f.found_time, f.found_place,
+                   f.created_at, f.image_path, u.username as logged_by
+            FROM found_items f
+            LEFT JOIN users u ON f.user_id = u.id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY f.created_at DESC, f.id DESC
+            LIMIT %s
+        """, params + [page_size + 1])
+    return next_page(rows, page_size)
+
+
+# Stored candidates for a page of found items in one query, still-open lost
+# reports only: {found_id: [lost item rows with score, best first]}
+@query_cache.cached('item_matches', 'lost_items', 'users')
+def get_item_matches(found_ids):
+    if not found_ids:
+        return {}
+    placeholders = ', '.join(['%s'] * len(found_ids))
+    with UnitOfWork('get_item_matches', transaction=False) as uow:
+        rows = uow.fetchall(f"""
+            SELECT m.found_id, m.score, l.id, l.item_name, l.lost_time, l.lost_place,
+                   l.image_path, u.username as reporter
+            FROM item_matches m
+            JOIN lost_items l ON l.id = m.lost_id
+            LEFT JOIN users u ON l.user_id = u.id
+            WHERE m.found_id IN ({placeholders}) AND l.status = 'Lost'
+            ORDER BY m.found_id, m.score DESC
+        """, list(found_ids))
+    matches = {}
+    for row in rows:
+        matches.setdefault(row['found_id'], []).append(row)
+    return matches
+
+
+# Pair a found item with a lost report; both must still be open. Returns
+# True when the match was recorded.
+def confirm_match(lost_id, found_id):
+    with UnitOfWork('confirm_match') as uow:
+        lost = uow.fetchone("SELECT status FROM lost_items WHERE id = %s FOR UPDATE", (lost_id,))
+        found = uow.fetchone("SELECT status FROM found_items WHERE id = %s FOR UPDATE", (found_id,))
+        if not lost or not found or lost['status'] != 'Lost' or found['status'] != 'Unclaimed':
+            return False
+        uow.execute("UPDATE lost_items SET status = 'Found' WHERE id = %s", (lost_id,))
+        changes.record(uow, 'lost_items', [lost_id])
+        uow.execute(
+            "UPDATE found_items SET status = 'Matched', lost_item_id = %s WHERE id = %s",
+            (lost_id, found_id),
+        )
+        uow.after_commit(lambda: query_cache.bump('lost_items', 'found_items'))
+    return True
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+
+# Map category to department
+CATEGORY_TO_DEPARTMENT = {
+    'Electrical Issues': 'Electrical',
+    'Water & Sanitation': 'Plumbing',
+    'Faulty Infrastructure': 'Maintenance',
+    'Internet & Network': 'IT',
+    'Security Concerns': 'Security'
+}
+
+# Statuses that count towards an officer's workload
+OPEN_STATUSES = ('Pending Admin Review', 'In Progress')
+# Resync with the database periodically to absorb changes from other processes
+MAX_AGE = float(os.environ.get('SBMS_ROUTING_MAX_AGE', '300'))
+
+
+def is_open(status):
+    return status in OPEN_STATUSES
+
+
+class RoutingTable:
+    # Department -> officers, with each officer's open-complaint count kept
+    # as an in-process counter. Loaded with one GROUP BY query and then
+    # maintained by the writers, so routing a submission costs no query.
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._officers = None
+        self._open = {}
+        self._loaded_at = 0.0
+
+    def _load(self, uow):
+        placeholders = ', '.join(['%s'] * len(OPEN_STATUSES))
+        rows = uow.fetchall(f"""
+            SELECT u.id, u.department, COUNT(c.id) AS open_count
+            FROM users u
+            LEFT JOIN complaints c
+                ON c.assigned_to = u.id AND c.status IN ({placeholders}) AND c.parent_id IS NULL
+            WHERE u.role = 'officer'
+            GROUP BY u.id, u.department
+        """, OPEN_STATUSES)
+        officers = {}
+        for row in rows:
+            officers.setdefault(row['department'], []).append(row['id'])
+        self._officers = officers
+        self._open = {row['id']: row['open_count'] for row in rows}
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self, uow):
+        if self._officers is None or time.monotonic() - self._loaded_at > self.max_age:
+            self._load(uow)
+
+    # Pick the least loaded officer for a category and reserve the slot.
+    # The caller must release() it if the complaint is not committed.
+    def assign(self, uow, category):
+        department = CATEGORY_TO_DEPARTMENT.get(category)
+        if not department:
+            return None
+        with self._lock:
+            self._ensure_loaded(uow)
+            officers = self._officers.get(department)
+            if not officers:
+                return None
+            officer_id = min(officers, key=lambda o: (self._open.get(o, 0), o))
+            self._open[officer_id] = self._open.get(officer_id, 0) + 1
+            return officer_id
+
+    # assign() for many complaints at once, spreading each department's
+    # share over its least loaded officers. Returns one officer id or None
+    # per category; the caller must release() them if not committed.
+    def assign_many(self, uow, categories):
+        with self._lock:
+            self._ensure_loaded(uow)
+            assigned = []
+            for category in categories:
+                officers = self._officers.get(CATEGORY_TO_DEPARTMENT.get(category))
+                if not officers:
+                    assigned.append(None)
+                    continue
+                officer_id = min(officers, key=lambda o: (self._open.get(o, 0), o))
+                self._open[officer_id] = self._open.get(officer_id, 0) + 1
+                assigned.append(officer_id)
+            return assigned
+
+    def release(self, officer_id):
+        self.moved(officer_id, True, None, False)
+
+    # Keep counters in step with a committed change of assignee or status
+    def moved(self, old_officer, was_open, new_officer, now_open):
+        with self._lock:
+            if self._officers is None:
+                return
+            if old_officer in self._open and was_open:
+                self._open[old_officer] = max(self._open[old_officer] - 1, 0)
+            if new_officer in self._open and now_open:
+                self._open[new_officer] += 1
+
+    def workload(self):
+        with self._lock:
+            return dict(self._open)
+
+    # Called whenever users are added, removed or change department
+    def invalidate(self):
+        with self._lock:
+            self._officers = None
+
+
+_table = RoutingTable()
+
+
+def get_table():
+    return _table
@@ -0,0 +1,208 @@
+from datetime import datetime
+
+import repository
+import routing
+import storage
+from repository import UnitOfWork
+
+# Business operations with no UI attached. The Streamlit app and the JSON
+# API both call these with the acting user (a users row with id, username,
+# role and department) and present results and errors their own way. No
+# per-user state is kept between calls; reads go through the query cache,
+# whose table versions are shared between processes (see query_cache).
+
+STATUSES = ['Pending Admin Review', 'In Progress', 'Resolved', 'Closed']
+LOST_ITEM_STATUSES = ['Lost', 'Found', 'Collected']
+CATEGORIES = list(routing.CATEGORY_TO_DEPARTMENT)
+PRIORITIES = ['Urgent', 'High', 'Medium', 'Low']
+LEADERBOARD_PERIODS = ('month', 'semester', 'all')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Roles that run the lost & found desk
+STAFF = ('admin', 'officer')
+
+# Fields of a users row that are safe to hand out
+USER_FIELDS = ('id', 'username', 'role', 'department', 'points')
+
+
+class ServiceError(Exception):
+    # HTTP status the API answers with
+    status = 400
+
+
+class Forbidden(ServiceError):
+    status = 403
+
+
+class NotFound(ServiceError):
+    status = 404
+
+
+def public_user(user):
+    return {field: user.get(field) for field in USER_FIELDS}
+
+
+def _require_role(user, *roles):
+    if user['role'] not in roles:
+        raise Forbidden(f"{user['role']}s cannot do this")
+
+
+def _text(value, field, max_length=None, required=True):
+    value = value.strip() if isinstance(value, str) else value
+    if not value:
+        if required:
+            raise ServiceError(f'{field} is required')
+        return None
+    if not isinstance(value, str):
+        raise ServiceError(f'{field} must be text')
+    if max_length and len(value) > max_length:
+        raise ServiceError(f'{field} is longer than {max_length} characters')
+    return value
+
+
+def _choice(value, field, choices):
+    if value not in choices:
+        raise ServiceError(f"{field} must be one of {', '.join(choices)}")
+    return value
+
+
+def _datetime(value, field):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(_text(value, field))
+    except ValueError:
+        raise ServiceError(f'{field} is not an ISO date/time') from None
+
+
+# Copy an uploaded file to the incoming area; the background job stores it
+def _save_image(image, filename):
+    if image is None:
+        return None
+    if not filename or not filename.lower().endswith(IMAGE_EXTENSIONS):
+        raise ServiceError(f"image must be one of {', '.join(IMAGE_EXTENSIONS)}")
+    return storage.save_incoming(image, filename)
+
+
+LOGIN_SQL = "SELECT * FROM users WHERE username = %s AND password = %s"
+
+
+# The users row for valid credentials, or None
+def login(username, password):
+    with UnitOfWork('login', transaction=False) as uow:
+        return uow.fetchone(LOGIN_SQL, (username, password))
+
+
+def list_complaints(user, after=None, statuses=None, include_archived=False, page_size=repository.PAGE_SIZE):
+    for status in statuses or ():
+        _choice(status, 'status', STATUSES)
+    return repository.get_user_complaints(user['id'], user['role'], page_size, after,
+                                          tuple(statuses) if statuses else None, include_archived)
+
+
+# A complaint with its text fields, if the user's lists would show it
+def get_complaint(user, complaint_id):
+    complaint = repository.get_complaint(complaint_id)
+    if complaint is None or not _in_scope(user, complaint):
+        raise NotFound(f'no complaint {complaint_id}')
+    return dict(complaint, **(repository.get_complaint_details(complaint_id) or {}))
+
+
+def _in_scope(user, complaint):
+    if user['role'] == 'officer':
+        return complaint['assigned_to'] == user['id']
+    return user['role'] == 'admin' or complaint['user_id'] == user['id']
+
+
+# Returns the new complaint's id
+def submit_complaint(user, title, description, category, priority, image=None, filename=None):
+    title = _text(title, 'title', 100)
+    description = _text(description, 'description')
+    _choice(category, 'category', CATEGORIES)
+    _choice(priority, 'priority', PRIORITIES)
+    image_path = _save_image(image, filename)
+    # One INSERT; routing, duplicate linking and points follow in the background
+    return repository.submit_complaint(title, description, category, priority, user['id'], image_path)
+
+
+# Admins may change any complaint and its assignee; officers the status
+# and notes of complaints assigned to them. Returns True when resolution
+# points were awarded.
+def update_complaint(user, complaint_id, status, notes=None, assigned_to=None):
+    _require_role(user, 'admin', 'officer')
+    _choice(status, 'status', STATUSES)
+    notes = _text(notes, 'notes', required=False)
+    if user['role'] == 'officer' and assigned_to is not None:
+        raise Forbidden('officers cannot reassign complaints')
+    if assigned_to is not None and assigned_to not in {officer['id'] for officer in repository.get_officers()}:
+        raise ServiceError(f'user {assigned_to} is not an officer')
+    # Read past the cache: the check must see the current assignee
+    complaint = repository.get_complaint.uncached(complaint_id)
+    if complaint is None or not _in_scope(user, complaint):
+        raise NotFound(f'no complaint {complaint_id}')
+    return repository.update_complaint_status(complaint_id, status, notes, assigned_to, user['role'] == 'admin')
+
+
+# updates is a list of (complaint_id, status, assigned_to, notes); returns
+# (updated, awarded)
+def bulk_update_complaints(user, updates):
+    _require_role(user, 'admin')
+    officers = {officer['id'] for officer in repository.get_officers()}
+    for _, status, assigned_to, _ in updates:
+        _choice(status, 'status', STATUSES)
+        if assigned_to is not None and assigned_to not in officers:
+            raise ServiceError(f'user {assigned_to} is not an officer')
+    return repository.bulk_update_complaints(updates)
+
+
+# The all-time board is read from users rather than the in-process
+# leaderboard, which only sees awards made by its own process at once
+def get_leaderboard(period='all'):
+    _choice(period, 'period', LEADERBOARD_PERIODS)
+    if period == 'all':
+        return repository.get_leaderboard()
+    return repository.get_period_leaderboard(period)
+
+
+# Admins see every report, everyone else their own
+def list_lost_items(user, after=None, include_archived=False, page_size=repository.PAGE_SIZE):
+    return repository.get_lost_items(user['id'], user['role'], page_size, after, include_archived)
+
+
+def submit_lost_item(user, item_name, description, lost_time, lost_place, image=None, filename=None):
+    item_name = _text(item_name, 'item_name', 100)
+    description = _text(description, 'description')
+    lost_time = _datetime(lost_time, 'lost_time')
+    lost_place = _text(lost_place, 'lost_place', 100)
+    image_path = _save_image(image, filename)
+    return repository.submit_lost_item(item_name, description, lost_time, lost_place, user['id'], image_path)
+
+
+def update_lost_item(user, item_id, status, notes=None):
+    _require_role(user, *STAFF)
+    _choice(status, 'status', LOST_ITEM_STATUSES)
+    repository.update_lost_item_status(item_id, status, _text(notes, 'notes', required=False))
+
+
+def submit_found_item(user, item_name, description, found_time, found_place, image=None, filename=None):
+    _require_role(user, *STAFF)
+    item_name = _text(item_name, 'item_name', 100)
+    description = _text(description, 'description')
+    found_time = _datetime(found_time, 'found_time')
+    found_place = _text(found_place, 'found_place', 100)
+    image_path = _save_image(image, filename)
+    return repository.submit_found_item(item_name, description, found_time, found_place, user['id'], image_path)
+
+
+# Unclaimed found items with their candidate owners, best first
+def list_found_items(user, after=None, page_size=repository.PAGE_SIZE):
+    _require_role(user, *STAFF)
+    items, next_cursor = repository.get_found_items(page_size=page_size, after=after)
+    matches = repository.get_item_matches(tuple(item['id'] for item in items))
+    return [dict(item, candidates=matches.get(item['id'], [])) for item in items], next_cursor
+
+
+# True when the match was recorded, False if either item was already taken
+def confirm_match(user, lost_id, found_id):
+    _require_role(user, *STAFF)
+    return repository.confirm_match(lost_id, found_id)
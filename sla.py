@@ -0,0 +1,241 @@
+import math
+from datetime import date, datetime, timedelta
+
+import jobs
+import query_cache
+import routing
+
+# Complaint lifecycle events go to sla_events: 'opened' once a complaint is
+# processed as a ticket of its own, 'assigned' the first time it gets an
+# officer, 'resolved' / 'reopened' when it leaves or re-enters the open
+# statuses and 'status' for other moves. The rollup_sla job folds them into
+# sla_hourly, sla_daily, the duration histograms in sla_durations and the
+# current open counts in sla_backlog, so reports read a few rows per day
+# however long the history is. Linked duplicates are not tickets of their
+# own and have no events.
+
+ROLLUP_INTERVAL = 60
+# Same reasoning as the points ledger: only events older than this are
+# rolled up, so one that took an earlier id but commits later is not skipped
+ROLLUP_LAG = 60
+# Durations are kept as counts per log-spaced bucket; a percentile read
+# from them is within about 12% of the exact value
+BUCKET_BASE = 1.25
+
+DIMENSIONS = ('department', 'category', 'priority')
+
+
+def department(category):
+    return routing.CATEGORY_TO_DEPARTMENT.get(category, 'Other')
+
+
+# Append an event for complaint, a row with category, priority and
+# created_at. Events are written with one batched INSERT just before
+# commit. Durations of 'assigned' and 'resolved' events run from
+# created_at to changed_at, which defaults to the commit's NOW(); pass
+# timed=False when the real time of the change is not known.
+def record(uow, complaint, kind, from_status=None, to_status=None, changed_at=None, timed=True):
+    if not hasattr(uow, 'sla_events'):
+        uow.sla_events = []
+        uow.before_commit(lambda: _flush(uow))
+    uow.sla_events.append((
+        complaint['id'], kind, from_status, to_status, department(complaint['category']),
+        complaint['category'], complaint['priority'],
+        complaint['created_at'] if timed and kind in ('assigned', 'resolved') else None, changed_at, changed_at,
+    ))
+
+
+# Events for a status and assignee change from the current row; the
+# caller passes a row that also has status and assigned_to
+def record_change(uow, current, status, assigned_to):
+    if assigned_to and current['assigned_to'] is None:
+        record(uow, current, 'assigned')
+    if status != current['status']:
+        was_open, is_open = routing.is_open(current['status']), routing.is_open(status)
+        kind = 'resolved' if was_open and not is_open else 'reopened' if is_open and not was_open else 'status'
+        record(uow, current, kind, current['status'], status)
+
+
+def _flush(uow):
+    uow.executemany("""
+        INSERT INTO sla_events (complaint_id, kind, from_status, to_status, department, category, priority,
+                                seconds, changed_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, TIMESTAMPDIFF(SECOND, %s, COALESCE(%s, NOW())), COALESCE(%s, NOW()))
+    """, uow.sla_events)
+
+
+# Fold events past the watermark into the rollups; returns the number of
+# events folded in. The watermark row lock serializes overlapping runs.
+def rollup_once(uow):
+    last_id = uow.fetchone("SELECT last_id FROM rollup_state WHERE name = 'sla' FOR UPDATE")['last_id']
+    row = uow.fetchone("""
+        SELECT id FROM sla_events
+        WHERE recorded_at < NOW() - INTERVAL %s SECOND
+        ORDER BY recorded_at DESC, id DESC
+        LIMIT 1
+    """, (ROLLUP_LAG,))
+    upto = row['id'] if row else last_id
+    if upto <= last_id:
+        return 0
+    # Ids of rolled-back inserts leave gaps, so count the events themselves
+    folded = uow.fetchone(
+        "SELECT COUNT(*) AS n FROM sla_events WHERE id > %s AND id <= %s", (last_id, upto)
+    )['n']
+    counts = """
+        SUM(kind = 'opened'), SUM(kind = 'assigned'), SUM(kind = 'resolved'), SUM(kind = 'reopened'),
+        SUM(IF(kind = 'assigned', COALESCE(seconds, 0), 0)), SUM(kind = 'assigned' AND seconds IS NOT NULL),
+        SUM(IF(kind = 'resolved', COALESCE(seconds, 0), 0)), SUM(kind = 'resolved' AND seconds IS NOT NULL)
+    """
+    updates = """
+        opened = opened + VALUES(opened), assigned = assigned + VALUES(assigned),
+        resolved = resolved + VALUES(resolved), reopened = reopened + VALUES(reopened),
+        assign_seconds = assign_seconds + VALUES(assign_seconds), assign_timed = assign_timed + VALUES(assign_timed),
+        resolve_seconds = resolve_seconds + VALUES(resolve_seconds), resolve_timed = resolve_timed + VALUES(resolve_timed)
+    """
+    for table, period in (('sla_hourly', 'TIMESTAMP(DATE(changed_at), MAKETIME(HOUR(changed_at), 0, 0))'),
+                          ('sla_daily', 'DATE(changed_at)')):
+        uow.execute(f"""
+            INSERT INTO {table} ({'hour' if table == 'sla_hourly' else 'day'}, department, category, priority,
+                                 opened, assigned, resolved, reopened,
+                                 assign_seconds, assign_timed, resolve_seconds, resolve_timed)
+            SELECT {period}, department, category, priority, {counts}
+            FROM sla_events
+            WHERE id > %s AND id <= %s
+            GROUP BY 1, department, category, priority
+            ON DUPLICATE KEY UPDATE {updates}
+        """, (last_id, upto))
+    uow.execute("""
+        INSERT INTO sla_durations (day, department, category, priority, kind, bucket, n)
+        SELECT DATE(changed_at), department, category, priority, kind,
+               FLOOR(LOG(%s, GREATEST(seconds, 1))) AS bucket, COUNT(*)
+        FROM sla_events
+        WHERE id > %s AND id <= %s AND kind IN ('assigned', 'resolved') AND seconds IS NOT NULL
+        GROUP BY 1, department, category, priority, kind, bucket
+        ON DUPLICATE KEY UPDATE n = n + VALUES(n)
+    """, (BUCKET_BASE, last_id, upto))
+    uow.execute("""
+        INSERT INTO sla_backlog (department, category, priority, open_count)
+        SELECT department, category, priority,
+               SUM(CASE kind WHEN 'opened' THEN 1 WHEN 'reopened' THEN 1 WHEN 'resolved' THEN -1 ELSE 0 END)
+        FROM sla_events
+        WHERE id > %s AND id <= %s
+        GROUP BY department, category, priority
+        ON DUPLICATE KEY UPDATE open_count = open_count + VALUES(open_count)
+    """, (last_id, upto))
+    uow.execute("UPDATE rollup_state SET last_id = %s WHERE name = 'sla'", (upto,))
+    uow.after_commit(lambda: query_cache.bump('sla_rollups'))
+    return folded
+
+
+# Periodic job: roll up, then schedule the next run
+@jobs.handler('rollup_sla')
+def rollup(uow, payload=None):
+    rollup_once(uow)
+    jobs.enqueue(uow, 'rollup_sla', {}, delay=ROLLUP_INTERVAL)
+
+
+# Seconds at the middle of a bucket
+def bucket_seconds(bucket):
+    return BUCKET_BASE ** (bucket + 0.5)
+
+
+def percentile(histogram, q):
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = math.ceil(q * total)
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return bucket_seconds(bucket)
+
+
+def _filter(filters):
+    conditions, params = [], []
+    for column in DIMENSIONS:
+        if filters.get(column):
+            conditions.append(f'{column} = %s')
+            params.append(filters[column])
+    return ''.join(f' AND {condition}' for condition in conditions), params
+
+
+# Per-group figures for the days since `since`: counts, current backlog,
+# average and percentile times to assign and resolve. group is one of
+# DIMENSIONS; filters narrow any of them to one value.
+def summary(uow, since, group, **filters):
+    if group not in DIMENSIONS:
+        raise ValueError(f'unknown dimension {group!r}')
+    where, params = _filter(filters)
+    groups = {}
+    for row in uow.fetchall(f"""
+        SELECT {group} AS name, SUM(opened) AS opened, SUM(assigned) AS assigned,
+               SUM(resolved) AS resolved, SUM(reopened) AS reopened,
+               SUM(assign_seconds) AS assign_seconds, SUM(assign_timed) AS assign_timed,
+               SUM(resolve_seconds) AS resolve_seconds, SUM(resolve_timed) AS resolve_timed
+        FROM sla_daily
+        WHERE day >= %s{where}
+        GROUP BY {group}
+    """, [since] + params):
+        groups[row['name']] = {
+            'opened': int(row['opened']), 'assigned': int(row['assigned']),
+            'resolved': int(row['resolved']), 'reopened': int(row['reopened']),
+            'avg_assign_seconds': row['assign_seconds'] / row['assign_timed'] if row['assign_timed'] else None,
+            'avg_resolve_seconds': row['resolve_seconds'] / row['resolve_timed'] if row['resolve_timed'] else None,
+        }
+    for row in uow.fetchall(f"""
+        SELECT {group} AS name, SUM(open_count) AS open
+        FROM sla_backlog
+        WHERE 1 = 1{where}
+        GROUP BY {group}
+    """, params):
+        groups.setdefault(row['name'], {'opened': 0, 'assigned': 0, 'resolved': 0, 'reopened': 0,
+                                        'avg_assign_seconds': None, 'avg_resolve_seconds': None})
+        groups[row['name']]['backlog'] = int(row['open'])
+    histograms = {}
+    for row in uow.fetchall(f"""
+        SELECT {group} AS name, kind, bucket, SUM(n) AS n
+        FROM sla_durations
+        WHERE day >= %s{where}
+        GROUP BY {group}, kind, bucket
+    """, [since] + params):
+        histograms.setdefault((row['name'], row['kind']), {})[row['bucket']] = int(row['n'])
+    for name, figures in groups.items():
+        figures.setdefault('backlog', 0)
+        for kind, label in (('assigned', 'assign'), ('resolved', 'resolve')):
+            histogram = histograms.get((name, kind), {})
+            for q in (0.5, 0.9, 0.99):
+                figures[f'p{round(q * 100)}_{label}_seconds'] = percentile(histogram, q)
+    return groups
+
+
+# Opened, resolved and open backlog per day (period='day') or per hour
+# (period='hour') since `since`. The backlog at the end of each period is
+# the current one less everything rolled up after it.
+def trend(uow, since, period='day', **filters):
+    table, column = ('sla_daily', 'day') if period == 'day' else ('sla_hourly', 'hour')
+    where, params = _filter(filters)
+    rows = uow.fetchall(f"""
+        SELECT {column} AS period, SUM(opened) AS opened, SUM(reopened) AS reopened, SUM(resolved) AS resolved
+        FROM {table}
+        WHERE {column} >= %s{where}
+        GROUP BY {column}
+        ORDER BY {column}
+    """, [since] + params)
+    backlog = uow.fetchone(f"SELECT COALESCE(SUM(open_count), 0) AS open FROM sla_backlog WHERE 1 = 1{where}", params)
+    backlog = int(backlog['open'])
+    series = []
+    for row in reversed(rows):
+        series.append({'period': row['period'], 'opened': int(row['opened']),
+                       'resolved': int(row['resolved']), 'backlog': backlog})
+        backlog -= int(row['opened']) + int(row['reopened']) - int(row['resolved'])
+    series.reverse()
+    return series
+
+
+def days_ago(days):
+    return date.today() - timedelta(days=days - 1)
+
+
+def hours_ago(hours):
+    return datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import tempfile
+import uuid
+
+from PIL import Image, ImageOps
+
+# Uploads are stored once per distinct content under
+# uploads/<h[:2]>/<h[2:4]>/<sha256><ext>
+UPLOAD_DIR = os.environ.get('SBMS_UPLOAD_DIR', 'uploads')
+CHUNK_SIZE = 1024 * 1024
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+# Ingest normalization for photos
+MAX_DIMENSION = int(os.environ.get('SBMS_UPLOAD_MAX_DIMENSION', '2048'))
+JPEG_QUALITY = 85
+# Raw uploads wait here until a background job stores them by content
+INCOMING_DIR = os.path.join(UPLOAD_DIR, 'incoming')
+
+
+def content_path(digest, extension):
+    return os.path.join(UPLOAD_DIR, digest[:2], digest[2:4], f'{digest}{extension}')
+
+
+# Stored files are named by their SHA-256 and never change in place
+def is_content_path(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return len(stem) == 64 and all(c in '0123456789abcdef' for c in stem)
+
+
+def _temp_file():
+    tmp_dir = os.path.join(UPLOAD_DIR, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tempfile.mkstemp(dir=tmp_dir)
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Cap dimensions, apply and drop EXIF (orientation, GPS, camera data) and
+# re-encode compactly; returns the normalized temp file and its extension
+def normalize_image(path):
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION))
+        fd, out_path = _temp_file()
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+                if has_alpha:
+                    image.save(out, 'PNG', optimize=True)
+                    extension = '.png'
+                else:
+                    image.convert('RGB').save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+                    extension = '.jpg'
+        except BaseException:
+            os.remove(out_path)
+            raise
+    return out_path, extension
+
+
+# Stream a file-like upload to disk in chunks and store it by content hash.
+# Identical content is stored once; the stored path is returned.
+def save_upload(fileobj, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    fd, tmp_path = _temp_file()
+    try:
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+                out.write(chunk)
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        if extension in IMAGE_EXTENSIONS:
+            try:
+                normalized_path, extension = normalize_image(tmp_path)
+            except (OSError, Image.DecompressionBombError):
+                # Not a decodable image; keep the bytes as uploaded
+                pass
+            else:
+                os.remove(tmp_path)
+                tmp_path = normalized_path
+                digest = _hash_file(tmp_path)
+        path = content_path(digest, extension)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            # Marks the file as in use again for the archive job, which
+            # removes hot files only once nothing hot refers to them
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Copy an upload to uploads/incoming as-is. This is all the request path
+# does; hashing and normalization happen in store_incoming().
+def save_incoming(fileobj, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if hasattr(fileobj, 'seek'):
+        fileobj.seek(0)
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    path = os.path.join(INCOMING_DIR, f'{uuid.uuid4().hex}{extension}')
+    fd, tmp_path = _temp_file()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+                out.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def is_incoming(path):
+    return bool(path) and os.path.dirname(os.path.abspath(path)) == os.path.abspath(INCOMING_DIR)
+
+
+# Store an incoming file by content; the caller removes the incoming copy
+# once the new path is committed, so a retried job can store it again
+def store_incoming(path):
+    with open(path, 'rb') as f:
+        return save_upload(f, path)
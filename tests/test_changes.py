@@ -0,0 +1,113 @@
+from datetime import datetime
+
+import changes
+
+
+class FakeFeed:
+    # change_events as other connections see it: uncommitted rows are
+    # invisible, and age stands in for NOW() - changed_at
+    def __init__(self):
+        self.events = []
+
+    def write(self, event_id, entity_id, op='update', entity='complaints', age=0, committed=True):
+        event = {'id': event_id, 'entity': entity, 'entity_id': entity_id, 'op': op,
+                 'age': age, 'committed': committed}
+        self.events.append(event)
+        return event
+
+    def age(self, seconds):
+        for event in self.events:
+            event['age'] += seconds
+
+    def _visible(self):
+        return sorted((e for e in self.events if e['committed']), key=lambda e: e['id'])
+
+    def fetchall(self, sql, params):
+        assert sql == changes.SINCE_SQL
+        lag, table, cursor, limit = params
+        rows = [
+            {'id': e['id'], 'entity_id': e['entity_id'], 'op': e['op'], 'settled': e['age'] > lag}
+            for e in self._visible() if e['entity'] == table and e['id'] > cursor
+        ]
+        return rows[:limit]
+
+    def fetchone(self, sql, params):
+        assert sql == changes.LATEST_SQL
+        lag, = params
+        settled = [e for e in self._visible() if e['age'] > lag]
+        return {'id': settled[-1]['id']} if settled else None
+
+
+def test_out_of_order_commit_is_not_lost():
+    feed = FakeFeed()
+    feed.write(1, 10, age=100)
+    slow = feed.write(2, 20, committed=False)  # took its id first, commits last
+    feed.write(3, 30)
+    cursor = changes.latest(feed)
+    assert cursor == 1
+
+    events, cursor = changes.since(feed, 'complaints', cursor)
+    assert events == [(30, 'update')]
+    assert cursor == 1
+
+    slow['committed'] = True
+    events, cursor = changes.since(feed, 'complaints', cursor)
+    assert events == [(20, 'update'), (30, 'update')]
+
+    feed.age(changes.CURSOR_LAG + 1)
+    events, cursor = changes.since(feed, 'complaints', cursor)
+    assert events == [(20, 'update'), (30, 'update')]
+    assert cursor == 3
+    assert changes.since(feed, 'complaints', cursor) == ([], 3)
+
+
+def test_latest_starts_from_zero_until_an_event_settles():
+    feed = FakeFeed()
+    assert changes.latest(feed) == 0
+    feed.write(1, 10)
+    assert changes.latest(feed) == 0
+    assert changes.since(feed, 'complaints', changes.latest(feed)) == ([(10, 'update')], 0)
+
+
+def test_cursor_passes_a_gap_once_later_events_settle():
+    feed = FakeFeed()
+    feed.write(1, 10, age=100)
+    feed.write(2, 20, age=100, committed=False)  # rolled back
+    feed.write(3, 30, age=100)
+    assert changes.since(feed, 'complaints', 0) == ([(10, 'update'), (30, 'update')], 3)
+
+
+def test_since_filters_by_entity_and_gives_up_past_max_events():
+    feed = FakeFeed()
+    feed.write(1, 10, entity='lost_items', age=100)
+    feed.write(2, 20, op='delete', age=100)
+    assert changes.since(feed, 'complaints', 0) == ([(20, 'delete')], 2)
+    for event_id in range(3, changes.MAX_EVENTS + 4):
+        feed.write(event_id, event_id)
+    assert changes.since(feed, 'complaints', 2) == (None, 2)
+
+
+def test_settled_cursor_stops_at_first_unsettled_event():
+    rows = [{'id': 4, 'settled': True}, {'id': 6, 'settled': False}, {'id': 7, 'settled': True}]
+    assert changes.settled_cursor(rows, 3) == 4
+    assert changes.settled_cursor([], 3) == 3
+
+
+def row(row_id, day):
+    return {'id': row_id, 'created_at': datetime(2024, 9, day)}
+
+
+def test_patch_replaces_changed_rows_and_drops_removed():
+    rows = [row(3, 3), row(2, 2), row(1, 1)]
+    patched, next_cursor = changes.patch(rows, None, [dict(row(2, 2), status='Resolved')], [3], 20)
+    assert [r['id'] for r in patched] == [2, 1]
+    assert patched[0]['status'] == 'Resolved'
+    assert next_cursor is None
+
+
+def test_patch_leaves_older_rows_to_later_pages():
+    rows = [row(5, 5), row(4, 4)]
+    cursor = (rows[-1]['created_at'], 4)
+    patched, next_cursor = changes.patch(rows, cursor, [row(6, 6), row(1, 1)], [], 2)
+    assert [r['id'] for r in patched] == [6, 5]
+    assert next_cursor == (datetime(2024, 9, 5), 5)
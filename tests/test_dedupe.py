@@ -0,0 +1,52 @@
+import dedupe
+
+TITLE = 'Projector not working'
+DESCRIPTION = 'The projector in lecture hall B flickers and then turns off during every lecture'
+
+
+def test_shingles_are_words_and_bigrams():
+    assert dedupe.shingles('Broken tap', 'tap leaks') == {'broken', 'tap', 'leak', 'broken tap', 'tap tap', 'tap leak'}
+
+
+def test_signature_is_deterministic_and_none_without_words():
+    sig = dedupe.signature(TITLE, DESCRIPTION)
+    assert len(sig) == dedupe.NUM_PERM
+    assert sig == dedupe.signature(TITLE, DESCRIPTION)
+    assert dedupe.signature('the', 'of a') is None
+
+
+def test_pack_round_trips():
+    sig = dedupe.signature(TITLE, DESCRIPTION)
+    assert list(dedupe.unpack(dedupe.pack(sig))) == sig
+    assert list(dedupe.unpack(bytearray(dedupe.pack(sig)))) == sig
+
+
+def test_similarity_estimates_shingle_jaccard():
+    other = ('Projector flickers', 'Projector in lecture hall B flickers and turns off')
+    first, second = dedupe.shingles(TITLE, DESCRIPTION), dedupe.shingles(*other)
+    exact = len(first & second) / len(first | second)
+    estimate = dedupe.similarity(dedupe.signature(TITLE, DESCRIPTION), dedupe.signature(*other))
+    assert abs(estimate - exact) < 0.15
+
+
+def test_band_keys_cover_each_band_once():
+    keys = dedupe.band_keys(dedupe.signature(TITLE, DESCRIPTION))
+    assert [band for band, _ in keys] == list(range(dedupe.BANDS))
+    assert dedupe.ROWS * dedupe.BANDS == dedupe.NUM_PERM
+
+
+def test_band_changes_only_when_one_of_its_rows_does():
+    sig = dedupe.signature(TITLE, DESCRIPTION)
+    changed = list(sig)
+    changed[dedupe.ROWS] ^= 1  # first row of band 1
+    before, after = dedupe.band_keys(sig), dedupe.band_keys(changed)
+    assert [band for (band, a), (_, b) in zip(before, after) if a != b] == [1]
+
+
+def test_near_duplicates_share_a_band_and_unrelated_reports_do_not():
+    sig = dedupe.signature(TITLE, DESCRIPTION)
+    near = dedupe.signature('Projector not working', 'Projector in lecture hall B flickers then turns off in every lecture')
+    other = dedupe.signature('Water leak', 'Water dripping from the ceiling of the second floor corridor')
+    assert set(dedupe.band_keys(sig)) & set(dedupe.band_keys(near))
+    assert not set(dedupe.band_keys(sig)) & set(dedupe.band_keys(other))
+    assert dedupe.similarity(sig, near) >= dedupe.LINK_THRESHOLD
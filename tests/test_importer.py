@@ -0,0 +1,41 @@
+import io
+
+import importer
+
+
+class InterleavingUow:
+    # Hands out ids the way innodb_autoinc_lock_mode=2 may under concurrent
+    # inserts: increasing, but with other sessions' ids in between
+    def __init__(self):
+        self.rows = []
+        self.next_id = 100
+
+    def executemany(self, sql, values):
+        for row in values:
+            self.rows.append({'id': self.next_id, 'import_key': row[-1]})
+            self.next_id += 3
+
+    def fetchall(self, sql, keys):
+        return [row for row in reversed(self.rows) if row['import_key'] in keys]
+
+
+def test_insert_keyed_reads_ids_back_by_key():
+    uow = InterleavingUow()
+    uow.next_id = 7
+    ids = importer._insert_keyed(uow, 'complaints', 'INSERT ...', [2, 5, 9], [('a',), ('b',), ('c',)])
+    assert ids == [7, 10, 13]
+    keys = [row['import_key'] for row in uow.rows]
+    assert len(set(keys)) == 3 and all(key.endswith(f':{line}') for key, line in zip(keys, [2, 5, 9]))
+
+
+def test_read_rows_reports_bad_json_lines():
+    text = io.StringIO('{"a": 1}\n\nnot json\n[1]\n')
+    rows = list(importer.read_rows(text, 'jsonl'))
+    assert rows[0] == (1, {'a': 1})
+    assert [line for line, _ in rows[1:]] == [3, 4]
+    assert all(isinstance(row, importer.RowError) for _, row in rows[1:])
+
+
+def test_format_for():
+    assert importer.format_for('legacy.jsonl.gz') == 'jsonl'
+    assert importer.format_for('officers.csv') == 'csv'
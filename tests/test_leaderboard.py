@@ -0,0 +1,92 @@
+import time
+
+import leaderboard
+
+
+# A board loaded with {user_id: points}, without touching the database
+def loaded(points, capacity=3):
+    board = leaderboard.Leaderboard(capacity=capacity, max_age=3600)
+    board._keys = sorted((-p, user_id) for user_id, p in points.items())
+    board._entries = {user_id: {'id': user_id, 'username': f'u{user_id}', 'points': p}
+                      for user_id, p in points.items()}
+    board._loaded_at = time.monotonic()
+    return board
+
+
+def ranking(board):
+    return [(user_id, -points) for points, user_id in board._keys]
+
+
+def test_record_before_a_load_does_nothing():
+    board = leaderboard.Leaderboard(capacity=3)
+    board.record(1, 10)
+    assert board._keys is None
+
+
+def test_entry_moves_up_inside_the_prefix():
+    board = loaded({1: 30, 2: 20, 3: 10})
+    board.record(3, 25)
+    assert ranking(board) == [(1, 30), (3, 25), (2, 20)]
+    assert board.top(2) == [{'username': 'u1', 'points': 30, 'role': 'student'},
+                            {'username': 'u3', 'points': 25, 'role': 'student'}]
+
+
+def test_ties_rank_by_id_as_the_load_query_does():
+    board = loaded({1: 30, 2: 20, 5: 10})
+    board.record(5, 20)
+    assert ranking(board) == [(1, 30), (2, 20), (5, 20)]
+
+
+def test_last_entry_gaining_points_stays_without_a_reload():
+    board = loaded({1: 30, 2: 20, 3: 10})
+    board.record(3, 12)
+    assert ranking(board) == [(1, 30), (2, 20), (3, 12)]
+
+
+def test_room_left_below_a_partial_board_keeps_the_entry():
+    board = loaded({1: 30, 2: 20}, capacity=3)
+    board.record(2, 5)
+    assert ranking(board) == [(1, 30), (2, 5)]
+
+
+def test_entry_past_the_end_of_a_full_board_forces_a_reload():
+    # Points only grow, but a stale reload could still leave one behind
+    board = loaded({1: 30, 2: 20, 3: 10})
+    board.record(1, 5)
+    assert board._keys is None
+
+
+def test_outsider_below_a_full_board_is_ignored():
+    board = loaded({1: 30, 2: 20, 3: 10})
+    board.record(4, 5)
+    assert ranking(board) == [(1, 30), (2, 20), (3, 10)]
+    assert 4 not in board._entries
+
+
+def test_outsider_entering_the_board_forces_a_reload():
+    board = loaded({1: 30, 2: 20, 3: 10})
+    board.record(4, 15)
+    assert board._keys is None
+
+
+def test_outsider_on_a_partial_board_forces_a_reload():
+    # Their username is unknown, and they may not be a student at all
+    board = loaded({1: 30}, capacity=3)
+    board.record(4, 1)
+    assert board._keys is None
+
+
+def test_board_over_capacity_evicts_the_last_entry():
+    board = loaded({1: 30, 2: 20, 3: 10, 4: 5})
+    board.capacity = 4
+    board._keys.append((-1, 9))
+    board._entries[9] = {'id': 9, 'username': 'u9', 'points': 1}
+    board.record(4, 25)
+    assert ranking(board) == [(1, 30), (4, 25), (2, 20), (3, 10)]
+    assert 9 not in board._entries
+
+
+def test_invalidate_forces_a_reload():
+    board = loaded({1: 30})
+    board.invalidate()
+    assert board._keys is None
@@ -0,0 +1,75 @@
+from datetime import date
+
+import pytest
+
+import ledger
+
+
+@pytest.mark.parametrize('day, start', [
+    (date(2026, 1, 1), date(2026, 1, 1)),
+    (date(2026, 1, 31), date(2026, 1, 1)),
+    (date(2026, 2, 28), date(2026, 2, 1)),
+    (date(2028, 2, 29), date(2028, 2, 1)),
+    (date(2026, 12, 31), date(2026, 12, 1)),
+])
+def test_month_start(day, start):
+    assert ledger.month_start(day) == start
+
+
+@pytest.mark.parametrize('day, start', [
+    (date(2026, 1, 1), date(2026, 1, 1)),
+    (date(2026, 6, 30), date(2026, 1, 1)),
+    (date(2026, 7, 1), date(2026, 7, 1)),
+    (date(2026, 12, 31), date(2026, 7, 1)),
+])
+def test_semester_start(day, start):
+    assert ledger.semester_start(day) == start
+
+
+def test_every_period_starts_on_a_month_boundary():
+    # points_monthly is keyed by month, so a period must start on one
+    for start_of in ledger.PERIODS.values():
+        for month in range(1, 13):
+            assert start_of(date(2026, month, 17)).day == 1
+
+
+class FakeUow:
+    # Rolled-up monthly totals and the ledger rows past the watermark
+    def __init__(self, monthly, tail, names):
+        self.monthly, self.tail, self.names = monthly, tail, names
+        self.starts = []
+
+    def fetchone(self, sql, params=()):
+        return {'last_id': 10}
+
+    def fetchall(self, sql, params=()):
+        if 'FROM points_ledger' in sql:
+            self.starts.append(params[1])
+            return [{'user_id': user_id, 'points': points} for user_id, points in self.tail.items()]
+        if 'FROM points_monthly' in sql:
+            self.starts.append(params[0])
+            if 'user_id IN' in sql:
+                wanted = set(params[1:])
+                return [{'user_id': u, 'points': p} for u, p in self.monthly.items() if u in wanted]
+            # Without a tie-breaker ties come back in whatever order rows are found
+            order = (lambda item: (-item[1], item[0])) if 'points DESC, user_id' in sql else (lambda item: -item[1])
+            ranked = sorted(self.monthly.items(), key=order)[:params[1]]
+            return [{'user_id': u, 'points': p} for u, p in ranked]
+        return [{'id': user_id, 'username': name} for user_id, name in self.names.items() if user_id in params]
+
+
+def test_top_adds_the_ledger_tail_to_the_rollup():
+    uow = FakeUow(monthly={1: 10, 2: 8, 3: 1}, tail={3: 9}, names={1: 'ana', 2: 'ben', 3: 'cy'})
+    board = ledger.top(uow, 'semester', n=2, today=date(2026, 9, 14))
+    assert [(row['username'], row['points']) for row in board] == [('ana', 10), ('cy', 10)]
+    assert set(uow.starts) == {date(2026, 7, 1)}
+
+
+def test_top_breaks_ties_at_the_cut_off_on_user_id():
+    uow = FakeUow(monthly={5: 10, 2: 10, 1: 3}, tail={}, names={1: 'ana', 2: 'ben', 5: 'eve'})
+    board = ledger.top(uow, 'month', n=1, today=date(2026, 9, 14))
+    assert [row['username'] for row in board] == ['ben']
+
+
+def test_top_is_empty_without_points():
+    assert ledger.top(FakeUow({}, {}, {}), 'month', today=date(2026, 9, 14)) == []
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import matching
+
+LOST_AT = datetime(2026, 3, 2, 10, 0)
+
+
+def item(name, place='library', description='', when=LOST_AT, image_hash=None):
+    return {'name': name, 'description': description, 'place': place, 'time': when, 'image_hash': image_hash}
+
+
+def test_tokenize_drops_stopwords_and_folds_plurals():
+    assert matching.tokenize('The keys of my Glass') == ['key', 'glass']
+    assert matching.tokenize(None) == []
+
+
+def test_item_tokens_put_name_first_without_repeats():
+    assert matching.item_tokens('Black wallet', 'black leather wallet', 'Library') == [
+        'black', 'wallet', 'library', 'leather',
+    ]
+
+
+def test_identical_report_found_at_once_scores_one():
+    total, parts = matching.score(item('black wallet'), item('black wallet'))
+    assert total == 1.0
+    assert 'image' not in parts
+
+
+@pytest.mark.parametrize('days, in_window', [(-2, False), (-1, True), (14, True), (15, False)])
+def test_found_items_outside_the_window_are_not_scored(days, in_window):
+    found = item('black wallet', when=LOST_AT + timedelta(days=days))
+    assert (matching.score(item('black wallet'), found) is not None) == in_window
+
+
+def test_time_part_falls_linearly_and_not_above_one_before_the_loss():
+    _, early = matching.score(item('wallet'), item('wallet', when=LOST_AT - timedelta(hours=12)))
+    _, late = matching.score(item('wallet'), item('wallet', when=LOST_AT + timedelta(days=7)))
+    assert early['time'] == 1.0
+    assert late['time'] == pytest.approx(0.5)
+
+
+def test_name_overlap_floors_the_text_part():
+    lost = item('blue umbrella', description='left it by the stairs after the maths lecture on tuesday')
+    found = item('blue umbrella', description='found folded')
+    _, parts = matching.score(lost, found)
+    name_only = 0.8 * matching.jaccard(['blue', 'umbrella'], ['blue', 'umbrella'])
+    assert parts['text'] == pytest.approx(name_only)
+
+
+def test_image_part_counts_only_when_both_sides_have_a_hash():
+    total, parts = matching.score(item('phone', image_hash=0), item('phone', image_hash=(1 << 32) - 1))
+    assert parts['image'] == 0.5
+    assert total == pytest.approx(1 - matching.WEIGHTS['image'] * 0.5)
+    _, parts = matching.score(item('phone', image_hash=0), item('phone'))
+    assert 'image' not in parts
+
+
+def test_unrelated_items_score_below_the_threshold():
+    total, _ = matching.score(item('black wallet', place='library'),
+                              item('red bicycle', place='car park', when=LOST_AT + timedelta(days=10)))
+    assert total < matching.MIN_SCORE
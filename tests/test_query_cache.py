@@ -0,0 +1,118 @@
+from mysql.connector import Error
+
+import query_cache
+
+
+class FakeStore:
+    # cache_versions shared by several QueryCache instances, one per process
+    def __init__(self):
+        self.versions = {}
+        self.fail = False
+
+    def load(self):
+        if self.fail:
+            raise Error('down')
+        return dict(self.versions)
+
+    def bump(self, tables):
+        if self.fail:
+            raise Error('down')
+        for table in tables:
+            self.versions[table] = self.versions.get(table, 0) + 1
+        return {table: self.versions[table] for table in tables}
+
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [{'calls': self.calls}]
+
+
+def test_bump_in_another_process_invalidates_after_sync():
+    store = FakeStore()
+    api_worker = query_cache.QueryCache(store=store, sync_interval=3600)
+    job_worker = query_cache.QueryCache(store=store, sync_interval=3600)
+    loader = Loader()
+    api_worker.get_or_load('key', ('complaints',), loader)
+    api_worker.get_or_load('key', ('complaints',), loader)
+    assert loader.calls == 1
+
+    job_worker.bump('complaints')
+    api_worker.sync()
+    api_worker.get_or_load('key', ('complaints',), loader)
+    assert loader.calls == 2
+
+
+def test_shared_versions_are_not_overtaken_by_local_bumps():
+    store = FakeStore()
+    first = query_cache.QueryCache(store=store, sync_interval=3600)
+    second = query_cache.QueryCache(store=store, sync_interval=3600)
+    loader = Loader()
+    for _ in range(3):
+        first.bump('users')
+    first.get_or_load('key', ('users',), loader)
+    second.bump('users')
+    first.sync()
+    first.get_or_load('key', ('users',), loader)
+    assert loader.calls == 2
+
+
+def test_unreachable_store_falls_back_to_local_versions():
+    store = FakeStore()
+    cache = query_cache.QueryCache(store=store, sync_interval=0)
+    loader = Loader()
+    cache.get_or_load('key', ('users',), loader)
+    store.fail = True
+    cache.bump('users')
+    cache.get_or_load('key', ('users',), loader)
+    assert loader.calls == 2
+
+
+def test_bump_invalidates_only_entries_reading_the_table():
+    cache = query_cache.QueryCache()
+    complaints, users = Loader(), Loader()
+    cache.get_or_load('complaints', ('complaints', 'users'), complaints)
+    cache.get_or_load('users', ('users',), users)
+    cache.bump('complaints')
+    cache.get_or_load('complaints', ('complaints', 'users'), complaints)
+    cache.get_or_load('users', ('users',), users)
+    assert (complaints.calls, users.calls) == (2, 1)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, 'monotonic', lambda: now[0])
+    cache = query_cache.QueryCache(ttl=30)
+    loader = Loader()
+    cache.get_or_load('key', ('users',), loader)
+    now[0] += 29
+    cache.get_or_load('key', ('users',), loader)
+    assert loader.calls == 1
+    now[0] += 2
+    cache.get_or_load('key', ('users',), loader)
+    assert loader.calls == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = query_cache.QueryCache(max_entries=2)
+    loaders = {key: Loader() for key in 'abc'}
+    cache.get_or_load('a', (), loaders['a'])
+    cache.get_or_load('b', (), loaders['b'])
+    cache.get_or_load('a', (), loaders['a'])
+    cache.get_or_load('c', (), loaders['c'])
+    assert cache.stats()['entries'] == 2
+    cache.get_or_load('a', (), loaders['a'])
+    cache.get_or_load('b', (), loaders['b'])
+    assert (loaders['a'].calls, loaders['b'].calls) == (1, 2)
+
+
+def test_callers_cannot_change_cached_results():
+    cache = query_cache.QueryCache()
+    loader = Loader()
+    cache.get_or_load('key', (), loader)[0]['calls'] = 'edited on load'
+    cache.get_or_load('key', (), loader)[0]['calls'] = 'edited on hit'
+    assert cache.get_or_load('key', (), loader) == [{'calls': 1}]
+    assert loader.calls == 1
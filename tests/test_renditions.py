@@ -0,0 +1,29 @@
+import hashlib
+import os
+
+import renditions
+import storage
+
+
+def write(path, data=b'image bytes'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_touching_a_stored_file_keeps_its_renditions(tmp_path):
+    digest = hashlib.sha256(b'image bytes').hexdigest()
+    path = write(str(tmp_path / digest[:2] / digest[2:4] / f'{digest}.jpg'))
+    assert storage.is_content_path(path)
+    before = renditions.rendition_path(path, 'thumb')
+    os.utime(path, ns=(1, 1))
+    assert renditions.rendition_path(path, 'thumb') == before
+
+
+def test_replacing_another_file_changes_its_renditions(tmp_path):
+    path = write(str(tmp_path / 'legacy.jpg'))
+    assert not storage.is_content_path(path)
+    before = renditions.rendition_path(path, 'thumb')
+    os.utime(path, ns=(1, 1))
+    assert renditions.rendition_path(path, 'thumb') != before
@@ -0,0 +1,81 @@
+import routing
+
+
+class FakeUow:
+    # Officers as (id, department, open_count) rows of the load query
+    def __init__(self, officers):
+        self.officers = officers
+        self.loads = 0
+
+    def fetchall(self, sql, params=()):
+        assert tuple(params) == routing.OPEN_STATUSES
+        self.loads += 1
+        return [{'id': officer_id, 'department': department, 'open_count': open_count}
+                for officer_id, department, open_count in self.officers]
+
+
+OFFICERS = [(4, 'Electrical', 2), (3, 'Electrical', 1), (7, 'Electrical', 1), (9, 'Plumbing', 0)]
+
+
+def test_assign_picks_the_least_loaded_officer_and_reserves_the_slot():
+    table, uow = routing.RoutingTable(max_age=3600), FakeUow(OFFICERS)
+    assert table.assign(uow, 'Electrical Issues') == 3
+    assert table.assign(uow, 'Electrical Issues') == 7
+    assert table.assign(uow, 'Electrical Issues') == 3
+    assert table.workload() == {4: 2, 3: 3, 7: 2, 9: 0}
+    assert uow.loads == 1
+
+
+def test_assign_without_an_officer_for_the_category():
+    table, uow = routing.RoutingTable(max_age=3600), FakeUow(OFFICERS)
+    assert table.assign(uow, 'Security Concerns') is None
+    assert table.assign(uow, 'No such category') is None
+    assert table.workload() == {4: 2, 3: 1, 7: 1, 9: 0}
+
+
+def test_assign_many_spreads_each_department_over_its_officers():
+    table, uow = routing.RoutingTable(max_age=3600), FakeUow(OFFICERS)
+    categories = ['Electrical Issues'] * 5 + ['Water & Sanitation', 'Security Concerns']
+    assert table.assign_many(uow, categories) == [3, 7, 3, 4, 7, 9, None]
+    assert table.workload() == {4: 3, 3: 3, 7: 3, 9: 1}
+
+
+def test_release_returns_a_slot_that_was_not_committed():
+    table, uow = routing.RoutingTable(max_age=3600), FakeUow(OFFICERS)
+    officer_id = table.assign(uow, 'Water & Sanitation')
+    table.release(officer_id)
+    table.release(officer_id)
+    assert table.workload()[9] == 0
+
+
+def test_moved_between_officers_and_open_and_closed_states():
+    table, uow = routing.RoutingTable(max_age=3600), FakeUow(OFFICERS)
+    table.assign_many(uow, [])
+    table.moved(4, True, 3, True)  # reassigned while open
+    assert table.workload() == {4: 1, 3: 2, 7: 1, 9: 0}
+    table.moved(3, True, 3, False)  # resolved
+    table.moved(7, False, 7, False)  # closed after resolving
+    assert table.workload() == {4: 1, 3: 1, 7: 1, 9: 0}
+    table.moved(7, False, 7, True)  # reopened
+    table.moved(None, False, 9, True)  # first assignment
+    assert table.workload() == {4: 1, 3: 1, 7: 2, 9: 1}
+
+
+def test_moved_ignores_unknown_officers_and_unloaded_tables():
+    table = routing.RoutingTable(max_age=3600)
+    table.moved(4, True, 3, True)
+    assert table.workload() == {}
+    table.assign_many(FakeUow(OFFICERS), [])
+    table.moved(4, True, 99, True)
+    assert table.workload() == {4: 1, 3: 1, 7: 1, 9: 0}
+
+
+def test_stale_or_invalidated_table_reloads():
+    table, uow = routing.RoutingTable(max_age=3600), FakeUow(OFFICERS)
+    table.assign(uow, 'Electrical Issues')
+    table.invalidate()
+    table.assign(uow, 'Electrical Issues')
+    assert uow.loads == 2
+    table.max_age = -1
+    table.assign(uow, 'Electrical Issues')
+    assert uow.loads == 3
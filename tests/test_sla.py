@@ -0,0 +1,47 @@
+import math
+
+import pytest
+
+import sla
+
+
+# The bucket the rollup's FLOOR(LOG(BUCKET_BASE, GREATEST(seconds, 1))) gives
+def bucket(seconds):
+    return math.floor(math.log(max(seconds, 1), sla.BUCKET_BASE))
+
+
+@pytest.mark.parametrize('seconds', [1, 59, 60, 3600, 86400, 30 * 86400])
+def test_bucket_midpoint_is_within_the_stated_error(seconds):
+    assert abs(sla.bucket_seconds(bucket(seconds)) - seconds) / seconds <= 0.12
+
+
+def test_percentile_of_an_empty_histogram_is_none():
+    assert sla.percentile({}, 0.5) is None
+    assert sla.percentile({3: 0}, 0.5) is None
+
+
+def test_percentile_picks_the_bucket_holding_the_rank():
+    histogram = {10: 50, 20: 40, 30: 10}
+    assert sla.percentile(histogram, 0.5) == sla.bucket_seconds(10)
+    assert sla.percentile(histogram, 0.51) == sla.bucket_seconds(20)
+    assert sla.percentile(histogram, 0.9) == sla.bucket_seconds(20)
+    assert sla.percentile(histogram, 0.99) == sla.bucket_seconds(30)
+    assert sla.percentile(histogram, 1.0) == sla.bucket_seconds(30)
+
+
+def test_percentile_ignores_histogram_order():
+    assert sla.percentile({30: 1, 10: 1, 20: 1}, 0.5) == sla.bucket_seconds(20)
+
+
+def test_percentiles_track_exact_values():
+    durations = [60 * minutes for minutes in range(1, 1001)]
+    histogram = {}
+    for seconds in durations:
+        histogram[bucket(seconds)] = histogram.get(bucket(seconds), 0) + 1
+    for q in (0.5, 0.9, 0.99):
+        exact = durations[math.ceil(q * len(durations)) - 1]
+        assert abs(sla.percentile(histogram, q) - exact) / exact <= 0.12
+
+
+def test_department_falls_back_to_other():
+    assert sla.department('No such category') == 'Other'
@@ -0,0 +1,39 @@
+import argparse
+import logging
+import sys
+import time
+
+import jobs
+import repository  # registers the job handlers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run background job workers')
+    parser.add_argument('--workers', type=int, default=max(jobs.WORKERS, 1), help='worker threads')
+    parser.add_argument('--once', action='store_true', help='run queued jobs until the queue is empty, then exit')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    if args.once:
+        jobs.maintain()
+        total = 0
+        while True:
+            claimed = jobs.work_once(f'{jobs.WorkerPool().name}:once')
+            if not claimed:
+                break
+            total += claimed
+        print(f'Ran {total} jobs')
+        return 0
+
+    pool = jobs.WorkerPool(size=args.workers)
+    pool.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop(timeout=30)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())